@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Benchmark of the bytes-level FASTA reader against Biopython on a large Prodigal protein FASTA file
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/fasta.py --n-proteins 10000000
+
+Writes a synthetic Prodigal protein FASTA file of `--n-proteins` proteins and times filtering it to the genes
+starting within their contig (:func:`viral_verify.io.filter_predicted_genes`) and reading every record ID and
+sequence with :mod:`viral_verify.fasta` and with the Biopython ``SeqIO`` implementation they replaced. Protein
+sequences are drawn from a pool of random sequences so that writing the input file is fast. 10 million proteins take
+about 2.5 GB of disk space.
+"""
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Any, Dict, Tuple, Union
+
+import click
+from Bio import SeqIO
+
+from viral_verify.contig import Contig
+from viral_verify.fasta import read_fasta, sequence, split_header
+from viral_verify.io import filter_predicted_genes
+from viral_verify.prodigal import prodigal_gene_start
+
+from benchmarks.synthetic import AMINO_ACIDS, PROTEINS_PER_CONTIG, random_seq
+
+#: Number of distinct random protein sequences written to the benchmark file
+SEQUENCE_POOL_SIZE = 1000
+
+
+def write_prodigal_proteins(path: Path, n_proteins: int, seed: int = 42) -> Dict[str, Contig]:
+    """Write Prodigal-style protein FASTA entries returning placeholder contigs of the proteins
+
+    About 5% of the proteins start past the end of their contig.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(SEQUENCE_POOL_SIZE):
+        protein = 'M' + random_seq(rng, rng.randint(60, 400) - 1, AMINO_ACIDS) + '*'
+        pool.append(''.join(protein[j:j + 60] + '\n' for j in range(0, len(protein), 60)))
+    contig_len = 10000
+    contigs: Dict[str, Contig] = {}
+    with open(path, 'w') as fout:
+        for i in range(n_proteins):
+            contig = f'k141_{i // PROTEINS_PER_CONTIG}'
+            if contig not in contigs:
+                contigs[contig] = Contig(name=contig, description=contig, seq_len=contig_len)
+            start = rng.randint(1, contig_len + 500)
+            fout.write(f'>{contig}_{i % PROTEINS_PER_CONTIG + 1} # {start} # {start + 299} # 1 # '
+                       f'ID={i // PROTEINS_PER_CONTIG + 1}_{i % PROTEINS_PER_CONTIG + 1};partial=00;'
+                       f'start_type=ATG;rbs_motif=AGGAGG;rbs_spacer=5-10bp;gc_cont=0.512\n')
+            fout.write(pool[i % SEQUENCE_POOL_SIZE])
+    return contigs
+
+
+def biopython_filter_predicted_genes(input_fasta: Union[str, Path],
+                                     output_fasta: Union[str, Path],
+                                     contig_len_circ: Dict[str, Contig]) -> Tuple[int, int]:
+    """Previous ``SeqIO`` implementation of :func:`viral_verify.io.filter_predicted_genes`"""
+    filtered_recs = []
+    n_total = 0
+    for rec in SeqIO.parse(str(input_fasta), 'fasta'):
+        n_total += 1
+        contig_name = re.sub(r'_\d+$', '', rec.id)
+        gene_start = prodigal_gene_start(rec.description)
+        if gene_start < contig_len_circ[contig_name].seq_len:
+            filtered_recs.append(rec)
+    SeqIO.write(filtered_recs, str(output_fasta), 'fasta')
+    return len(filtered_recs), n_total
+
+
+def read_all_biopython(path: Path) -> int:
+    return sum(len(rec.id) + len(str(rec.seq)) for rec in SeqIO.parse(str(path), 'fasta'))
+
+
+def read_all_bytes(path: Path) -> int:
+    return sum(len(split_header(header)[0]) + len(sequence(seq_lines)) for header, seq_lines in read_fasta(path))
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    value = fn()
+    return time.perf_counter() - start, value
+
+
+@click.command()
+@click.option('-n', '--n-proteins', type=int, default=1000000, help='Number of proteins (default=1000000)')
+@click.option('--seed', type=int, default=42, help='Random seed (default=42)')
+@click.option('--skip-biopython', is_flag=True, help='Only time the bytes-level reader')
+@click.option('--workdir', type=click.Path(file_okay=False), default=None,
+              help='Directory for the benchmark files (default: temporary directory)')
+def main(n_proteins, seed, skip_biopython, workdir):
+    with tempfile.TemporaryDirectory(prefix='viral_verify-fasta-benchmark-') as tmpdir:
+        root = Path(workdir or tmpdir)
+        root.mkdir(parents=True, exist_ok=True)
+        proteins = root / 'proteins.faa'
+        click.echo(f'Writing {n_proteins} proteins to "{proteins}"', err=True)
+        contigs = write_prodigal_proteins(proteins, n_proteins, seed)
+        click.echo(f'{proteins.stat().st_size / 1e6:.1f} MB', err=True)
+        benchmarks = [('filter_predicted_genes', 'viral_verify.fasta',
+                       lambda: filter_predicted_genes(proteins, root / 'filtered.faa', contigs)),
+                      ('read_all_records', 'viral_verify.fasta', lambda: read_all_bytes(proteins))]
+        if not skip_biopython:
+            benchmarks += [('filter_predicted_genes', 'Bio.SeqIO',
+                            lambda: biopython_filter_predicted_genes(proteins, root / 'filtered-seqio.faa', contigs)),
+                           ('read_all_records', 'Bio.SeqIO', lambda: read_all_biopython(proteins))]
+        seconds: Dict[Tuple[str, str], float] = {}
+        values: Dict[Tuple[str, str], Any] = {}
+        for name, implementation, fn in benchmarks:
+            seconds[name, implementation], values[name, implementation] = timed(fn)
+            click.echo(f'{name:<24} {implementation:<20} {seconds[name, implementation]:>10.2f}s '
+                       f'{n_proteins / seconds[name, implementation]:>12.0f} proteins/s')
+        if not skip_biopython:
+            for name in ['filter_predicted_genes', 'read_all_records']:
+                assert values[name, 'viral_verify.fasta'] == values[name, 'Bio.SeqIO']
+                speedup = seconds[name, 'Bio.SeqIO'] / seconds[name, 'viral_verify.fasta']
+                click.echo(f'{name:<24} speedup {speedup:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
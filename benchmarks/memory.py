@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Memory usage of viral_verify record types per contig and per domain hit
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/memory.py [N]
+
+Reports the bytes allocated per object (measured with ``tracemalloc`` over N objects) for the record types held in
+memory for every contig and domain hit, alongside the same attrs classes without ``__slots__`` for comparison.
+"""
+import random
+import sys
+import tracemalloc
+from typing import Callable, List
+
+import attr
+import numpy as np
+
+from viral_verify.contig import Contig
+from viral_verify.hmmsearch.columnar import DomTable
+from viral_verify.hmmsearch.result import HmmSearchResult
+from viral_verify.naive_bayes import NaiveBayesClassification
+from viral_verify.naive_bayes.io import NaiveBayesClassifierFreqs
+
+
+def dict_based(cls):
+    """Same attrs class as `cls` but with a per-instance ``__dict__`` and no converters or validators"""
+    return attr.make_class(f'{cls.__name__}WithDict',
+                           {a.name: attr.ib(default=a.default) for a in attr.fields(cls)},
+                           slots=False)
+
+
+def bytes_per_object(factory: Callable[[int], object], n: int) -> float:
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    objs: List[object] = [factory(i) for i in range(n)]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    # subtract the list of references
+    return (end - start) / n - 8
+
+
+def main(n: int = 100000):
+    rng = random.Random(42)
+    targets = [f'k141_{i // 4}_{i % 4 + 1}' for i in range(n)]
+    domains = [f'PF{i:05d}' for i in range(1000)]
+    scores = [round(rng.uniform(10, 500), 1) for _ in range(n)]
+    contig_names = [f'k141_{i}' for i in range(n)]
+
+    def hmm_result(cls):
+        return lambda i: cls(targets[i], domains[i % 1000], scores[i], i % 300 + 1, i % 300 + 90)
+
+    def classification(cls):
+        return lambda i: cls(contig_names[i], 'Virus', -scores[i], -scores[i] - 1.0, -scores[i] - 2.0,
+                             -scores[i] - 3.0, 3.0, 1.0, 3.0)
+
+    def freqs(cls):
+        return lambda i: cls(domains[i % 1000], scores[i] / 1e4, scores[i] / 2e4, scores[i] / 3e4, scores[i] / 4e4)
+
+    def contig(cls):
+        return lambda i: cls(contig_names[i], contig_names[i], 10000, i * 10000, 10143, 70, 71)
+
+    rows = [('Domain hit', 'HmmSearchResult', HmmSearchResult, hmm_result),
+            ('Contig', 'NaiveBayesClassification', NaiveBayesClassification, classification),
+            ('Contig', 'Contig', Contig, contig),
+            ('Domain', 'NaiveBayesClassifierFreqs', NaiveBayesClassifierFreqs, freqs)]
+    print(f'{"per":<12}{"type":<30}{"slots (B)":>12}{"__dict__ (B)":>14}')
+    for per, name, cls, factory in rows:
+        slotted = bytes_per_object(factory(cls), n)
+        with_dict = bytes_per_object(factory(dict_based(cls)), n)
+        print(f'{per:<12}{name:<30}{slotted:>12.0f}{with_dict:>14.0f}')
+
+    table = DomTable(target_names=sorted(set(targets)),
+                     query_names=domains,
+                     target_id=np.arange(n, dtype=np.int32),
+                     query_id=np.arange(n, dtype=np.int32) % 1000,
+                     domain_score=np.array(scores, dtype=np.float32),
+                     ali_coord_from=np.zeros(n, dtype=np.int32),
+                     ali_coord_to=np.zeros(n, dtype=np.int32))
+    row_bytes = sum(x.itemsize for x in (table.target_id, table.query_id, table.domain_score,
+                                         table.ali_coord_from, table.ali_coord_to))
+    print(f'{"Domain hit":<12}{"DomTable row":<30}{row_bytes:>12}{"-":>14}')
+
+
+if __name__ == '__main__':
+    main(*(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""Benchmark suite of the viral_verify pipeline functions on seeded synthetic datasets
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/run.py --sizes 1000 10000 100000 -o results.json
+    $ PYTHONPATH=. python benchmarks/run.py --compare benchmarks/baseline.json --max-slowdown 1.5
+
+Each size is the number of hmmsearch domtblout rows of a synthetic dataset (see :mod:`benchmarks.synthetic`) from
+10³ up to 10⁷ rows. For each size, the best time of ``--repeat`` runs of each benchmarked function is recorded with
+its number of input items and throughput. With ``--end-to-end``, ``viral_verify`` is also run on the synthetic
+contigs with the stand-in ``prodigal`` and ``hmmsearch`` executables (see :mod:`benchmarks.standins`).
+
+Results are written as JSON and can be compared against baseline results from an earlier run, e.g. the committed
+``benchmarks/baseline.json``. Timings are only comparable on the same machine.
+"""
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional, Tuple, List
+
+import click
+
+import viral_verify
+from viral_verify.hmmsearch.io import parse_domtblout, top_domains_per_predicted_gene, top_domains_per_contig
+from viral_verify.io import parse_contigs, filter_predicted_genes, output_results_table, output_classified_contigs
+from viral_verify.naive_bayes import naive_bayes_classification, CLASSIFIER_TABLE
+from viral_verify.naive_bayes.io import parse_naive_bayes_classifier_table
+
+from benchmarks.standins import install_standins, standin_env
+from benchmarks.synthetic import SyntheticDataset, write_hmm_db
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """Best wall time in seconds of `repeat` calls of `fn` and the value returned by the last call"""
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def run_size(dataset: SyntheticDataset,
+             workdir: Path,
+             hmm_db: Path,
+             domains: List[str],
+             repeat: int,
+             end_to_end: bool) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+
+    def bench(name: str, fn: Callable[[], Any], n_items: int) -> Any:
+        seconds, value = best_of(fn, repeat)
+        results[name] = dict(seconds=seconds, items=n_items, items_per_second=n_items / seconds if seconds else 0.0)
+        click.echo(f'{dataset.size:>10} {name:<32} {seconds:>10.4f}s {results[name]["items_per_second"]:>14.0f}/s',
+                   err=True)
+        return value
+
+    contigs = bench('parse_contigs', lambda: parse_contigs(dataset.contigs_fasta), dataset.n_contigs)
+    bench('filter_predicted_genes',
+          lambda: filter_predicted_genes(dataset.proteins_fasta, workdir / 'filtered.fa', contigs),
+          dataset.n_proteins)
+    hmm_results = bench('parse_domtblout', lambda: parse_domtblout(dataset.domtblout), dataset.size)
+    top_domains = bench('top_domains_per_predicted_gene', lambda: top_domains_per_predicted_gene(hmm_results),
+                        len(hmm_results))
+    contig_domains = bench('top_domains_per_contig', lambda: top_domains_per_contig(top_domains), len(top_domains))
+    classifications = bench('naive_bayes_classification',
+                            lambda: naive_bayes_classification(contig_domains, CLASSIFIER_TABLE),
+                            len(contig_domains))
+    names_to_desc = {x: f'{x} domain' for x in domains}
+    bench('output_results_table',
+          lambda: output_results_table(workdir / 'results.csv', contigs, contig_domains, classifications,
+                                       names_to_desc),
+          len(contigs))
+    bench('output_classified_contigs',
+          lambda: output_classified_contigs(classifications, contigs, workdir, True, 'bench'),
+          len(contigs))
+    if end_to_end:
+        env = standin_env(install_standins(workdir / 'bin'), n_profiles=len(domains))
+        outdirs = iter(range(repeat))
+        bench('viral_verify_end_to_end',
+              lambda: subprocess.run([sys.executable, '-m', 'viral_verify.cli',
+                                      '-i', str(dataset.contigs_fasta),
+                                      '-o', str(workdir / f'viral_verify-{next(outdirs)}'),
+                                      '-H', str(hmm_db), '-t', '1', '-v'],
+                                     env=env, check=True),
+              dataset.n_contigs)
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: Optional[float]) -> bool:
+    """Print the time of each benchmark relative to the baseline returning whether none are slower than allowed"""
+    ok = True
+    click.echo(f'{"size":>10} {"benchmark":<32} {"baseline":>10} {"current":>10} {"ratio":>7}')
+    for size, benchmarks in results['results'].items():
+        for name, result in benchmarks.items():
+            base = baseline['results'].get(size, {}).get(name)
+            if base is None:
+                continue
+            ratio = result['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+            slower = max_slowdown is not None and ratio > max_slowdown
+            ok = ok and not slower
+            click.echo(f'{size:>10} {name:<32} {base["seconds"]:>10.4f} {result["seconds"]:>10.4f} '
+                       f'{ratio:>6.2f}x{" SLOWER" if slower else ""}')
+    return ok
+
+
+@click.command()
+@click.option('-s', '--sizes', type=int, multiple=True, default=DEFAULT_SIZES,
+              help='Numbers of synthetic domtblout rows (default: 1000, 10000 and 100000)')
+@click.option('-r', '--repeat', type=int, default=3, help='Runs per benchmark; the best time is kept (default=3)')
+@click.option('--seed', type=int, default=42, help='Synthetic data random seed (default=42)')
+@click.option('--end-to-end', is_flag=True, help='Also run viral_verify with stand-in Prodigal and hmmsearch')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help='Write results JSON here')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Compare against baseline results JSON')
+@click.option('--max-slowdown', type=float, default=None,
+              help='With --compare, exit with an error if any benchmark is this many times slower than baseline')
+@click.option('--workdir', type=click.Path(file_okay=False), default=None,
+              help='Directory for synthetic data and outputs (default: temporary directory)')
+def main(sizes, repeat, seed, end_to_end, output, baseline_path, max_slowdown, workdir):
+    domains = list(parse_naive_bayes_classifier_table(CLASSIFIER_TABLE))
+    with tempfile.TemporaryDirectory(prefix='viral_verify-benchmarks-') as tmpdir:
+        root = Path(workdir or tmpdir)
+        root.mkdir(parents=True, exist_ok=True)
+        hmm_db = root / 'synthetic.hmm'
+        write_hmm_db(hmm_db, domains)
+        results: Dict[str, Any] = dict(viral_verify=viral_verify.__version__,
+                                       python=platform.python_version(),
+                                       platform=platform.platform(),
+                                       seed=seed,
+                                       repeat=repeat,
+                                       results={})
+        for size in sizes:
+            click.echo(f'Generating synthetic dataset of {size} domtblout rows', err=True)
+            dataset = SyntheticDataset.generate(root / str(size), size, domains, seed=seed)
+            results['results'][str(size)] = run_size(dataset, root / str(size), hmm_db, domains, repeat, end_to_end)
+    if output:
+        with open(output, 'w') as fout:
+            json.dump(results, fout, indent=2)
+    if baseline_path:
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+        if not compare(results, baseline, max_slowdown):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Lightweight stand-in ``prodigal`` and ``hmmsearch`` executables for benchmarking and testing viral_verify end to end
+
+The same stand-ins are installed by the tests with the ``fake_tool`` fixture so that the tests and the benchmarks
+run against the same output formats. They accept the same command line options viral_verify uses and write output in
+the same formats as the real tools: Prodigal protein FASTA headers with gene coordinates and ``ID``/``partial``
+fields, and hmmsearch domtblout tables with the real header and trailer comment lines, ordered by HMM profile and then
+by decreasing score, with E-values computed from the bit scores and ``-Z`` and ``--domZ``. Gene predictions and domain
+hits are derived from a hash of each sequence so that identical sequences give identical output and the hits of an
+HMM profile do not depend on the other profiles searched, as with HMM DB sharding.
+
+Their speed is controlled with environment variables so that the time spent in the external tools can be set to a
+realistic fraction of a run:
+
+``STANDIN_PRODIGAL_SECONDS_PER_MB``
+    Seconds of sleep per megabase of input contig sequence (default 0)
+``STANDIN_HMMSEARCH_SECONDS_PER_1K_PROTEINS``
+    Seconds of sleep per thousand protein sequences (default 0)
+
+The number of hits is controlled with ``STANDIN_HMMSEARCH_BUCKETS``, the number of buckets protein sequences are put
+in; each HMM profile matches the proteins of one bucket (default 16).
+"""
+import os
+import stat
+from pathlib import Path
+from typing import Union, Dict, Optional
+
+PRODIGAL = '''#!/usr/bin/env python
+"""Stand-in for Prodigal in metagenomic mode predicting a gene every ~1 kb"""
+import hashlib
+import os
+import sys
+import time
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+args = sys.argv[1:]
+opts = {flag: args[i + 1] for i, flag in enumerate(args[:-1]) if flag in ('-i', '-a', '-o', '-p')}
+
+
+def entries(fh):
+    header = None
+    lines = []
+    for line in fh:
+        if line.startswith('>'):
+            if header is not None:
+                yield header, ''.join(lines)
+            header = line[1:].strip()
+            lines = []
+        else:
+            lines.append(line.strip())
+    if header is not None:
+        yield header, ''.join(lines)
+
+
+fh = open(opts['-i']) if '-i' in opts else sys.stdin
+n_bases = 0
+with open(opts['-a'], 'w') as faa, open(opts.get('-o', os.devnull), 'w') as genes:
+    for seqnum, (header, seq) in enumerate(entries(fh), 1):
+        name = header.split()[0]
+        n_bases += len(seq)
+        genes.write(f'DEFINITION  seqnum={seqnum};seqlen={len(seq)};seqhdr="{header}"\\n')
+        for gene, start in enumerate(range(1, len(seq) - 299, 1000), 1):
+            end = min(len(seq), start + 899)
+            digest = hashlib.blake2b(seq[start - 1:end].encode(), digest_size=32).digest()
+            protein = 'M' + ''.join(AMINO_ACIDS[b % 20] for b in digest * ((end - start) // 96 + 1))
+            protein = protein[:(end - start + 1) // 3 - 1] + '*'
+            genes.write(f'     CDS             {start}..{end}\\n'
+                        f'                     /note="ID={seqnum}_{gene};partial=00;start_type=ATG"\\n')
+            faa.write(f'>{name}_{gene} # {start} # {end} # 1 # ID={seqnum}_{gene};partial=00;start_type=ATG;'
+                      f'rbs_motif=AGGAGG;rbs_spacer=5-10bp;gc_cont=0.500\\n')
+            for i in range(0, len(protein), 60):
+                faa.write(protein[i:i + 60] + '\\n')
+        genes.write('//\\n')
+time.sleep(float(os.environ.get('STANDIN_PRODIGAL_SECONDS_PER_MB', 0)) * n_bases / 1e6)
+'''
+
+HMMSEARCH = '''#!/usr/bin/env python
+"""Stand-in for hmmsearch reporting 1-3 domain hits for each HMM profile and matching protein sequence
+
+Protein sequences are put in buckets by their digest and each HMM profile matches the sequences of one bucket, so the
+hits of a profile and sequence do not depend on the other profiles or sequences searched.
+"""
+import hashlib
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+if args and args[0] == '-h':
+    print('# hmmsearch :: search profile(s) against a sequence database\\n# HMMER 3.3 (Nov 2019); http://hmmer.org/')
+    sys.exit(0)
+opts = {flag: args[i + 1] for i, flag in enumerate(args[:-1])
+        if flag in ('-o', '--domtblout', '-Z', '--domZ', '--cpu')}
+hmm_db, seqfile = args[-2:]
+n_buckets = int(os.environ.get('STANDIN_HMMSEARCH_BUCKETS', 16))
+
+
+def digest_int(text, digest_size=8):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=digest_size).digest(), 'little')
+
+
+queries = []
+for line in open(hmm_db):
+    if line.startswith('NAME'):
+        queries.append([line.split()[1], '-', 150])
+    elif line.startswith('ACC'):
+        queries[-1][1] = line.split()[1]
+    elif line.startswith('LENG'):
+        queries[-1][2] = int(line.split()[1])
+names = []
+descs = []
+seqs = []
+for line in open(seqfile):
+    if line.startswith('>'):
+        words = line[1:].rstrip().split(None, 1)
+        names.append(words[0])
+        descs.append(words[1] if len(words) > 1 else '-')
+        seqs.append([])
+    else:
+        seqs[-1].append(line.strip())
+seqs = [''.join(seq).rstrip('*') for seq in seqs]
+buckets = {}
+for i, seq in enumerate(seqs):
+    buckets.setdefault(digest_int(seq) % n_buckets, []).append(i)
+z = float(opts.get('-Z', len(names)))
+with open(opts.get('-o', os.devnull), 'w') as raw, open(opts['--domtblout'], 'w') as tbl:
+    raw.write(f'# hmmsearch :: search profile(s) against a sequence database\\n'
+              f'# target sequence database: {seqfile}\\n')
+    tbl.write('#                                                                            --- full sequence --- '
+              '-------------- this domain -------------   hmm coord   ali coord   env coord\\n'
+              '# target name        accession   tlen query name           accession   qlen   E-value  score  bias   '
+              '#  of  c-Evalue  i-Evalue  score  bias  from    to  from    to  from    to  acc description of target\\n'
+              '#------------------- ---------- ----- -------------------- ---------- ----- --------- ------ ----- '
+              '--- --- --------- --------- ------ ----- ----- ----- ----- ----- ----- ----- ---- '
+              '---------------------\\n')
+    for query, accession, qlen in queries:
+        hits = []
+        for i in buckets.get(digest_int(query) % n_buckets, []):
+            digest = hashlib.blake2b((query + seqs[i]).encode(), digest_size=16).digest()
+            hits.append((digest[0] % 200 + 20.5, i, digest))
+        hits.sort(key=lambda x: (-x[0], x[1]))
+        dom_z = float(opts.get('--domZ', len(hits)))
+        raw.write(f'Query:       {query}  [M={qlen}]\\n')
+        for score, i, digest in hits:
+            raw.write(f'  {z * 2 ** -score:9.2g} {score:6.1f} {names[i]}\\n')
+            tlen = len(seqs[i])
+            n_domains = digest[1] % 3 + 1
+            for d in range(n_domains):
+                dom_score = score - 10 * d
+                ali_from = digest[2 + d] % max(1, tlen - 40) + 1
+                ali_to = min(tlen, ali_from + 30 + digest[5 + d] % 100)
+                tbl.write(f'{names[i]} - {tlen} {query} {accession} {qlen} {z * 2 ** -score:.2g} {score:.1f} 0.1 '
+                          f'{d + 1} {n_domains} {dom_z * 2 ** -dom_score:.2g} {dom_z * 2 ** -dom_score:.2g} '
+                          f'{dom_score:.1f} 0.1 1 {min(qlen, ali_to - ali_from + 1)} {ali_from} {ali_to} '
+                          f'{ali_from} {ali_to} 0.95 {descs[i]}\\n')
+    tbl.write(f'#\\n# Program:         hmmsearch\\n# Version:         3.3 (Nov 2019)\\n'
+              f'# Pipeline mode:   SEARCH\\n# Query file:      {hmm_db}\\n# Target file:     {seqfile}\\n'
+              f'# Option settings: hmmsearch {" ".join(args)}\\n# [ok]\\n')
+time.sleep(float(os.environ.get('STANDIN_HMMSEARCH_SECONDS_PER_1K_PROTEINS', 0)) * len(names) / 1000)
+'''
+
+STANDINS: Dict[str, str] = dict(prodigal=PRODIGAL, hmmsearch=HMMSEARCH)
+
+
+def install_standins(bindir: Union[str, Path]) -> Path:
+    """Write the stand-in executables to `bindir` returning it; prepend it to ``$PATH`` to use them"""
+    bindir = Path(bindir)
+    bindir.mkdir(parents=True, exist_ok=True)
+    for name, source in STANDINS.items():
+        path = bindir / name
+        path.write_text(source)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+    return bindir
+
+
+def standin_env(bindir: Union[str, Path], n_profiles: Optional[int] = None) -> Dict[str, str]:
+    """Environment with the stand-in executables in `bindir` first on the ``$PATH``
+
+    If the number of HMM profiles in the HMM DB `n_profiles` is given, each protein matches about 2 HMM profiles.
+    """
+    env = dict(os.environ)
+    env['PATH'] = f'{bindir}{os.pathsep}{env.get("PATH", "")}'
+    if n_profiles is not None:
+        env['STANDIN_HMMSEARCH_BUCKETS'] = str(max(1, n_profiles // 2))
+    return env
@@ -0,0 +1,171 @@
+"""Seeded synthetic metagenome assembly, Prodigal protein and hmmsearch domtblout generator
+
+All generators take a :class:`random.Random` so that the same seed always gives the same files. The size of a
+synthetic dataset is the number of domtblout rows; the number of contigs and predicted proteins scale with it (see
+:class:`SyntheticDataset`).
+"""
+import random
+from pathlib import Path
+from typing import Dict, List, Union, Sequence
+
+import attr
+
+NUCLEOTIDES = 'ACGT'
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+#: Average number of domtblout rows per predicted protein
+ROWS_PER_PROTEIN = 4
+#: Average number of predicted proteins per contig
+PROTEINS_PER_CONTIG = 5
+#: Length of the contig ends duplicated at the end of synthetic circular contigs
+CIRCULAR_OVERLAP = 120
+
+
+def random_seq(rng: random.Random, length: int, alphabet: str = NUCLEOTIDES) -> str:
+    return ''.join(rng.choices(alphabet, k=length))
+
+
+def write_contigs(path: Union[str, Path],
+                  n_contigs: int,
+                  rng: random.Random,
+                  min_length: int = 500,
+                  max_length: int = 3000,
+                  circular_fraction: float = 0.05,
+                  wrap: int = 80) -> Dict[str, int]:
+    """Write random contigs with MEGAHIT-style headers returning the length of each contig
+
+    A `circular_fraction` of the contigs end with a copy of their first :data:`CIRCULAR_OVERLAP` bases.
+    """
+    lengths: Dict[str, int] = {}
+    with open(path, 'w') as fout:
+        for i in range(n_contigs):
+            name = f'k141_{i}'
+            seq = random_seq(rng, rng.randint(min_length, max_length))
+            if rng.random() < circular_fraction:
+                seq += seq[:CIRCULAR_OVERLAP]
+            lengths[name] = len(seq)
+            fout.write(f'>{name} flag=1 multi=5.0000 len={len(seq)}\n')
+            for j in range(0, len(seq), wrap):
+                fout.write(seq[j:j + wrap])
+                fout.write('\n')
+    return lengths
+
+
+def write_proteins(path: Union[str, Path],
+                   contig_lengths: Dict[str, int],
+                   n_proteins: int,
+                   rng: random.Random,
+                   past_end_fraction: float = 0.05) -> List[str]:
+    """Write Prodigal-style predicted protein FASTA entries returning the protein IDs
+
+    Proteins are spread randomly over the contigs. A `past_end_fraction` of the proteins start after the end of their
+    contig, as if predicted on the circularized contig sequence, so that they are filtered out.
+    """
+    names = list(contig_lengths)
+    per_contig: Dict[str, int] = {}
+    for _ in range(n_proteins):
+        name = rng.choice(names)
+        per_contig[name] = per_contig.get(name, 0) + 1
+    gene_ids: List[str] = []
+    with open(path, 'w') as fout:
+        for seqnum, name in enumerate(names, 1):
+            seq_len = contig_lengths[name]
+            for gene in range(1, per_contig.get(name, 0) + 1):
+                start = seq_len + rng.randint(1, 100) if rng.random() < past_end_fraction else \
+                    rng.randint(1, max(1, seq_len - 300))
+                aa_len = rng.randint(60, 400)
+                end = start + aa_len * 3 - 1
+                strand = rng.choice((1, -1))
+                gc = rng.uniform(0.3, 0.7)
+                gene_id = f'{name}_{gene}'
+                gene_ids.append(gene_id)
+                fout.write(f'>{gene_id} # {start} # {end} # {strand} # ID={seqnum}_{gene};partial=00;'
+                           f'start_type=ATG;rbs_motif=AGGAGG;rbs_spacer=5-10bp;gc_cont={gc:.3f}\n')
+                protein = 'M' + random_seq(rng, aa_len - 1, AMINO_ACIDS)
+                for j in range(0, len(protein), 60):
+                    fout.write(protein[j:j + 60])
+                    fout.write('\n')
+    return gene_ids
+
+
+def domtblout_row(target: str, query: str, rng: random.Random, domain: int = 1, n_domains: int = 1) -> str:
+    """Random hmmsearch domtblout row of a domain hit of `query` in `target`"""
+    tlen = rng.randint(60, 400)
+    qlen = rng.randint(50, 300)
+    score = round(rng.uniform(10, 500), 1)
+    evalue = 10 ** -rng.uniform(3, 100)
+    ali_from = rng.randint(1, max(1, tlen - 40))
+    ali_to = min(tlen, ali_from + rng.randint(30, 200))
+    hmm_to = min(qlen, ali_to - ali_from + 1)
+    return (f'{target:<20} - {tlen:>5} {query:<20} PF00000.1 {qlen:>5} {evalue:9.2g} {score:6.1f} {0.1:5.1f} '
+            f'{domain:>3} {n_domains:>3} {evalue:9.2g} {evalue:9.2g} {score:6.1f} {0.1:5.1f} {1:>5} {hmm_to:>5} '
+            f'{ali_from:>5} {ali_to:>5} {max(1, ali_from - 2):>5} {min(tlen, ali_to + 2):>5} 0.95 '
+            f'# 1 # 300 # 1 # ID=1_1;partial=00\n')
+
+
+def write_domtblout(path: Union[str, Path],
+                    gene_ids: Sequence[str],
+                    domains: Sequence[str],
+                    n_rows: int,
+                    rng: random.Random) -> None:
+    """Write an hmmsearch domtblout table of `n_rows` random domain hits of `domains` in the proteins `gene_ids`"""
+    with open(path, 'w') as fout:
+        fout.write('#                                                               --- full sequence --- '
+                   '-------------- this domain -------------   hmm coord   ali coord   env coord\n'
+                   '# target name        accession   tlen query name           accession   qlen   E-value  '
+                   'score  bias   #  of  c-Evalue  i-Evalue  score  bias  from    to  from    to  from    to  acc '
+                   'description of target\n')
+        n = 0
+        while n < n_rows:
+            target = rng.choice(gene_ids)
+            n_domains = min(n_rows - n, rng.randint(1, 2 * ROWS_PER_PROTEIN - 1))
+            for domain in range(1, n_domains + 1):
+                fout.write(domtblout_row(target, rng.choice(domains), rng, domain, n_domains))
+            n += n_domains
+        fout.write('#\n# Program:         hmmsearch\n# [ok]\n')
+
+
+def write_hmm_db(path: Union[str, Path], domains: Sequence[str]) -> None:
+    """Write an HMMer3 HMM file with only the header lines of an HMM profile for each domain
+
+    The file can be scanned for HMM names and descriptions and searched with the stand-in ``hmmsearch`` but not with
+    HMMer3.
+    """
+    with open(path, 'w') as fout:
+        for i, domain in enumerate(domains):
+            fout.write(f'HMMER3/f [3.3 | Nov 2019]\nNAME  {domain}\nACC   PF{i:05d}.1\nDESC  {domain} domain\n'
+                       f'LENG  150\nALPH  amino\nNC    20.00 20.00;\nHMM          A        C        D\n//\n')
+
+
+@attr.s
+class SyntheticDataset:
+    """Paths of a synthetic dataset with `size` domtblout rows"""
+    size: int = attr.ib()
+    contigs_fasta: Path = attr.ib()
+    proteins_fasta: Path = attr.ib()
+    domtblout: Path = attr.ib()
+    n_contigs: int = attr.ib()
+    n_proteins: int = attr.ib()
+
+    @classmethod
+    def generate(cls, outdir: Union[str, Path], size: int, domains: Sequence[str], seed: int = 42) \
+            -> 'SyntheticDataset':
+        """Generate a dataset of `size` domtblout rows in `outdir`
+
+        There is one protein per :data:`ROWS_PER_PROTEIN` rows and one contig per :data:`PROTEINS_PER_CONTIG`
+        proteins.
+        """
+        outdir = Path(outdir)
+        outdir.mkdir(parents=True, exist_ok=True)
+        rng = random.Random(seed)
+        n_proteins = max(1, size // ROWS_PER_PROTEIN)
+        n_contigs = max(1, n_proteins // PROTEINS_PER_CONTIG)
+        dataset = cls(size=size,
+                      contigs_fasta=outdir / f'contigs-{size}.fasta',
+                      proteins_fasta=outdir / f'proteins-{size}.fa',
+                      domtblout=outdir / f'hmmsearch-{size}.domtblout',
+                      n_contigs=n_contigs,
+                      n_proteins=n_proteins)
+        lengths = write_contigs(dataset.contigs_fasta, n_contigs, rng)
+        gene_ids = write_proteins(dataset.proteins_fasta, lengths, n_proteins, rng)
+        write_domtblout(dataset.domtblout, gene_ids, domains, size, rng)
+        return dataset
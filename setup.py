@@ -13,6 +13,7 @@ with open('HISTORY.rst') as history_file:
 requirements = ['Click>=7.0',
                 'biopython>=1.76',
                 'pandas',
+                'numpy',
                 'attrs']
 
 setup_requirements = ['pytest-runner', ]
@@ -37,9 +38,13 @@ setup(
     entry_points={
         'console_scripts': [
             'viral_verify=viral_verify.cli:main',
+            'viral_verify_compile_classifier=viral_verify.cli:compile_classifier',
+            'viral_verify_batch=viral_verify.cli:batch',
+            'viral_verify_server=viral_verify.cli:serve',
         ],
     },
     install_requires=requirements,
+    extras_require={'parquet': ['pyarrow'], 'zstd': ['zstandard']},
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -0,0 +1,32 @@
+import gzip
+import os
+import shutil
+import stat
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def fake_tool(tmp_path: Path, monkeypatch):
+    """Install a Python script as an executable on the PATH in place of an external tool like Prodigal"""
+    bindir = tmp_path / 'bin'
+    bindir.mkdir()
+    monkeypatch.setenv('PATH', f'{bindir}{os.pathsep}{os.environ["PATH"]}')
+
+    def install(name: str, source: str) -> Path:
+        path = bindir / name
+        path.write_text(source)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        return path
+
+    return install
+
+
+@pytest.fixture
+def hmm_db(tmp_path: Path) -> Path:
+    """Test Pfam-A HMM DB extracted to a temporary directory"""
+    path = tmp_path / 'Pfam-A-filtered-for-tests.hmm'
+    with gzip.open('tests/data/Pfam-A-filtered-for-tests.hmm.gz', 'rb') as fh, open(path, 'wb') as fout:
+        shutil.copyfileobj(fh, fout)
+    return path
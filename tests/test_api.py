@@ -0,0 +1,47 @@
+"""Tests for the in-memory Python API"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from viral_verify import cli
+from viral_verify.api import classify
+from viral_verify.hmmsearch.dedup import iter_fasta_entries
+from viral_verify.naive_bayes import load_classifier_table, CLASSIFIER_TABLE
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+
+def test_classify_matches_cli(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that in-memory classification gives the same results as viral_verify using stand-in external tools"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    result = CliRunner().invoke(cli.main, ['-i', str(test_fasta), '-o', str(tmp_path / 'cli'), '--hmm-db',
+                                           str(hmm_db), '--prefix', 'test', '-t', '1'])
+    assert result.exit_code == 0, result.output
+    df_expected = pd.read_csv(tmp_path / 'cli' / 'test-results.csv').set_index('contig_name')
+
+    contigs = [(name, seq) for name, _, seq in iter_fasta_entries(test_fasta)]
+    observed = classify(iter(contigs), hmm_db=hmm_db, classifier_table=load_classifier_table(CLASSIFIER_TABLE))
+    assert observed.search_summary.n_proteins > 0
+    for name, _ in contigs:
+        expected = df_expected.loc[name]
+        if name not in observed.classifications:
+            assert expected.classification == 'Unclassified'
+            continue
+        classification = observed.classifications[name]
+        assert classification.contig_name == name
+        assert classification.classification == expected.classification
+        assert classification.log_viral_prob == pytest.approx(expected.log_viral_prob)
+        assert ';'.join(observed.contig_domains[name]) == \
+            ';'.join(x.split(' [')[0] for x in expected.protein_domains.split(';'))
+
+
+def test_classify_invalid_contig_ids(hmm_db: Path):
+    with pytest.raises(ValueError, match='Duplicate'):
+        classify([('a', 'ACGT'), ('a', 'ACGT')], hmm_db=hmm_db)
+    with pytest.raises(ValueError, match='whitespace'):
+        classify([('a b', 'ACGT')], hmm_db=hmm_db)
+    assert classify([], hmm_db=hmm_db).classifications == {}
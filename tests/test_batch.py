@@ -0,0 +1,79 @@
+"""Tests for multi-sample batch runs"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from pandas.testing import assert_frame_equal
+
+from viral_verify import cli
+from viral_verify.batch import read_sample_sheet, Sample, split_domtblout, split_by_sample
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+
+def _split_fasta(fasta: Path, outdir: Path, n: int):
+    entries = fasta.read_text().split('>')[1:]
+    paths = []
+    for i in range(n):
+        path = outdir / f'part{i}.fasta'
+        path.write_text(''.join('>' + x for x in entries[i::n]))
+        paths.append(path)
+    return paths
+
+
+def test_read_sample_sheet(tmp_path: Path):
+    (tmp_path / 'a.fasta').write_text('>a\nACGT\n')
+    (tmp_path / 'b.fasta').write_text('>b\nACGT\n')
+    sheet = tmp_path / 'samples.tsv'
+    sheet.write_text(f'sample\tfasta\nA\ta.fasta\nB\t{tmp_path / "b.fasta"}\n')
+    assert read_sample_sheet(sheet) == [Sample('A', tmp_path / 'a.fasta'), Sample('B', tmp_path / 'b.fasta')]
+    sheet = tmp_path / 'samples.csv'
+    sheet.write_text('fasta,sample\na.fasta,A\n')
+    assert read_sample_sheet(sheet) == [Sample('A', tmp_path / 'a.fasta')]
+
+    for text in ['', 'name,fasta\nA,a.fasta\n', 'sample,fasta\nA,missing.fasta\n',
+                 'sample,fasta\nA,a.fasta\nA,b.fasta\n', 'sample,fasta\nA|1,a.fasta\n']:
+        sheet.write_text(text)
+        with pytest.raises(ValueError):
+            read_sample_sheet(sheet)
+
+
+def test_split_by_sample(tmp_path: Path):
+    samples = [Sample('A', tmp_path), Sample('B', tmp_path), Sample('C', tmp_path)]
+    observed = split_by_sample({'A|k1': 1, 'B|k1': 2, 'A|k2': 3}, samples)
+    assert observed == {'A': {'k1': 1, 'k2': 3}, 'B': {'k1': 2}, 'C': {}}
+    tblout = tmp_path / 'batch.domtblout'
+    tblout.write_text('# header\nA|k1_1 - PF1 rest\nB|k1_1 - PF2 rest\n')
+    split_domtblout(tblout, {'A': tmp_path / 'A.domtblout', 'B': tmp_path / 'B.domtblout'})
+    assert (tmp_path / 'A.domtblout').read_text() == '# header\nk1_1 - PF1 rest\n'
+    assert (tmp_path / 'B.domtblout').read_text() == '# header\nk1_1 - PF2 rest\n'
+
+
+def test_batch_matches_single_sample_runs(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that batch results per sample are the same as separate runs using stand-in external tools"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    fastas = [test_fasta, *_split_fasta(test_fasta, tmp_path, 2)]
+    sheet = tmp_path / 'samples.tsv'
+    sheet.write_text('sample\tfasta\n' + ''.join(f'S{i}\t{x}\n' for i, x in enumerate(fastas)))
+    runner = CliRunner()
+    result = runner.invoke(cli.batch, [str(sheet), '-o', str(tmp_path / 'batch'), '--hmm-db', str(hmm_db),
+                                       '-t', '1', '-p'])
+    assert result.exit_code == 0, result.output
+
+    for i, fasta in enumerate(fastas):
+        sample = f'S{i}'
+        outdir = tmp_path / sample
+        result = runner.invoke(cli.main, ['-i', str(fasta), '-o', str(outdir), '--hmm-db', str(hmm_db),
+                                          '--prefix', sample, '-t', '1', '-p'])
+        assert result.exit_code == 0, result.output
+        sample_dir = tmp_path / 'batch' / sample
+        assert_frame_equal(pd.read_csv(sample_dir / f'{sample}-results.csv'),
+                           pd.read_csv(outdir / f'{sample}-results.csv'))
+        assert sorted(x.name for x in (sample_dir / 'classified-fasta-output').iterdir()) == \
+            sorted(x.name for x in (outdir / 'classified-fasta-output').iterdir())
+        for path in (outdir / 'classified-fasta-output').iterdir():
+            assert (sample_dir / 'classified-fasta-output' / path.name).read_text() == path.read_text()
+        assert (sample_dir / f'{sample}-hmmsearch.domtblout').exists()
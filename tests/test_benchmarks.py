@@ -0,0 +1,51 @@
+"""Tests for the benchmark suite synthetic data generator and stand-in tools"""
+import subprocess
+from pathlib import Path
+
+from benchmarks.standins import install_standins, standin_env
+from benchmarks.synthetic import SyntheticDataset, write_hmm_db
+from viral_verify.hmm_index import scan_hmm_names_to_desc
+from viral_verify.hmmsearch.io import parse_domtblout
+from viral_verify.io import parse_contigs, filter_predicted_genes
+
+
+def test_synthetic_dataset(tmp_path: Path):
+    domains = ['PF_A', 'PF_B', 'PF_C']
+    dataset = SyntheticDataset.generate(tmp_path / 'a', 200, domains, seed=1)
+    assert dataset.n_proteins == 50
+    contigs = parse_contigs(dataset.contigs_fasta)
+    assert len(contigs) == dataset.n_contigs == 10
+    n_kept, n_total = filter_predicted_genes(dataset.proteins_fasta, tmp_path / 'filtered.fa', contigs)
+    assert n_total == dataset.n_proteins
+    assert 0 < n_kept <= n_total
+    results = parse_domtblout(dataset.domtblout)
+    assert len(results) == 200
+    assert {x.query_name for x in results} <= set(domains)
+    # same seed, same data
+    other = SyntheticDataset.generate(tmp_path / 'b', 200, domains, seed=1)
+    assert other.domtblout.read_text() == dataset.domtblout.read_text()
+    assert other.contigs_fasta.read_text() == dataset.contigs_fasta.read_text()
+
+
+def test_standins(tmp_path: Path):
+    domains = ['PF_A', 'PF_B', 'PF_C']
+    dataset = SyntheticDataset.generate(tmp_path, 40, domains)
+    hmm_db = tmp_path / 'synthetic.hmm'
+    write_hmm_db(hmm_db, domains)
+    assert scan_hmm_names_to_desc(hmm_db) == {x: f'{x} domain' for x in domains}
+    env = standin_env(install_standins(tmp_path / 'bin'))
+    subprocess.run(['prodigal', '-p', 'meta', '-c', '-q', '-i', str(dataset.contigs_fasta),
+                    '-a', str(tmp_path / 'proteins.fa'), '-o', str(tmp_path / 'genes.txt')], env=env, check=True)
+    subprocess.run(['hmmsearch', '--noali', '--cut_nc', '-o', str(tmp_path / 'raw.txt'),
+                    '--domtblout', str(tmp_path / 'out.domtblout'), '--cpu', '1', str(hmm_db),
+                    str(tmp_path / 'proteins.fa')], env=env, check=True)
+    results = parse_domtblout(tmp_path / 'out.domtblout')
+    assert results
+    assert {x.query_name for x in results} <= set(domains)
+    # hits of a profile do not depend on the other profiles in the HMM DB
+    query = results[-1].query_name
+    write_hmm_db(tmp_path / 'one.hmm', [query])
+    subprocess.run(['hmmsearch', '--noali', '--cut_nc', '-o', str(tmp_path / 'raw.txt'),
+                    '--domtblout', str(tmp_path / 'one.domtblout'), str(tmp_path / 'one.hmm'),
+                    str(tmp_path / 'proteins.fa')], env=env, check=True)
+    assert parse_domtblout(tmp_path / 'one.domtblout') == [x for x in results if x.query_name == query]
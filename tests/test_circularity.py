@@ -0,0 +1,74 @@
+"""Tests for circular contig detection"""
+import random
+from pathlib import Path
+
+import pytest
+
+from viral_verify.circularity import prefix_function, end_overlap
+from viral_verify.contig import Contig
+from viral_verify.io import parse_contigs, write_circular_contigs_fasta
+
+
+def find_matching_at_ends_quadratic(seq: str, kmax: int, kmin: int) -> (bool, int):
+    for k in range(kmax, kmin, -1):
+        if k < len(seq) and seq[:k] == seq[-k:]:
+            return True, k
+    return False, 0
+
+
+def random_seqs(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    for _ in range(n):
+        core = ''.join(rng.choice('AC') for _ in range(rng.randint(1, 400)))
+        yield core + core[:rng.randint(0, 250)]
+
+
+def test_prefix_function():
+    for seq in random_seqs(200):
+        assert prefix_function(seq) == [max(k for k in range(i + 1) if seq[:k] == seq[i + 1 - k:i + 1])
+                                        for i in range(len(seq))]
+
+
+@pytest.mark.parametrize('kmax,kmin', [(200, 50), (10, 2), (5, 0)])
+def test_find_matching_at_ends(kmax: int, kmin: int):
+    for seq in random_seqs(2000):
+        assert Contig.find_matching_at_ends(seq, kmax, kmin) == find_matching_at_ends_quadratic(seq, kmax, kmin)
+
+
+def test_end_overlap_prefilter():
+    assert end_overlap('AAAAT', 'TAAAA', kmin=3) == 4
+    assert end_overlap('ACGTA', 'TTACG', kmin=3) == 0
+    assert end_overlap('ACGTA', 'TTACG', kmin=2) == 3
+
+
+@pytest.fixture
+def contigs_fasta(tmp_path: Path) -> Path:
+    path = tmp_path / 'contigs.fasta'
+    rng = random.Random(1)
+    core = ''.join(rng.choice('ACGT') for _ in range(1000))
+    with open(path, 'w') as fout:
+        fout.write(f'>circular\n{core}{core[:100]}\n')
+        fout.write(f'>linear desc\n{core}\n')
+        fout.write(f'>short\n{core[:300]}{core[:60]}\n')
+    return path
+
+
+def test_length_policy(contigs_fasta: Path):
+    contigs = parse_contigs(contigs_fasta)
+    assert [(x.is_circular, x.n_matching_ends) for x in contigs.values()] == [(True, 100), (False, 0), (False, 0)]
+    contigs = parse_contigs(contigs_fasta, min_length=0, max_length=1000)
+    assert [(x.is_circular, x.n_matching_ends) for x in contigs.values()] == [(False, 0), (False, 0), (True, 60)]
+    contigs = parse_contigs(contigs_fasta, kmin=100)
+    assert not any(x.is_circular for x in contigs.values())
+
+
+def test_chunked_circular_seq_fasta(contigs_fasta: Path, tmp_path: Path):
+    contigs = parse_contigs(contigs_fasta, min_length=0)
+    for contig in contigs.values():
+        seq = contig.seq()
+        expected = seq + seq[contig.n_matching_ends:] if contig.is_circular else seq
+        assert contig.circular_seq() == expected
+        assert ''.join(contig.iter_circular_seq(chunk_size=7)) == expected
+    write_circular_contigs_fasta(contigs, tmp_path / 'circularized.fasta')
+    assert (tmp_path / 'circularized.fasta').read_text() == ''.join(x.circular_seq_fasta() for x in contigs.values())
+    assert (tmp_path / 'circularized.fasta').read_text().startswith('>circular circular\n')
@@ -0,0 +1,101 @@
+"""Tests for the streaming classified contigs FASTA writer"""
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from Bio import SeqIO
+
+from viral_verify.classified_fasta import ClassifiedFastaWriter, LengthStats, classification_suffix
+from viral_verify.contig import Contig
+from viral_verify.io import parse_contigs, output_classified_contigs
+from viral_verify.naive_bayes import NaiveBayesClassification
+from viral_verify.naive_bayes.constants import Classification
+
+from tests.test_faidx import IRREGULAR_FASTA
+
+TEST_FASTA = Path('tests/data/test.fasta')
+
+
+def test_raw_copy_matches_input(tmp_path: Path):
+    path = tmp_path / 'regular.fasta'
+    path.write_text('>a first\n' + 'ACGTACGTAC\n' * 3 + 'ACG\n>b\nACGTAC\n>c\n' + 'TTTTTTTTTT\n' * 2 + 'GG')
+    contigs = parse_contigs(path)
+    assert all(x.line_bases for x in contigs.values())
+    outdir = tmp_path / 'out'
+    outdir.mkdir()
+    with ClassifiedFastaWriter(outdir, 'test') as writer:
+        for contig in contigs.values():
+            writer.write(contig, 'viral')
+    assert writer.paths == [outdir / 'test-viral.fasta']
+    assert (outdir / 'test-viral.fasta').read_bytes() == path.read_bytes() + b'\n'
+
+
+def test_irregular_layout_and_in_memory_sequences(tmp_path: Path):
+    path = tmp_path / 'irregular.fasta'
+    path.write_bytes(IRREGULAR_FASTA.encode())
+    contigs = list(parse_contigs(path).values()) + [Contig.from_sequence('mem', 'ACGT' * 40, 'mem in memory')]
+    with ClassifiedFastaWriter(tmp_path, 'test') as writer:
+        for contig in contigs:
+            writer.write(contig, 'unclassified')
+    observed = [(x.description, str(x.seq)) for x in SeqIO.parse(str(writer.paths[0]), 'fasta')]
+    assert observed == [(x.description, x.seq()) for x in contigs]
+    assert all(len(line) <= 61 for line in writer.paths[0].read_text().splitlines(keepends=True))
+
+
+def test_length_stats_and_concurrent_class_files(tmp_path: Path):
+    contigs = {f'c{i}': Contig.from_sequence(f'c{i}', 'A' * (10 * i)) for i in range(1, 3001)}
+    with ClassifiedFastaWriter(tmp_path, 'test', length_stats=True) as writer:
+        for i, contig in enumerate(contigs.values(), 1):
+            writer.write(contig, 'chromosome' if i % 3 else 'viral')
+    assert writer.paths == [tmp_path / 'test-viral.fasta', tmp_path / 'test-chromosome.fasta']
+    viral = [x.id for x in SeqIO.parse(str(tmp_path / 'test-viral.fasta'), 'fasta')]
+    assert viral == [f'c{i}' for i in range(3, 3001, 3)]
+    stats = writer.stats['viral']
+    lengths = [10 * i for i in range(3, 3001, 3)]
+    assert (stats.n_contigs, stats.min_length, stats.max_length) == (1000, 30, 30000)
+    assert stats.total_length == sum(lengths)
+    assert stats.n50 == max(x for x in lengths if 2 * sum(y for y in lengths if y >= x) >= sum(lengths))
+
+
+def test_n50():
+    stats = LengthStats()
+    for length in [2, 3, 4, 5, 6, 7, 8, 9, 10]:
+        stats.add(length)
+    assert stats.n50 == 8
+    assert LengthStats().n50 == 0
+
+
+def test_writer_errors_are_raised(tmp_path: Path):
+    with pytest.raises(ValueError):
+        with ClassifiedFastaWriter(tmp_path, 'test') as writer:
+            writer.write(Contig.from_sequence('a', 'ACGT'), 'nonsense')
+    with pytest.raises(FileNotFoundError):
+        with ClassifiedFastaWriter(tmp_path / 'missing', 'test') as writer:
+            writer.write(Contig.from_sequence('a', 'ACGT'), 'viral')
+
+
+def test_output_classified_contigs(tmp_path: Path):
+    contigs = parse_contigs(TEST_FASTA)
+    names = list(contigs)
+    classes = [Classification.VIRUS, Classification.PLASMID, Classification.CHROMOSOME,
+               Classification.UNCERTAIN_PLASMID_OR_CHROMOSOMAL, Classification.UNCERTAIN_VIRAL_OR_BACTERIAL]
+    classifications = {name: NaiveBayesClassification(name, classes[i % len(classes)], *[0.0] * 7)
+                       for i, name in enumerate(names[:-1])}
+    stats_path = tmp_path / 'stats.csv'
+    paths = output_classified_contigs(classifications, contigs, tmp_path, output_plasmids_separately=False,
+                                      prefix='test', skip_reasons={names[-1]: 'too_short'},
+                                      length_stats_path=stats_path)
+    assert [x.name for x in paths] == ['test-viral.fasta', 'test-chromosome.fasta', 'test-viral_uncertain.fasta',
+                                       'test-unclassified.fasta']
+    for path in paths:
+        suffix = path.stem.split('-', 1)[1]
+        for rec in SeqIO.parse(str(path), 'fasta'):
+            if rec.id in classifications:
+                assert classification_suffix(classifications[rec.id].classification, False) == suffix
+            else:
+                assert rec.description.endswith('skip_reason=too_short')
+            assert str(rec.seq) == contigs[rec.id].seq()
+    df_stats = pd.read_csv(stats_path)
+    assert list(df_stats.classification) == ['viral', 'chromosome', 'viral_uncertain', 'unclassified']
+    assert df_stats.n_contigs.sum() == len(contigs)
+    assert df_stats.total_length.sum() == sum(x.seq_len for x in contigs.values())
@@ -0,0 +1,128 @@
+"""Tests for compressed FASTA input and BGZF output"""
+import gzip
+import io
+import mmap
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from Bio import SeqIO
+from click.testing import CliRunner
+
+from viral_verify import cli
+from viral_verify.compression import BgzfWriter, Compression, BGZF_BLOCK_SIZE, BGZF_EOF, bgzf_blocks, \
+    decompress_file, decompress_to_file, detect_compression, open_text, open_text_output, uncompressed_name
+from viral_verify.faidx import IndexedFasta
+from viral_verify.io import parse_contigs
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+TEST_FASTA = Path('tests/data/test.fasta')
+
+
+def _write_bgzf(path: Path, data: bytes, threads: int = 1) -> None:
+    with BgzfWriter(path, threads=threads) as writer:
+        for i in range(0, len(data), 10000):
+            writer.write(data[i:i + 10000])
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_bgzf_round_trip(tmp_path: Path, threads: int):
+    data = os.urandom(BGZF_BLOCK_SIZE) + b'ACGT\n' * 100000
+    path = tmp_path / 'data.bgz'
+    _write_bgzf(path, data, threads)
+    assert detect_compression(path) == Compression.BGZF
+    assert path.read_bytes().endswith(BGZF_EOF)
+    assert gzip.decompress(path.read_bytes()) == data
+    assert len(list(bgzf_blocks(path.read_bytes()))) == -(-len(data) // BGZF_BLOCK_SIZE) + 1
+    for decompress_threads in [1, 3]:
+        assert decompress_file(path, threads=decompress_threads) == data
+
+        fout = io.BytesIO()
+        assert decompress_to_file(path, fout, threads=decompress_threads) == len(data)
+        assert fout.getvalue() == data
+
+
+def test_detect_compression_and_names(tmp_path: Path):
+    path = tmp_path / 'test.fasta.gz'
+    path.write_bytes(gzip.compress(TEST_FASTA.read_bytes()))
+    assert detect_compression(path) == Compression.GZIP
+    assert detect_compression(TEST_FASTA) == Compression.NONE
+    assert decompress_file(path) == TEST_FASTA.read_bytes()
+    assert uncompressed_name(path) == 'test.fasta'
+    assert uncompressed_name(TEST_FASTA) == 'test.fasta'
+    with open_text(path) as fh:
+        assert fh.read() == TEST_FASTA.read_text()
+
+
+def test_open_text_output(tmp_path: Path):
+    for name in ['out.txt', 'out.txt.gz']:
+        with open_text_output(tmp_path / name, threads=2) as fout:
+            fout.write('line\n' * 1000)
+        with open_text(tmp_path / name) as fh:
+            assert fh.read() == 'line\n' * 1000
+    assert detect_compression(tmp_path / 'out.txt.gz') == Compression.BGZF
+
+
+def test_zstd_input(tmp_path: Path):
+    zstandard = pytest.importorskip('zstandard')
+    path = tmp_path / 'test.fasta.zst'
+    path.write_bytes(zstandard.ZstdCompressor().compress(TEST_FASTA.read_bytes()))
+    assert detect_compression(path) == Compression.ZSTD
+    assert decompress_file(path) == TEST_FASTA.read_bytes()
+    with open_text(path) as fh:
+        assert fh.read() == TEST_FASTA.read_text()
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'bgzf'])
+def test_parse_compressed_contigs(tmp_path: Path, compression: str):
+    path = tmp_path / 'test.fasta.gz'
+    if compression == 'gzip':
+        path.write_bytes(gzip.compress(TEST_FASTA.read_bytes()))
+    else:
+        _write_bgzf(path, TEST_FASTA.read_bytes())
+    expected = parse_contigs(TEST_FASTA)
+    observed = parse_contigs(path, threads=2)
+    assert [(x.name, x.description, x.seq_len, x.seq(), x.is_circular) for x in observed.values()] == \
+           [(x.name, x.description, x.seq_len, x.seq(), x.is_circular) for x in expected.values()]
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'bgzf'])
+def test_compressed_fasta_is_memory_mapped(tmp_path: Path, compression: str):
+    path = tmp_path / 'test.fasta.gz'
+    if compression == 'gzip':
+        path.write_bytes(gzip.compress(TEST_FASTA.read_bytes()))
+    else:
+        _write_bgzf(path, TEST_FASTA.read_bytes())
+    with IndexedFasta(path, threads=2) as fasta, IndexedFasta(TEST_FASTA) as expected:
+        assert isinstance(fasta._buf, mmap.mmap)
+        assert fasta._buf[:] == TEST_FASTA.read_bytes()
+        assert [fasta.fetch(x) for x in fasta.index()] == [expected.fetch(x) for x in expected.index()]
+
+
+def test_cli_compressed_input_and_output(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that gzip compressed input gives the same results as plain input and classified outputs are BGZF"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    gz_fasta = tmp_path / 'test.fasta.gz'
+    gz_fasta.write_bytes(gzip.compress(TEST_FASTA.read_bytes()))
+    runs = {}
+    for name, input_fasta, extra_args in [('plain', TEST_FASTA.resolve(), []),
+                                          ('gz', gz_fasta, ['--compress-output'])]:
+        outdir = tmp_path / name
+        result = CliRunner().invoke(cli.main, ['-i', str(input_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir),
+                                               '-t', '2'] + extra_args)
+        assert result.exit_code == 0, result.output
+        assert (outdir / 'test-results.csv').exists()
+        runs[name] = outdir
+    pd.testing.assert_frame_equal(pd.read_csv(runs['plain'] / 'test-results.csv'),
+                                  pd.read_csv(runs['gz'] / 'test-results.csv'))
+    plain_outputs = sorted((runs['plain'] / 'classified-fasta-output').glob('*.fasta'))
+    gz_outputs = sorted((runs['gz'] / 'classified-fasta-output').glob('*.fasta.gz'))
+    assert plain_outputs and [x.name + '.gz' for x in plain_outputs] == [x.name for x in gz_outputs]
+    for plain_path, gz_path in zip(plain_outputs, gz_outputs):
+        assert detect_compression(gz_path) == Compression.BGZF
+        with open_text(gz_path) as fh:
+            assert [(x.description, str(x.seq)) for x in SeqIO.parse(fh, 'fasta')] == \
+                   [(x.description, str(x.seq)) for x in SeqIO.parse(str(plain_path), 'fasta')]
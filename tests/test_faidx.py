@@ -0,0 +1,65 @@
+"""Tests for the disk-backed FASTA index"""
+from pathlib import Path
+
+import pytest
+from Bio import SeqIO
+
+from viral_verify.faidx import IndexedFasta
+from viral_verify.io import parse_contigs, write_contigs_fasta
+
+TEST_FASTA = Path('tests/data/test.fasta')
+
+IRREGULAR_FASTA = ('>a first record\n'
+                   'ACGTACGTAC\n'
+                   'GTACGTACGT\n'
+                   'ACG\n'
+                   '>b\r\n'
+                   'AC GT\r\n'
+                   'ACGTAC\r\n'
+                   '\n'
+                   '>empty\n'
+                   '>c  trailing spaces  \n'
+                   'ACGTACGTACGT')
+
+
+@pytest.fixture(params=['test', 'irregular'])
+def fasta_path(request, tmp_path: Path) -> Path:
+    if request.param == 'test':
+        return TEST_FASTA
+    path = tmp_path / 'irregular.fasta'
+    path.write_bytes(IRREGULAR_FASTA.encode())
+    return path
+
+
+def test_index_matches_biopython(fasta_path: Path):
+    recs = list(SeqIO.parse(fasta_path, 'fasta'))
+    with IndexedFasta(fasta_path) as fasta:
+        entries = list(fasta.index())
+        assert [(x.name, x.description, x.seq_len) for x in entries] == \
+               [(x.id, x.description, len(x.seq)) for x in recs]
+        for entry, rec in zip(entries, recs):
+            seq = str(rec.seq)
+            assert fasta.fetch(entry) == seq
+            for start, end in [(0, 1), (5, 25), (59, 61), (70, 71), (len(seq) - 3, None), (-15, -2), (10, 5)]:
+                assert fasta.fetch(entry, start, end) == seq[start:end]
+
+
+def test_line_layout(tmp_path: Path):
+    path = tmp_path / 'layout.fasta'
+    path.write_text('>a\nACGTA\nCGTAC\nGT\n>b\nACGTA\nCGTAC\n>c\nACGT\n\n>d\nACG\nACGT\n>e\nACGTACGT\n>f\nAC\n\nGT')
+    with IndexedFasta(path) as fasta:
+        assert [(x.line_bases, x.line_width) for x in fasta.index()] == \
+            [(5, 6), (5, 6), (4, 5), (0, 0), (8, 9), (0, 0)]
+
+
+def test_empty_fasta(tmp_path: Path):
+    path = tmp_path / 'empty.fasta'
+    path.write_text('')
+    assert parse_contigs(path) == {}
+
+
+def test_write_contigs_fasta_matches_biopython(fasta_path: Path, tmp_path: Path):
+    contigs = parse_contigs(fasta_path)
+    write_contigs_fasta(contigs.values(), tmp_path / 'observed.fasta')
+    SeqIO.write(SeqIO.parse(fasta_path, 'fasta'), tmp_path / 'expected.fasta', 'fasta')
+    assert (tmp_path / 'observed.fasta').read_text() == (tmp_path / 'expected.fasta').read_text()
@@ -0,0 +1,95 @@
+"""Tests for the bytes-level FASTA reader and writer"""
+import gzip
+import io
+import re
+from pathlib import Path
+
+import pytest
+from Bio import SeqIO
+
+from viral_verify.contig import Contig
+from viral_verify.fasta import read_fasta, sequence, split_header, parse_prodigal_header, write_record
+from viral_verify.io import filter_predicted_genes, filter_predicted_gene_lines
+from viral_verify.prodigal import prodigal_gene_start
+from viral_verify.shard import fasta_record_spans
+
+from tests.test_faidx import IRREGULAR_FASTA
+
+TEST_FASTA = Path('tests/data/test.fasta')
+PROTEINS_FASTA = ('>k141_1_1 # 1 # 30 # 1 # ID=1_1;partial=10\nMKV*\n'
+                  '>k141_1_2 # 40 # 90 # -1 # ID=1_2;partial=00\nMATK\nLLA*\n'
+                  '>k141_2_1 # 200 # 300 # 1 # ID=2_1;partial=01\nMKK*\n'
+                  '>k141_2_2 #  990 # 1100 # 1\nMW*')
+
+
+@pytest.fixture(params=['test', 'irregular', 'gzip'])
+def fasta_path(request, tmp_path: Path) -> Path:
+    if request.param == 'test':
+        return TEST_FASTA
+    if request.param == 'gzip':
+        path = tmp_path / 'irregular.fasta.gz'
+        path.write_bytes(gzip.compress(IRREGULAR_FASTA.encode()))
+        return path
+    path = tmp_path / 'irregular.fasta'
+    path.write_bytes(IRREGULAR_FASTA.encode())
+    return path
+
+
+def test_read_fasta_matches_biopython(fasta_path: Path):
+    with gzip.open(fasta_path, 'rt') if fasta_path.suffix == '.gz' else open(fasta_path) as fh:
+        expected = [(x.id, x.description, str(x.seq)) for x in SeqIO.parse(fh, 'fasta')]
+    observed = [(split_header(header)[0].decode(), header.decode(), sequence(seq_lines).decode())
+                for header, seq_lines in read_fasta(fasta_path)]
+    assert observed == expected
+
+
+def test_read_fasta_sources():
+    data = TEST_FASTA.read_bytes()
+    expected = [(header, bytes(seq_lines)) for header, seq_lines in read_fasta(TEST_FASTA)]
+    for source in [data, io.BytesIO(data), io.StringIO(data.decode())]:
+        assert [(header, bytes(seq_lines)) for header, seq_lines in read_fasta(source)] == expected
+    assert list(read_fasta(b'')) == []
+    assert list(read_fasta(b'no header\n')) == []
+
+
+def test_write_record_round_trip():
+    fout = io.BytesIO()
+    for header, seq_lines in read_fasta(IRREGULAR_FASTA.encode()):
+        write_record(fout, header, seq_lines)
+    observed = [(header, sequence(seq_lines)) for header, seq_lines in read_fasta(fout.getvalue())]
+    assert observed == [(header, sequence(seq_lines)) for header, seq_lines in read_fasta(IRREGULAR_FASTA.encode())]
+    assert fout.getvalue().endswith(b'ACGTACGTACGT\n')
+
+
+def test_parse_prodigal_header():
+    for header in [x[1:] for x in PROTEINS_FASTA.splitlines() if x.startswith('>')]:
+        gene_id = header.split()[0]
+        expected = (re.sub(r'_\d+$', '', gene_id), prodigal_gene_start(header))
+        assert parse_prodigal_header(header) == expected
+        assert parse_prodigal_header(header.encode()) == (expected[0].encode(), expected[1])
+
+
+def test_filter_predicted_genes(tmp_path: Path):
+    proteins = tmp_path / 'proteins.fa'
+    proteins.write_text(PROTEINS_FASTA)
+    contigs = {'k141_1': Contig.from_sequence('k141_1', 'A' * 50), 'k141_2': Contig.from_sequence('k141_2', 'A' * 900)}
+    for name in ['filtered.fa', 'filtered.fa.gz']:
+        assert filter_predicted_genes(proteins, tmp_path / name, contigs) == (3, 4)
+    assert (tmp_path / 'filtered.fa').read_text() == PROTEINS_FASTA.split('>k141_2_2')[0]
+    assert gzip.decompress((tmp_path / 'filtered.fa.gz').read_bytes()) == (tmp_path / 'filtered.fa').read_bytes()
+    fout = io.StringIO()
+    assert filter_predicted_gene_lines(io.StringIO(PROTEINS_FASTA), fout, contigs) == (3, 4)
+    assert fout.getvalue() == (tmp_path / 'filtered.fa').read_text()
+    contigs['k141_2'] = Contig.from_sequence('k141_2', 'A' * 1000)
+    assert filter_predicted_genes(proteins, tmp_path / 'all.fa', contigs) == (4, 4)
+    assert (tmp_path / 'all.fa').read_text() == PROTEINS_FASTA + '\n'
+
+
+def test_fasta_record_spans(fasta_path: Path):
+    if fasta_path.suffix == '.gz':
+        pytest.skip('record spans are byte offsets into uncompressed files')
+    data = fasta_path.read_bytes()
+    spans = fasta_record_spans(fasta_path)
+    assert [span.seq_len for span in spans] == [len(sequence(seq)) for _, seq in read_fasta(fasta_path)]
+    assert all(data[span.start:span.start + 1] == b'>' for span in spans)
+    assert spans[-1].end == len(data)
@@ -0,0 +1,72 @@
+"""Tests for HMM name and description scanning and indexing in `viral_verify.hmm_index`"""
+from pathlib import Path
+
+import pytest
+
+from viral_verify.hmm_index import scan_hmm_names_to_desc, load_hmm_names_to_desc, parse_pfam_dat_names_to_desc, \
+    INDEX_SUFFIX
+from viral_verify.io import parse_hmms, hmm_name, hmm_desc
+
+PFAM_DAT = """# STOCKHOLM 1.0
+#=GF ID   1-cysPrx_C
+#=GF AC   PF10417.12
+#=GF DE   C-terminal domain of 1-Cys peroxiredoxin
+#=GF GA   21.1; 21.1;
+#=GF ML   40
+//
+# STOCKHOLM 1.0
+#=GF ID   120_Rick_ant
+#=GF AC   PF12574.11
+#=GF DE   120 KDa Rickettsia surface antigen
+#=GF ML   238
+//
+"""
+
+
+def test_scan_hmm_names_to_desc(hmm_db: Path):
+    expected = {hmm_name(x): hmm_desc(x) for x in parse_hmms(hmm_db)}
+    assert len(expected) == 105
+    assert scan_hmm_names_to_desc(hmm_db) == expected
+
+
+def test_load_hmm_names_to_desc_uses_sidecar_index(hmm_db: Path):
+    expected = scan_hmm_names_to_desc(hmm_db)
+    assert load_hmm_names_to_desc(hmm_db) == expected
+    index_path = hmm_db.parent / (hmm_db.name + '.names.json')
+    assert index_path.exists()
+    mtime = index_path.stat().st_mtime_ns
+    assert load_hmm_names_to_desc(hmm_db) == expected
+    assert index_path.stat().st_mtime_ns == mtime
+    hmm_db.write_text(''.join(list(parse_hmms(hmm_db))[:2]))
+    assert len(load_hmm_names_to_desc(hmm_db)) == 2
+
+
+def test_load_hmm_names_to_desc_from_pfam_dat(hmm_db: Path):
+    dat_path = hmm_db.parent / (hmm_db.name + '.dat')
+    dat_path.write_text(PFAM_DAT)
+    assert parse_pfam_dat_names_to_desc(dat_path) == {'1-cysPrx_C': 'C-terminal domain of 1-Cys peroxiredoxin',
+                                                      '120_Rick_ant': '120 KDa Rickettsia surface antigen'}
+    assert load_hmm_names_to_desc(hmm_db) == parse_pfam_dat_names_to_desc(dat_path)
+
+
+def test_load_hmm_names_to_desc_stale_pfam_dat(hmm_db: Path):
+    """Test that changes to the Pfam annotation file rebuild the index and missing names fall back to the HMM file"""
+    dat_path = hmm_db.parent / (hmm_db.name + '.dat')
+    dat_path.write_text(PFAM_DAT)
+    assert len(load_hmm_names_to_desc(hmm_db)) == 2
+    dat_path.write_text(PFAM_DAT.split('//')[0] + '//\n')
+    names_to_desc = load_hmm_names_to_desc(hmm_db)
+    assert names_to_desc == {'1-cysPrx_C': 'C-terminal domain of 1-Cys peroxiredoxin'}
+
+    expected = scan_hmm_names_to_desc(hmm_db)
+    name = next(x for x in expected if x != '1-cysPrx_C')
+    assert names_to_desc[name] == expected[name]
+    assert names_to_desc['1-cysPrx_C'] == 'C-terminal domain of 1-Cys peroxiredoxin'
+    assert len(names_to_desc) == len(set(expected) | {'1-cysPrx_C'})
+    # the index is rewritten with the names from the HMM file
+    index_path = hmm_db.parent / (hmm_db.name + INDEX_SUFFIX)
+    mtime = index_path.stat().st_mtime_ns
+    assert load_hmm_names_to_desc(hmm_db) == names_to_desc
+    assert index_path.stat().st_mtime_ns == mtime
+    with pytest.raises(KeyError):
+        names_to_desc['not-an-hmm']
@@ -0,0 +1,233 @@
+"""Tests for running and parsing hmmsearch in `viral_verify.hmmsearch`"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from viral_verify.hmmsearch import top_hmm_results, run_hmmsearch, run_hmmsearch_sequence_sharded, \
+    run_hmmsearch_profile_sharded
+from viral_verify.hmmsearch import columnar
+from viral_verify.hmmsearch.db import split_hmm_db
+from viral_verify.hmmsearch.dedup import run_hmmsearch_unique, ProteinSearchSummary
+from viral_verify.hmmsearch.hit_cache import DomainHitCache
+from viral_verify.hmmsearch.io import parse_domtblout, domtblout_to_dataframe, top_domains_per_predicted_gene, \
+    top_domains_per_contig
+from viral_verify.hmmsearch.result import HmmSearchResult
+from viral_verify.io import parse_hmms, hmm_name
+
+from benchmarks.standins import HMMSEARCH
+
+
+def write_proteins(path: Path, n: int = 40) -> None:
+    with open(path, 'w') as fout:
+        for i in range(n):
+            fout.write(f'>contig_{i % 7}_{i} # 1 # 300 # 1 # ID={i % 7 + 1}_{i}\n{"MKV" * (i % 13 + 1)}*\n')
+
+
+def test_sequence_sharded_hmmsearch_matches_single_process(tmp_path: Path, fake_tool, hmm_db: Path):
+    fake_tool('hmmsearch', HMMSEARCH)
+    proteins = tmp_path / 'proteins.faa'
+    write_proteins(proteins)
+    run_hmmsearch(hmm_db, proteins, tmp_path / 'single.output', tmp_path / 'single.domtblout', threads=4, z=40,
+                  dom_z=40)
+    run_hmmsearch_sequence_sharded(hmm_db, proteins, tmp_path / 'sharded.output', tmp_path / 'sharded.domtblout',
+                                   threads=8, cpus_per_worker=2)
+    single = top_hmm_results(tmp_path / 'single.domtblout')
+    assert single[0]
+    assert single == top_hmm_results(tmp_path / 'sharded.domtblout')
+    merged = (tmp_path / 'sharded.domtblout').read_text().splitlines()
+    assert merged[1].startswith('# target name')
+    assert merged[-1] == '# [ok]'
+    assert ' -Z 40 --domZ 40 ' in merged[-2]
+    assert not list(tmp_path.glob('hmmsearch-shards-*'))
+
+
+def test_split_hmm_db_is_cached(hmm_db: Path):
+    shards = split_hmm_db(hmm_db, 4)
+    assert len(shards) == 4
+    assert [hmm_name(x) for shard in shards for x in parse_hmms(shard)] == [hmm_name(x) for x in parse_hmms(hmm_db)]
+    mtimes = [x.stat().st_mtime_ns for x in shards]
+    assert split_hmm_db(hmm_db, 4) == shards
+    assert [x.stat().st_mtime_ns for x in shards] == mtimes
+    old_shards = shards
+    hmm_db.write_text(''.join(list(parse_hmms(hmm_db))[:3]))
+    shards = split_hmm_db(hmm_db, 4)
+    assert len(shards) == 3
+    # shards of the previous HMM DB version may still be in use by other runs
+    assert all(x.exists() for x in old_shards)
+
+
+def test_split_hmm_db_concurrent(hmm_db: Path):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: split_hmm_db(hmm_db, 4), range(8)))
+    assert all(x == results[0] for x in results)
+    assert [hmm_name(x) for shard in results[0] for x in parse_hmms(shard)] == \
+           [hmm_name(x) for x in parse_hmms(hmm_db)]
+    assert [x.name for x in results[0][0].parent.parent.iterdir()] == [results[0][0].parent.name]
+
+
+def test_profile_sharded_hmmsearch_matches_single_process(tmp_path: Path, fake_tool, hmm_db: Path):
+    fake_tool('hmmsearch', HMMSEARCH)
+    proteins = tmp_path / 'proteins.faa'
+    write_proteins(proteins)
+    run_hmmsearch(hmm_db, proteins, tmp_path / 'single.output', tmp_path / 'single.domtblout', threads=4)
+    run_hmmsearch_profile_sharded(hmm_db, proteins, tmp_path / 'sharded.output', tmp_path / 'sharded.domtblout',
+                                  threads=6, cpus_per_worker=2)
+    single = top_hmm_results(tmp_path / 'single.domtblout')
+    assert single == top_hmm_results(tmp_path / 'sharded.domtblout')
+    assert len(list((tmp_path / 'Pfam-A-filtered-for-tests.hmm.shards-3').glob('*/manifest.json'))) == 1
+
+
+def write_domtblout(path: Path, n_rows: int = 3000, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    with open(path, 'w') as fout:
+        fout.write('# target name  accession  tlen query name\n#----\n')
+        for i in range(n_rows):
+            target = f'k141_{rng.randint(0, 50)}_{rng.randint(1, 30)}'
+            query = rng.choice(['PF_A', 'PF_B', 'PF_C', 'Phage_int', 'rve'])
+            score = rng.choice([10.5, 20.0, 35.2, 35.2, 101.7])
+            start = rng.randint(1, 20)
+            fout.write(f'{target} - 300 {query} PF0.1 120 1e-10 {score} 0.1 1 2 1e-5 1e-5 {score} 0.1 '
+                       f'1 100 {start} {start + rng.randint(0, 60)} {start} {start + 70} 0.95 free text # {i}\n')
+        fout.write('# Program: hmmsearch\n')
+
+
+def reference_parse_domtblout(path: Path) -> List[HmmSearchResult]:
+    with open(path) as fh:
+        out = [HmmSearchResult.from_row_str(line) for line in fh if not line.startswith('#')]
+    out.sort(key=lambda x: (x.target_name, x.domain_score, x.ali_coord_from), reverse=True)
+    return out
+
+
+def test_parse_domtblout_matches_row_parser(tmp_path: Path, monkeypatch):
+    domtblout = tmp_path / 'test.domtblout'
+    write_domtblout(domtblout)
+    expected = reference_parse_domtblout(domtblout)
+    assert parse_domtblout(domtblout) == expected
+    monkeypatch.setattr(columnar, 'PARALLEL_PARSE_MIN_BYTES', 0)
+    table = columnar.parse_domtblout_columnar(domtblout, processes=3)
+    assert table.sorted().to_results() == expected
+    df = domtblout_to_dataframe(domtblout)
+    assert df.target_name.tolist() == [x.target_name for x in expected]
+    assert df.domain_score.tolist() == [x.domain_score for x in expected]
+
+
+def test_newline_aligned_ranges(tmp_path: Path):
+    path = tmp_path / 'lines.txt'
+    path.write_text(''.join(f'line {i} {"x" * (i % 17)}\n' for i in range(500)))
+    for n in (1, 2, 7, 1000):
+        ranges = columnar.newline_aligned_ranges(path, n)
+        data = path.read_bytes()
+        assert b''.join(data[start:end] for start, end in ranges) == data
+        assert all(data[end - 1:end] == b'\n' for _, end in ranges)
+
+
+def reference_top_domains_per_predicted_gene(hmm_results: List[HmmSearchResult]):
+    top_domains = {}
+    for hmm_result in hmm_results:
+        if hmm_result.target_name not in top_domains:
+            top_domains[hmm_result.target_name] = [hmm_result]
+        elif not hmm_result.overlaps(top_domains[hmm_result.target_name]):
+            top_domains[hmm_result.target_name] += [hmm_result]
+    return top_domains
+
+
+def test_top_domains_match_greedy_pairwise_overlap_selection():
+    for seed in range(200):
+        rng = random.Random(seed)
+        max_coord = rng.choice([5, 20, 200])
+        hmm_results = []
+        for i in range(rng.randint(0, 80)):
+            start = rng.randint(1, max_coord)
+            end = start + rng.randint(-1 if seed % 10 == 0 else 0, max_coord // 2)
+            hmm_results.append(HmmSearchResult(target_name=f'gene_{rng.randint(0, 4)}',
+                                               query_name=f'PF{i}',
+                                               domain_score=rng.randint(0, 10) / 2,
+                                               ali_coord_from=start,
+                                               ali_coord_to=end))
+        expected = reference_top_domains_per_predicted_gene(hmm_results)
+        assert top_domains_per_predicted_gene(hmm_results) == expected
+
+
+def test_top_hmm_results_match_greedy_pairwise_overlap_selection(tmp_path: Path):
+    for seed in range(5):
+        domtblout = tmp_path / f'{seed}.domtblout'
+        write_domtblout(domtblout, n_rows=2000, seed=seed)
+        top_domains = reference_top_domains_per_predicted_gene(reference_parse_domtblout(domtblout))
+        assert top_hmm_results(domtblout) == (top_domains_per_contig(top_domains), top_domains)
+
+
+def test_hmmsearch_hit_cache(tmp_path: Path, fake_tool, hmm_db: Path):
+    fake_tool('hmmsearch', HMMSEARCH)
+
+    def write_unique_proteins(path: Path, n: int) -> None:
+        with open(path, 'w') as fout:
+            for i in range(n):
+                fout.write(f'>contig_{i % 7}_{i} # 1 # 300 # 1 # ID={i % 7 + 1}_{i}\n'
+                           f'M{"".join("ACDEFGHIKL"[int(x)] for x in str(i))}KV*\n')
+
+    cache_path = tmp_path / 'cache' / 'hits.sqlite'
+    proteins = tmp_path / 'proteins.faa'
+    write_unique_proteins(proteins, 40)
+    run_hmmsearch(hmm_db, proteins, None, tmp_path / 'uncached.domtblout')
+    with DomainHitCache.open(cache_path, hmm_db) as cache:
+        assert run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'first.domtblout', hit_cache=cache) == \
+            ProteinSearchSummary(n_proteins=40, n_unique=40, n_cached=0, n_searched=40)
+    expected = domtblout_to_dataframe(tmp_path / 'uncached.domtblout')
+    assert_frame_equal(domtblout_to_dataframe(tmp_path / 'first.domtblout'), expected)
+
+    # all proteins cached so hmmsearch is not run
+    fake_tool('hmmsearch', '#!/usr/bin/env python\nimport sys\nsys.exit(1)\n')
+    with DomainHitCache.open(cache_path, hmm_db) as cache:
+        assert run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'second.domtblout', hit_cache=cache) == \
+            ProteinSearchSummary(n_proteins=40, n_unique=40, n_cached=40, n_searched=0)
+    assert_frame_equal(domtblout_to_dataframe(tmp_path / 'second.domtblout'), expected)
+
+    # only new proteins are searched
+    fake_tool('hmmsearch', HMMSEARCH)
+    write_unique_proteins(proteins, 60)
+    run_hmmsearch(hmm_db, proteins, None, tmp_path / 'uncached.domtblout')
+    with DomainHitCache.open(cache_path, hmm_db) as cache:
+        assert run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'third.domtblout', hit_cache=cache) == \
+            ProteinSearchSummary(n_proteins=60, n_unique=60, n_cached=40, n_searched=20)
+    assert_frame_equal(domtblout_to_dataframe(tmp_path / 'third.domtblout'),
+                       domtblout_to_dataframe(tmp_path / 'uncached.domtblout'))
+    assert top_hmm_results(tmp_path / 'third.domtblout') == top_hmm_results(tmp_path / 'uncached.domtblout')
+
+    # different HMM DB contents use different cache entries
+    hmm_db.write_text(''.join(list(parse_hmms(hmm_db))[:3]))
+    with DomainHitCache.open(cache_path, hmm_db) as cache:
+        summary = run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'fourth.domtblout', hit_cache=cache)
+    assert summary.n_cached == 0
+
+
+def test_duplicate_proteins_searched_once(tmp_path: Path, fake_tool, hmm_db: Path):
+    fake_tool('hmmsearch', HMMSEARCH)
+    proteins = tmp_path / 'proteins.faa'
+    with open(proteins, 'w') as fout:
+        for i in range(30):
+            fout.write(f'>contig_{i % 7}_{i} # 1 # 300 # 1 # ID={i % 7 + 1}_{i}\nMKV{"A" * (i % 4)}*\n')
+    run_hmmsearch(hmm_db, proteins, None, tmp_path / 'all.domtblout')
+    summary = run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'unique.domtblout')
+    assert summary == ProteinSearchSummary(n_proteins=30, n_unique=4, n_cached=0, n_searched=4)
+    assert summary.n_duplicates == 26
+    assert_frame_equal(domtblout_to_dataframe(tmp_path / 'unique.domtblout'),
+                       domtblout_to_dataframe(tmp_path / 'all.domtblout'))
+    assert top_hmm_results(tmp_path / 'unique.domtblout') == top_hmm_results(tmp_path / 'all.domtblout')
+
+
+@pytest.mark.parametrize('sharding', ['none', 'sequence', 'profile'])
+def test_unique_search_fixes_evalue_sizes(tmp_path: Path, fake_tool, hmm_db: Path, sharding: str):
+    """Test that -Z and --domZ are the total number of proteins however many duplicates are removed"""
+    fake_tool('hmmsearch', HMMSEARCH)
+    proteins = tmp_path / 'proteins.faa'
+    with open(proteins, 'w') as fout:
+        for i in range(30):
+            fout.write(f'>contig_{i % 7}_{i} # 1 # 300 # 1 # ID={i % 7 + 1}_{i}\nMKV{"A" * (i % 4)}*\n')
+    run_hmmsearch_unique(hmm_db, proteins, None, tmp_path / 'unique.domtblout', threads=2, sharding=sharding)
+    options = [x for x in (tmp_path / 'unique.domtblout').read_text().splitlines() if x.startswith('# Option settings')]
+    assert len(options) == 1
+    assert ' -Z 30 --domZ 30 ' in options[0]
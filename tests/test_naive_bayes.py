@@ -0,0 +1,54 @@
+"""Tests for Naive Bayes classification in `viral_verify.naive_bayes`"""
+import random
+import shutil
+from pathlib import Path
+
+from viral_verify.naive_bayes import CLASSIFIER_TABLE, NaiveBayesClassification, compile_classifier_table, \
+    load_classifier_table
+from viral_verify.naive_bayes.compiled import CompiledClassifierTable
+from viral_verify.naive_bayes.io import parse_naive_bayes_classifier_table
+from viral_verify.naive_bayes.vectorized import classify_contig_domains
+
+
+def random_contig_domains(domain_names, n_contigs=200, seed=42):
+    rng = random.Random(seed)
+    names = list(domain_names) + ['NotInTable_1', 'NotInTable_2']
+    return {f'contig_{i}': [rng.choice(names) for _ in range(rng.randint(0, 40))] for i in range(n_contigs)}
+
+
+def test_compiled_classifier_table_matches_tsv(tmp_path: Path):
+    tsv = tmp_path / 'classifier_table.txt'
+    shutil.copy(CLASSIFIER_TABLE, tsv)
+    freqs = parse_naive_bayes_classifier_table(tsv)
+    compiled_path = compile_classifier_table(tsv)
+    assert compiled_path == tmp_path / 'classifier_table.txt.compiled'
+    table = load_classifier_table(tsv)
+    assert table.names == sorted(freqs)
+    for domain, contig_domains in random_contig_domains(freqs).items():
+        expected = NaiveBayesClassification.from_contig_domains(domain, contig_domains, freqs)
+        assert NaiveBayesClassification.from_contig_domains(domain, contig_domains, table) == expected
+
+
+def test_stale_compiled_classifier_table_is_recompiled(tmp_path: Path):
+    tsv = tmp_path / 'classifier_table.txt'
+    lines = Path(CLASSIFIER_TABLE).read_text().splitlines(keepends=True)
+    tsv.write_text(''.join(lines[:10]))
+    assert len(load_classifier_table(tsv)) == 10
+    tsv.write_text(''.join(lines[:20]))
+    assert len(load_classifier_table(tsv)) == 20
+    assert len(CompiledClassifierTable.from_file(tmp_path / 'classifier_table.txt.compiled')) == 20
+
+
+def test_vectorized_classification_matches_per_contig_classification():
+    freqs = parse_naive_bayes_classifier_table(CLASSIFIER_TABLE)
+    table = load_classifier_table(CLASSIFIER_TABLE)
+    for threshold in (0.5, 3.0, 10.0):
+        contig_domains = random_contig_domains(freqs, n_contigs=500, seed=int(threshold * 10))
+        contig_domains['no_domains'] = []
+        expected = {contig: NaiveBayesClassification.from_contig_domains(contig, domains, freqs, threshold)
+                    for contig, domains in contig_domains.items()}
+        observed = classify_contig_domains(contig_domains, table, threshold)
+        assert list(observed) == list(expected)
+        assert observed == expected
+        assert len({x.classification for x in observed.values()}) > 3
+    assert classify_contig_domains({}, table) == {}
@@ -0,0 +1,93 @@
+"""Tests for the contig pre-filters skipping gene prediction and hmmsearch"""
+from pathlib import Path
+
+import pandas as pd
+from Bio import SeqIO
+from click.testing import CliRunner
+
+from viral_verify import cli
+from viral_verify.contig import Contig
+from viral_verify.prefilter import ContigFilter, SkipReason, prefilter_contigs, filter_min_genes, n_fraction, \
+    skip_summary
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+
+def test_prefilter_contigs():
+    contigs = {
+        'short': Contig.from_sequence('short', 'ACGT' * 50),
+        'ns': Contig.from_sequence('ns', 'ACGT' * 100 + 'N' * 600),
+        'ok': Contig.from_sequence('ok', 'ACGTTGCA' * 200),
+    }
+    assert n_fraction(contigs['ns']) == 0.6
+    assert prefilter_contigs(contigs, ContigFilter()) == (contigs, {})
+    kept, skipped = prefilter_contigs(contigs, ContigFilter(min_length=500, max_n_fraction=0.5))
+    assert list(kept) == ['ok']
+    assert skipped == dict(short=SkipReason.TOO_SHORT, ns=SkipReason.TOO_MANY_N)
+    assert skip_summary(contigs, skipped) == dict(skipped_contigs=2, skipped_bases=1200, skipped_too_short=1,
+                                                  skipped_too_many_n=1)
+
+
+def test_filter_min_genes(tmp_path: Path):
+    contigs = {name: Contig.from_sequence(name, 'ACGT' * 200) for name in ['k141_1', 'k141_2', 'k141_3']}
+    proteins = tmp_path / 'proteins.fa'
+    proteins.write_text('>k141_1_1 # 1 # 30 # 1\nMKV*\n>k141_1_2 # 40 # 90 # 1\nMAT\nKL*\n'
+                        '>k141_2_1 # 1 # 30 # 1\nMKK*\n')
+    skipped, n_removed = filter_min_genes(proteins, contigs, 2)
+    assert skipped == {'k141_2': SkipReason.TOO_FEW_GENES, 'k141_3': SkipReason.TOO_FEW_GENES}
+    assert n_removed == 1
+    assert proteins.read_text() == '>k141_1_1 # 1 # 30 # 1\nMKV*\n>k141_1_2 # 40 # 90 # 1\nMAT\nKL*\n'
+
+
+def test_cli_prefilters(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that skipped contigs are not searched and are reported with their skip reason"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    lengths = {x.id: len(x) for x in SeqIO.parse(str(test_fasta), 'fasta')}
+    # the stand-in Prodigal predicts a gene every 1 kb starting at the first base of contigs longer than 300 bp
+    expected = {name: SkipReason.TOO_SHORT if length < 1000 else
+                SkipReason.TOO_FEW_GENES if len(range(1, length - 299, 1000)) < 3 else ''
+                for name, length in lengths.items()}
+    for stream in [False, True]:
+        outdir = tmp_path / f'stream-{stream}'
+        args = ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir), '--prefix', 'test', '-t', '1',
+                '--min-contig-length', '1000', '--min-genes', '3']
+        result = CliRunner().invoke(cli.main, args + (['--stream'] if stream else []))
+        assert result.exit_code == 0, result.output
+
+        df = pd.read_csv(outdir / 'test-results.csv', keep_default_na=False)
+        assert dict(zip(df.contig_name, df.skip_reason)) == expected
+        assert set(df.classification[df.skip_reason != '']) == {'Unclassified'}
+        searched = {line.split()[0].rsplit('_', 1)[0] for line in open(outdir / 'test-hmmsearch.domtblout')
+                    if not line.startswith('#')}
+        assert searched and all(expected[x] == '' for x in searched)
+        unclassified = {x.id: x.description for x in
+                        SeqIO.parse(str(outdir / 'classified-fasta-output' / 'test-unclassified.fasta'), 'fasta')}
+        assert {name for name, reason in expected.items() if reason} <= set(unclassified)
+        assert unclassified['NC_007370.1'].endswith(f'skip_reason={SkipReason.TOO_SHORT}')
+
+
+def test_cli_prefilters_skip_all_contigs(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that Prodigal and hmmsearch are not run if the pre-filters skip every contig"""
+    failing_tool = '#!/usr/bin/env python\nimport sys\nsys.exit("should not be run")\n'
+    fake_tool('prodigal', failing_tool)
+    fake_tool('hmmsearch', failing_tool)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    names = [x.id for x in SeqIO.parse(str(test_fasta), 'fasta')]
+    for stream in [False, True]:
+        outdir = tmp_path / f'stream-{stream}'
+        args = ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir), '--prefix', 'test', '-t', '2',
+                '--min-contig-length', '100000000']
+        result = CliRunner().invoke(cli.main, args + (['--stream'] if stream else []))
+        assert result.exit_code == 0, result.output
+
+        df = pd.read_csv(outdir / 'test-results.csv', keep_default_na=False)
+        assert list(df.contig_name) == names
+        assert set(df.classification) == {'Unclassified'}
+        assert set(df.skip_reason) == {SkipReason.TOO_SHORT}
+        assert (outdir / 'test-hmmsearch.domtblout').read_text() == ''
+        assert (outdir / 'test-proteins-circularized.fa').exists() != stream
+        unclassified = [x.id for x in
+                        SeqIO.parse(str(outdir / 'classified-fasta-output' / 'test-unclassified.fasta'), 'fasta')]
+        assert unclassified == names
@@ -0,0 +1,41 @@
+"""Tests for Prodigal gene prediction in `viral_verify.prodigal`"""
+from pathlib import Path
+
+from viral_verify.prodigal import prodigal_meta
+from viral_verify.shard import balanced_shards
+
+from benchmarks.standins import PRODIGAL
+
+
+def test_balanced_shards():
+    sizes = [100, 5, 40, 60, 1, 1]
+    shards = balanced_shards(sizes, 3)
+    assert sorted(i for shard in shards for i in shard) == list(range(len(sizes)))
+    assert shards[0] == [0]
+    assert balanced_shards(sizes, 10) == balanced_shards(sizes, len(sizes))
+    assert balanced_shards([], 4) == []
+
+
+def test_prodigal_meta_parallel_matches_single_process(tmp_path: Path, fake_tool):
+    fake_tool('prodigal', PRODIGAL)
+
+    fasta = tmp_path / 'contigs.fasta'
+    with open(fasta, 'w') as fout:
+        for i in range(25):
+            fout.write(f'>contig_{i} description {i}\n{"ACGT" * (i * 7 % 11 + 1)}\n')
+
+    prodigal_meta(fasta, tmp_path / 'single.genes', tmp_path / 'single.faa', threads=1)
+    prodigal_meta(fasta, tmp_path / 'parallel.genes', tmp_path / 'parallel.faa', threads=4)
+    assert (tmp_path / 'single.faa').read_text() == (tmp_path / 'parallel.faa').read_text()
+    assert (tmp_path / 'single.genes').read_text() == (tmp_path / 'parallel.genes').read_text()
+    assert not list(tmp_path.glob('prodigal-shards-*'))
+
+
+def test_prodigal_meta_parallel_empty_input(tmp_path: Path):
+    """Test that Prodigal is not run on input without sequences (it is not installed here)"""
+    for i, text in enumerate(['', '\n\n']):
+        fasta = tmp_path / f'empty-{i}.fasta'
+        fasta.write_text(text)
+        prodigal_meta(fasta, tmp_path / f'empty-{i}.genes', tmp_path / f'empty-{i}.faa', threads=4)
+        assert (tmp_path / f'empty-{i}.faa').read_text() == ''
+        assert (tmp_path / f'empty-{i}.genes').read_text() == ''
@@ -0,0 +1,107 @@
+"""Tests for the incremental results table writers"""
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from pandas.testing import assert_frame_equal
+
+from viral_verify import cli
+from viral_verify.io import output_results_table
+from viral_verify.naive_bayes import NaiveBayesClassification
+from viral_verify.results import RESULT_COLUMNS, ResultsWriter, open_results_writer
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+CONTIGS = dict.fromkeys(['a', 'b', 'c'])
+CONTIG_DOMAINS = dict(a=['X', 'Y'], c=['Y'])
+NAMES_TO_DESC = dict(X='X domain', Y='Y, domain "quoted"')
+CLASSIFICATIONS = {name: NaiveBayesClassification(name, cls, -1.25, -2.5, -3.0, -2.4, 1.15, 0.5, 3.0)
+                   for name, cls in [('a', 'Virus'), ('c', 'Plasmid')]}
+
+
+def write_results(path: Path, fmt: str, skip_reasons=None) -> None:
+    output_results_table(path, CONTIGS, CONTIG_DOMAINS, CLASSIFICATIONS, NAMES_TO_DESC, skip_reasons=skip_reasons,
+                         fmt=fmt)
+
+
+def expected_df() -> pd.DataFrame:
+    return pd.DataFrame([dict(contig_name='a', classification='Virus', log_viral_prob=-1.25, log_plasmid_prob=-2.5,
+                              log_chrom_prob=-3.0, log_plasmid_or_chrom_prob=-2.4,
+                              log_viral_minus_plasmid_or_chrom_prob=1.15, log_plasmid_minus_chrom_prob=0.5,
+                              uncertainty_threshold=3.0, protein_domains='X [X domain];Y [Y, domain "quoted"]'),
+                         dict(contig_name='b', classification='Unclassified'),
+                         dict(contig_name='c', classification='Plasmid', log_viral_prob=-1.25, log_plasmid_prob=-2.5,
+                              log_chrom_prob=-3.0, log_plasmid_or_chrom_prob=-2.4,
+                              log_viral_minus_plasmid_or_chrom_prob=1.15, log_plasmid_minus_chrom_prob=0.5,
+                              uncertainty_threshold=3.0, protein_domains='Y [Y, domain "quoted"]')],
+                        columns=RESULT_COLUMNS)
+
+
+@pytest.mark.parametrize('fmt,sep', [('csv', ','), ('tsv', '\t')])
+def test_delimited_results(tmp_path: Path, fmt: str, sep: str):
+    path = tmp_path / f'results.{fmt}'
+    write_results(path, fmt)
+    assert_frame_equal(pd.read_csv(path, sep=sep), expected_df())
+
+
+def test_csv_results_match_pandas(tmp_path: Path):
+    write_results(tmp_path / 'results.csv', 'csv')
+    expected_df().to_csv(tmp_path / 'expected.csv', index=False)
+    assert (tmp_path / 'results.csv').read_text() == (tmp_path / 'expected.csv').read_text()
+
+
+def test_ndjson_results(tmp_path: Path):
+    path = tmp_path / 'results.ndjson'
+    write_results(path, 'ndjson', skip_reasons=dict(b='too_short'))
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [x['contig_name'] for x in rows] == ['a', 'b', 'c']
+    assert rows[1] == {**dict.fromkeys(RESULT_COLUMNS + ['skip_reason']),
+                       **dict(contig_name='b', classification='Unclassified', skip_reason='too_short')}
+    assert rows[0]['log_viral_prob'] == -1.25 and rows[0]['skip_reason'] is None
+
+
+def test_parquet_results(tmp_path: Path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'results.parquet'
+    with open_results_writer(path, 'parquet') as writer:
+        writer.row_group_size = 2
+        for row in expected_df().to_dict('records'):
+            writer.write({k: None if v != v else v for k, v in row.items()})
+    table = pq.read_table(path)
+    assert pa.types.is_dictionary(table.schema.field('classification').type)
+    assert table.schema.field('log_viral_prob').type == pa.float64()
+    assert pq.ParquetFile(path).num_row_groups == 2
+    df = table.to_pandas()
+    df['classification'] = df['classification'].astype(str)
+    assert_frame_equal(df, expected_df(), check_dtype=False)
+
+
+def test_unknown_results_format(tmp_path: Path):
+    with pytest.raises(ValueError):
+        open_results_writer(tmp_path / 'results.xlsx', 'xlsx')
+
+
+def test_cli_results_format(tmp_path: Path, fake_tool, hmm_db: Path):
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    args = ['-i', str(Path('tests/data/test.fasta').resolve()), '--hmm-db', str(hmm_db), '--prefix', 'test',
+            '-t', '1']
+    runner = CliRunner()
+    result = runner.invoke(cli.main, args + ['-o', str(tmp_path / 'csv')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli.main, args + ['-o', str(tmp_path / 'tsv'), '--results-format', 'tsv'])
+    assert result.exit_code == 0, result.output
+    assert_frame_equal(pd.read_csv(tmp_path / 'tsv' / 'test-results.tsv', sep='\t'),
+                       pd.read_csv(tmp_path / 'csv' / 'test-results.csv'))
+
+
+def test_incomplete_writer_fails_on_creation(tmp_path: Path):
+    class RowOnlyWriter(ResultsWriter):
+        def _write(self, row):
+            pass
+
+    with pytest.raises(TypeError):
+        RowOnlyWriter(tmp_path / 'results.txt', RESULT_COLUMNS)
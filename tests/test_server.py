@@ -0,0 +1,74 @@
+"""Tests for the classification service"""
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from pandas.testing import assert_frame_equal
+
+from viral_verify import cli
+from viral_verify.naive_bayes import CLASSIFIER_TABLE
+from viral_verify.server import ServiceState, JobQueue, make_server, ServiceClient
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
+
+
+@pytest.fixture
+def service(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Classification service on a Unix socket with stand-in external tools"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    state = ServiceState.load(hmm_db=hmm_db, classifier_table_path=CLASSIFIER_TABLE)
+    job_queue = JobQueue(state=state, workers=2, max_queue=10)
+    socket_path = tmp_path / 'viral_verify.sock'
+    server = make_server(job_queue, socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield ServiceClient(socket_path=socket_path, timeout=10)
+    server.shutdown()
+    server.server_close()
+    job_queue.shutdown()
+
+
+def test_service_matches_cli(tmp_path: Path, service: ServiceClient, hmm_db: Path):
+    """Test that jobs run by the service give the same results as viral_verify"""
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    result = CliRunner().invoke(cli.main, ['-i', str(test_fasta), '-o', str(tmp_path / 'cli'), '--hmm-db',
+                                           str(hmm_db), '--prefix', 'test', '-t', '1'])
+    assert result.exit_code == 0, result.output
+    df_expected = pd.read_csv(tmp_path / 'cli' / 'test-results.csv')
+
+    assert service.health() == dict(status='ok')
+    jobs = [service.submit(test_fasta, outdir=tmp_path / f'service{i}', prefix='test') for i in range(3)]
+    for job in jobs:
+        job = service.wait(job['id'], timeout=30)
+        assert job['status'] == 'done', job['error']
+        assert job['result']['n_contigs'] == len(df_expected)
+        df_observed = pd.read_csv(Path(job['outdir']) / 'test-results.csv')
+        assert_frame_equal(df_observed, df_expected)
+        assert pd.DataFrame(job['result']['classifications']).classification.tolist() == \
+            df_expected.classification.tolist()
+
+    metrics = service.metrics()
+    assert metrics['completed'] == 3
+    assert metrics['failed'] == 0
+    assert metrics['queue_depth'] == 0
+    assert metrics['run_seconds']['max'] >= metrics['run_seconds']['p50'] > 0
+
+
+def test_service_rejects_invalid_jobs(tmp_path: Path, service: ServiceClient):
+    with pytest.raises(RuntimeError, match='does not exist'):
+        service.submit(tmp_path / 'missing.fasta')
+    with pytest.raises(RuntimeError, match='Unknown job request fields'):
+        service.submit('tests/data/test.fasta', threads=4)
+    with pytest.raises(RuntimeError, match='No such job'):
+        service.job('unknown')
+
+    # the job fails since the output directory cannot be created
+    outdir = tmp_path / 'file'
+    outdir.write_text('')
+    job = service.wait(service.submit('tests/data/test.fasta', outdir=outdir / 'out')['id'], timeout=30)
+    assert job['status'] == 'failed'
+    assert 'FileExistsError' in job['error'] or 'NotADirectoryError' in job['error']
+    assert service.metrics()['failed'] == 1
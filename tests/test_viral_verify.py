@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 """Tests for `viral_verify` package."""
+import json
+import pstats
 import subprocess
 from pathlib import Path
 
@@ -8,7 +10,9 @@ import pandas as pd
 from click.testing import CliRunner
 from pandas.testing import assert_frame_equal
 
-from viral_verify import cli
+from viral_verify import checkpoint, cli
+
+from benchmarks.standins import PRODIGAL, HMMSEARCH
 
 
 def test_command_line_interface():
@@ -48,3 +52,127 @@ def test_command_line_interface():
         df_observed = pd.read_csv(results_csv_path)
         df_expected = pd.read_csv(expected_results_csv_path)
         assert_frame_equal(df_observed, df_expected)
+
+
+def test_stream_mode_matches_default(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that --stream gives the same results without intermediate files using stand-in external tools"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    runner = CliRunner()
+    args = ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '--prefix', 'test', '-t', '2']
+    result = runner.invoke(cli.main, args + ['-o', str(tmp_path / 'default')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli.main, args + ['-o', str(tmp_path / 'stream'), '--stream'])
+    assert result.exit_code == 0, result.output
+
+    df_default = pd.read_csv(tmp_path / 'default' / 'test-results.csv')
+    df_stream = pd.read_csv(tmp_path / 'stream' / 'test-results.csv')
+    assert_frame_equal(df_default, df_stream)
+    assert sorted(x.name for x in (tmp_path / 'stream').iterdir()) == ['.checkpoints',
+                                                                       'classified-fasta-output',
+                                                                       'test-hmmsearch.domtblout',
+                                                                       'test-results.csv',
+                                                                       'test-run-metrics.json']
+
+
+def test_resume_skips_completed_stages(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that --resume only reruns stages whose inputs or parameters changed"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    outdir = tmp_path / 'outdir'
+    runner = CliRunner()
+    args = ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir), '--prefix', 'test', '-t', '1']
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 0, result.output
+    df_expected = pd.read_csv(outdir / 'test-results.csv')
+    # existing output directory without --resume
+    assert runner.invoke(cli.main, args).exit_code != 0
+
+    # external tools must not be run again
+    failing_tool = '#!/usr/bin/env python\nimport sys\nsys.exit(1)\n'
+    fake_tool('prodigal', failing_tool)
+    fake_tool('hmmsearch', failing_tool)
+    result = runner.invoke(cli.main, args + ['--resume', '--uncertainty-threshold', '1.0'])
+    assert result.exit_code == 0, result.output
+    df_observed = pd.read_csv(outdir / 'test-results.csv')
+    assert (df_observed.uncertainty_threshold == 1.0).all()
+    assert_frame_equal(df_observed.drop(columns=['classification', 'uncertainty_threshold']),
+                       df_expected.drop(columns=['classification', 'uncertainty_threshold']))
+
+    # a missing or changed output reruns its stage
+    (outdir / 'test-hmmsearch.domtblout').unlink()
+    result = runner.invoke(cli.main, args + ['--resume'])
+    assert result.exit_code != 0
+    fake_tool('hmmsearch', HMMSEARCH)
+    result = runner.invoke(cli.main, args + ['--resume'])
+    assert result.exit_code == 0, result.output
+    assert_frame_equal(pd.read_csv(outdir / 'test-results.csv'), df_expected)
+
+
+def test_resume_stream_keep_raw_outputs(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that resuming a streamed run with --keep-raw-outputs reruns the stream stage to write the raw outputs"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    outdir = tmp_path / 'outdir'
+    runner = CliRunner()
+    args = ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir), '--prefix', 'test', '-t', '1',
+            '--stream']
+    result = runner.invoke(cli.main, args)
+    assert result.exit_code == 0, result.output
+    assert not (outdir / 'test-genes.fa').exists()
+    assert not (outdir / 'test-hmmsearch.output').exists()
+    result = runner.invoke(cli.main, args + ['--keep-raw-outputs', '--resume'])
+    assert result.exit_code == 0, result.output
+    assert (outdir / 'test-genes.fa').stat().st_size > 0
+    assert (outdir / 'test-hmmsearch.output').exists()
+
+    # the raw outputs are now part of the completed stage
+    failing_tool = '#!/usr/bin/env python\nimport sys\nsys.exit(1)\n'
+    fake_tool('prodigal', failing_tool)
+    fake_tool('hmmsearch', failing_tool)
+    result = runner.invoke(cli.main, args + ['--keep-raw-outputs', '--resume'])
+    assert result.exit_code == 0, result.output
+
+
+def test_files_hashed_once_per_run(tmp_path: Path, fake_tool, hmm_db: Path, monkeypatch):
+    """Test that checkpoint manifests hash each file at most once per run and the HMM DB via its cached digest"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    hashed = []
+    monkeypatch.setattr(checkpoint, 'file_digest', lambda path: hashed.append(Path(path).resolve()) or 'digest')
+    cached = []
+    monkeypatch.setattr(checkpoint, 'cached_file_digest', lambda path: cached.append(Path(path).resolve()) or 'db')
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    result = CliRunner().invoke(cli.main, ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o',
+                                           str(tmp_path / 'outdir'), '--prefix', 'test', '-t', '1'])
+    assert result.exit_code == 0, result.output
+    assert test_fasta in hashed
+    assert len(hashed) == len(set(hashed))
+    assert cached == [hmm_db.resolve()]
+
+
+def test_run_metrics(tmp_path: Path, fake_tool, hmm_db: Path):
+    """Test that per-stage run metrics and the cProfile stats are written"""
+    fake_tool('prodigal', PRODIGAL)
+    fake_tool('hmmsearch', HMMSEARCH)
+    test_fasta = Path('tests/data/test.fasta').resolve()
+    outdir = tmp_path / 'outdir'
+    result = CliRunner().invoke(cli.main, ['-i', str(test_fasta), '--hmm-db', str(hmm_db), '-o', str(outdir),
+                                           '--prefix', 'test', '-t', '1', '--profile', '--classified-length-stats'])
+    assert result.exit_code == 0, result.output
+    metrics = json.loads((outdir / 'test-run-metrics.json').read_text())
+    stages = {x['name']: x for x in metrics['stages']}
+    assert list(stages) == ['parse_contigs', 'prefilter', 'circularize', 'prodigal', 'filter', 'hmmsearch',
+                            'parse_domtblout', 'classify', 'output']
+    assert stages['parse_contigs']['counts']['contigs'] == 10
+    assert stages['filter']['counts']['proteins'] == stages['hmmsearch']['counts']['hmmsearch_proteins'] > 0
+    assert stages['prodigal']['child_cpu_seconds'] > 0
+    assert stages['output']['counts']['output_bytes'] > 0
+    df_stats = pd.read_csv(outdir / 'test-classified-length-stats.csv')
+    assert df_stats.n_contigs.sum() == 10
+    assert all(x['wall_seconds'] >= 0 and x['peak_rss_bytes'] > 0 and not x['skipped'] for x in stages.values())
+    assert metrics['wall_seconds'] >= sum(x['wall_seconds'] for x in stages.values())
+    assert pstats.Stats(str(outdir / 'test-profile.prof')).total_calls > 0
@@ -0,0 +1,154 @@
+"""In-memory Python API for classifying contigs without writing them to disk
+
+Contig sequences are streamed through Prodigal's stdin and the predicted proteins are filtered on the fly (see
+:func:`viral_verify.prodigal.prodigal_meta_stream`). Only the filtered proteins and the hmmsearch domain table are
+written to a temporary directory since hmmsearch requires a sequence file. Nothing else is written to disk.
+
+Examples
+--------
+>>> from viral_verify.api import classify
+>>> result = classify([('contig1', 'ATGC...'), ('contig2', 'GGCA...')], hmm_db='Pfam-A.hmm')  # doctest: +SKIP
+>>> result.classifications['contig1'].classification  # doctest: +SKIP
+'Virus'
+"""
+import logging
+import tempfile
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Iterable, Tuple, Union, Optional
+
+import attr
+
+from viral_verify.circularity import CircularityPolicy
+from viral_verify.contig import Contig
+from viral_verify.hmmsearch import top_hmm_results
+from viral_verify.hmmsearch.dedup import run_hmmsearch_unique, ProteinSearchSummary
+from viral_verify.hmmsearch.hit_cache import DomainHitCache
+from viral_verify.io import filter_predicted_gene_lines
+from viral_verify.naive_bayes import NaiveBayesClassification, load_classifier_table, CLASSIFIER_TABLE, \
+    DEFAULT_UNCERTAINTY_THRESHOLD
+from viral_verify.naive_bayes.compiled import CompiledClassifierTable
+from viral_verify.naive_bayes.vectorized import classify_contig_domains
+from viral_verify.prodigal import prodigal_meta_stream
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s
+class ClassificationResult:
+    """Naive Bayes classifications and top protein domains of classified contigs
+
+    Contigs without any protein domain hits are not classified and have no entry in `classifications` or
+    `contig_domains`.
+    """
+    classifications: Dict[str, NaiveBayesClassification] = attr.ib(factory=dict)
+    contig_domains: Dict[str, List[str]] = attr.ib(factory=dict)
+    search_summary: ProteinSearchSummary = attr.ib(factory=ProteinSearchSummary)
+
+
+def classify_contigs(contigs: Dict[str, Contig],
+                     hmm_db: Union[str, Path],
+                     classifier_table: Union[str, Path, CompiledClassifierTable] = CLASSIFIER_TABLE,
+                     uncertainty_threshold: float = DEFAULT_UNCERTAINTY_THRESHOLD,
+                     threads: int = 1,
+                     hit_cache: Optional[DomainHitCache] = None) -> ClassificationResult:
+    """Classify contigs by streaming their circularized sequences through Prodigal and searching the proteins
+
+    Parameters
+    ----------
+    contigs
+        Contig name to Contig with circularity info
+    hmm_db
+        Path to HMM DB
+    classifier_table
+        Naive Bayes classifier table path or an already loaded classifier table
+    uncertainty_threshold
+        Uncertainty threshold (natural log probability)
+    threads
+        Number of hmmsearch threads
+    hit_cache
+        Optional domain hit cache
+    """
+    if not isinstance(classifier_table, CompiledClassifierTable):
+        classifier_table = load_classifier_table(classifier_table)
+    if not contigs:
+        return ClassificationResult()
+    with tempfile.TemporaryDirectory(prefix='viral_verify-') as tmpdir:
+        proteins_fasta = Path(tmpdir) / 'proteins.fa'
+        tblout = Path(tmpdir) / 'hmmsearch.domtblout'
+        fasta_chunks = chain.from_iterable(x.iter_circular_seq_fasta() for x in contigs.values())
+        with open(proteins_fasta, 'w') as fout:
+            n_kept, n_total = filter_predicted_gene_lines(prodigal_meta_stream(fasta_chunks), fout, contigs)
+        logger.info(f'Kept {n_kept} of {n_total} Prodigal predicted proteins')
+        summary = run_hmmsearch_unique(hmm_db=hmm_db,
+                                       input_fasta=proteins_fasta,
+                                       raw_output=None,
+                                       tblout=tblout,
+                                       threads=threads,
+                                       hit_cache=hit_cache)
+        contig_domains, _ = top_hmm_results(tblout)
+    classifications = classify_contig_domains(contig_domains=contig_domains,
+                                              classifier_table=classifier_table,
+                                              uncertainty_threshold=uncertainty_threshold)
+    return ClassificationResult(classifications=classifications,
+                                contig_domains=dict(contig_domains),
+                                search_summary=summary)
+
+
+def classify(contigs: Iterable[Tuple[str, str]],
+             hmm_db: Union[str, Path],
+             classifier_table: Union[str, Path, CompiledClassifierTable] = CLASSIFIER_TABLE,
+             uncertainty_threshold: float = DEFAULT_UNCERTAINTY_THRESHOLD,
+             threads: int = 1,
+             hit_cache: Optional[DomainHitCache] = None,
+             circularity: CircularityPolicy = CircularityPolicy()) -> ClassificationResult:
+    """Classify in-memory contig sequences as viral, plasmid or chromosomal
+
+    Parameters
+    ----------
+    contigs
+        Contig ID and nucleotide sequence pairs. IDs must be unique and cannot contain whitespace.
+    hmm_db
+        Path to HMM DB
+    classifier_table
+        Naive Bayes classifier table path or an already loaded classifier table (see
+        :func:`viral_verify.naive_bayes.load_classifier_table`) to reuse across calls
+    uncertainty_threshold
+        Uncertainty threshold (natural log probability)
+    threads
+        Number of hmmsearch threads
+    hit_cache
+        Optional domain hit cache
+    circularity
+        Which contigs to check for circularity
+
+    Returns
+    -------
+    ClassificationResult
+        Classifications and top protein domains of contigs with protein domain hits
+
+    Raises
+    ------
+    ValueError
+        If contig IDs are duplicated, empty or contain whitespace
+    """
+    contig_infos: Dict[str, Contig] = {}
+    for name, seq in contigs:
+        if not name or any(c.isspace() for c in name):
+            raise ValueError(f'Invalid contig ID "{name}". Contig IDs cannot be empty or contain whitespace.')
+        if name in contig_infos:
+            raise ValueError(f'Duplicate contig ID "{name}"')
+        contig_infos[name] = Contig.from_sequence(name,
+                                                  seq,
+                                                  min_length=circularity.min_length,
+                                                  kmax=circularity.kmax,
+                                                  kmin=circularity.kmin,
+                                                  max_length=circularity.max_length)
+    logger.info(f'Classifying {len(contig_infos)} contigs '
+                f'({sum(x.is_circular for x in contig_infos.values())} potentially circular)')
+    return classify_contigs(contig_infos,
+                            hmm_db=hmm_db,
+                            classifier_table=classifier_table,
+                            uncertainty_threshold=uncertainty_threshold,
+                            threads=threads,
+                            hit_cache=hit_cache)
@@ -0,0 +1,140 @@
+"""Multi-sample batch runs with gene prediction and hmmsearch over the combined contigs of all samples
+
+Contig IDs are namespaced with the sample name (``<sample>|<contig>``) so that the contigs of all samples can be
+written to a single FASTA file for one Prodigal and one hmmsearch run. Results are split back per sample by the
+namespace.
+"""
+import csv
+import logging
+from pathlib import Path
+from typing import List, Dict, Union, Tuple, Mapping, TypeVar, IO
+
+import attr
+
+from viral_verify.contig import Contig
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE_SEP = '|'
+"""Separator between the sample name and contig ID in namespaced contig IDs"""
+
+T = TypeVar('T')
+
+
+@attr.s(frozen=True)
+class Sample:
+    """Sample name and input contigs FASTA path"""
+    name: str = attr.ib()
+    fasta: Path = attr.ib(converter=Path)
+
+    @name.validator
+    def _check_name(self, attribute, value: str):
+        if not value or NAMESPACE_SEP in value or '/' in value or value != value.strip() or \
+                any(c.isspace() for c in value):
+            raise ValueError(f'Invalid sample name "{value}". Sample names must be non-empty and cannot contain '
+                             f'whitespace, "/" or "{NAMESPACE_SEP}".')
+
+
+def read_sample_sheet(path: Union[str, Path]) -> List[Sample]:
+    """Read a tab- or comma-separated sample sheet with ``sample`` and ``fasta`` columns
+
+    Relative FASTA paths are relative to the directory of the sample sheet.
+
+    Raises
+    ------
+    ValueError
+        If the sample sheet is missing columns, has duplicate sample names or refers to missing FASTA files.
+    """
+    path = Path(path)
+    with open(path, newline='') as fh:
+        lines = [line for line in fh if line.strip() and not line.startswith('#')]
+    if not lines:
+        raise ValueError(f'Sample sheet "{path}" is empty')
+    delimiter = '\t' if '\t' in lines[0] else ','
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    if reader.fieldnames is None or not {'sample', 'fasta'} <= {x.strip() for x in reader.fieldnames}:
+        raise ValueError(f'Sample sheet "{path}" must have a header with "sample" and "fasta" columns')
+    samples: List[Sample] = []
+    for row in reader:
+        row = {k.strip(): (v or '').strip() for k, v in row.items() if k is not None}
+        fasta = Path(row['fasta'])
+        if not fasta.is_absolute():
+            fasta = path.parent / fasta
+        if not fasta.exists():
+            raise ValueError(f'FASTA file "{fasta}" of sample "{row["sample"]}" does not exist')
+        samples.append(Sample(name=row['sample'], fasta=fasta))
+    names = [x.name for x in samples]
+    duplicates = sorted({x for x in names if names.count(x) > 1})
+    if duplicates:
+        raise ValueError(f'Duplicate sample names in sample sheet "{path}": {", ".join(duplicates)}')
+    return samples
+
+
+def namespaced(sample: str, contig: str) -> str:
+    """Namespace a contig ID with a sample name
+
+    Examples
+    --------
+    >>> namespaced('sample1', 'k141_1')
+    'sample1|k141_1'
+    """
+    return f'{sample}{NAMESPACE_SEP}{contig}'
+
+
+def split_namespaced(name: str) -> Tuple[str, str]:
+    """Split a namespaced contig or gene ID into sample name and ID
+
+    Examples
+    --------
+    >>> split_namespaced('sample1|k141_1_2')
+    ('sample1', 'k141_1_2')
+    """
+    sample, _, contig = name.partition(NAMESPACE_SEP)
+    return sample, contig
+
+
+def namespaced_contigs(sample_contigs: Mapping[str, Mapping[str, Contig]]) -> Dict[str, Contig]:
+    """Combine the contigs of all samples keyed by namespaced contig ID"""
+    return {namespaced(sample, name): contig
+            for sample, contigs in sample_contigs.items()
+            for name, contig in contigs.items()}
+
+
+def write_namespaced_circular_contigs_fasta(sample_contigs: Mapping[str, Mapping[str, Contig]],
+                                            output_path: Union[str, Path, IO]) -> None:
+    """Write the circularized contigs of all samples to one FASTA file with namespaced contig IDs"""
+    with open(output_path, 'w') as fout:
+        for sample, contigs in sample_contigs.items():
+            for contig in contigs.values():
+                chunks = contig.iter_circular_seq_fasta()
+                fout.write(f'>{namespaced(sample, next(chunks)[1:])}')
+                fout.writelines(chunks)
+
+
+def split_by_sample(values: Mapping[str, T], samples: List[Sample]) -> Dict[str, Dict[str, T]]:
+    """Split a mapping keyed by namespaced ID into a mapping per sample keyed by ID"""
+    out: Dict[str, Dict[str, T]] = {x.name: {} for x in samples}
+    for key, value in values.items():
+        sample, name = split_namespaced(key)
+        out[sample][name] = value
+    return out
+
+
+def split_domtblout(tblout: Union[str, Path], sample_tblouts: Mapping[str, Path]) -> None:
+    """Split a domtblout of namespaced protein IDs into a domtblout per sample
+
+    Comment lines are copied to every sample domtblout. The namespace is removed from target names.
+    """
+    fouts = {sample: open(path, 'w') for sample, path in sample_tblouts.items()}
+    try:
+        with open(tblout) as fh:
+            for line in fh:
+                if line.startswith('#'):
+                    for fout in fouts.values():
+                        fout.write(line)
+                    continue
+                sample, line = split_namespaced(line)
+                fouts[sample].write(line)
+    finally:
+        for fout in fouts.values():
+            fout.close()
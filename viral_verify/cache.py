@@ -0,0 +1,84 @@
+"""Location and validation of on-disk caches derived from input files like the HMM DB"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Union, Any, Optional
+
+CACHE_DIR_ENV_VAR = 'VIRAL_VERIFY_CACHE_DIR'
+"""Environment variable to override the user-level cache directory"""
+DIGEST_SUFFIX = '.sha256.json'
+"""Suffix of the cached content digest sidecar file"""
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_fingerprint(path: Union[str, Path]) -> Dict[str, Any]:
+    """Identify a file by its resolved path, size and modification time"""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return dict(path=str(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """SHA-256 hex digest of the contents of a file"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached_file_digest(path: Union[str, Path]) -> str:
+    """SHA-256 hex digest of the contents of a large, rarely changing file like an HMM DB
+
+    The digest is cached in a sidecar file and only recomputed if the file path, size or modification time change.
+    """
+    fingerprint = file_fingerprint(path)
+    sidecar_path = cache_path(path, DIGEST_SUFFIX)
+    manifest = read_manifest(sidecar_path)
+    if manifest and manifest.get('source') == fingerprint and manifest.get('sha256'):
+        return manifest['sha256']
+    digest = file_digest(path)
+    try:
+        sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+        write_manifest(sidecar_path, dict(source=fingerprint, sha256=digest))
+    except OSError:
+        pass
+    return digest
+
+
+def user_cache_dir() -> Path:
+    """User-level cache directory (``$VIRAL_VERIFY_CACHE_DIR`` or ``$XDG_CACHE_HOME/viral_verify``)"""
+    if os.environ.get(CACHE_DIR_ENV_VAR):
+        return Path(os.environ[CACHE_DIR_ENV_VAR])
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'viral_verify'
+
+
+def cache_path(path: Union[str, Path], suffix: str) -> Path:
+    """Path for a cache file or directory derived from `path`
+
+    The cache is placed next to `path` if its directory is writable, otherwise under the user cache directory with
+    a name derived from the resolved path of `path`.
+    """
+    path = Path(path).resolve()
+    if os.access(path.parent, os.W_OK):
+        return path.parent / (path.name + suffix)
+    digest = hashlib.sha1(str(path).encode()).hexdigest()[:16]
+    return user_cache_dir() / f'{path.name}-{digest}{suffix}'
+
+
+def read_manifest(manifest_path: Path) -> Optional[Dict[str, Any]]:
+    """Read a JSON cache manifest returning None if it does not exist or cannot be parsed"""
+    try:
+        with open(manifest_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(manifest_path: Path, manifest: Dict[str, Any]) -> None:
+    """Atomically write a JSON cache manifest"""
+    tmp_path = manifest_path.with_name(f'.{manifest_path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w') as fout:
+        json.dump(manifest, fout, indent=2)
+    os.replace(tmp_path, manifest_path)
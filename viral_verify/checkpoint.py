@@ -0,0 +1,192 @@
+"""Per-stage checkpoint manifests for resuming interrupted runs
+
+Each pipeline stage records a JSON manifest with content hashes of its input and output files, its parameters and
+the versions of the external tools it ran. When resuming, a stage is skipped if its manifest matches the current
+inputs, parameters and tool versions and its outputs are unchanged since they were written.
+
+Content hashes of large files such as the input contigs and HMM DB are only recomputed if the file size or
+modification time differs from the recorded ones. Within a run, each file is hashed at most once and its hash is shared
+by all stages (see :class:`FileDigests`).
+"""
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union, Iterable, Set, Tuple
+
+import attr
+
+from viral_verify.cache import read_manifest, write_manifest, file_digest, cached_file_digest
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIRNAME = '.checkpoints'
+"""Directory within the output directory for stage manifests and intermediate results"""
+
+
+@attr.s
+class FileDigests:
+    """Per-run memo of file content hashes shared by all stages of a run
+
+    A file is only hashed again if its size or modification time changed. Files in `cached_paths` that rarely
+    change, like the HMM DB, are hashed with :func:`viral_verify.cache.cached_file_digest` so that their hash is also
+    reused across runs.
+    """
+    cached_paths: Set[str] = attr.ib(factory=set, converter=lambda xs: {str(Path(x).resolve()) for x in xs})
+    _memo: Dict[Tuple[str, int, int], str] = attr.ib(factory=dict, init=False)
+
+    def digest(self, path: Path, stat: os.stat_result) -> str:
+        """SHA-256 hex digest of a file with a given `stat` result"""
+        resolved = str(path.resolve())
+        key = (resolved, stat.st_size, stat.st_mtime_ns)
+        digest = self._memo.get(key)
+        if digest is None:
+            digest = cached_file_digest(path) if resolved in self.cached_paths else file_digest(path)
+            self._memo[key] = digest
+        return digest
+
+
+def file_record(path: Union[str, Path],
+                previous: Optional[Dict[str, Any]] = None,
+                digests: Optional[FileDigests] = None) -> Optional[Dict[str, Any]]:
+    """Size, modification time and content hash of a file or None if it does not exist
+
+    The content hash from a `previous` record is reused if the file size and modification time are unchanged,
+    otherwise it is taken from the per-run `digests` if given.
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        return previous
+    sha256 = digests.digest(path, stat) if digests is not None else file_digest(path)
+    return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+
+
+def write_json(path: Path, obj: Any) -> None:
+    """Atomically write an intermediate result to a JSON file"""
+    write_manifest(path, obj)
+
+
+def read_json(path: Path) -> Any:
+    """Read an intermediate result from a JSON file"""
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _same_content(a: Optional[Dict[str, Any]], b: Optional[Dict[str, Any]]) -> bool:
+    return a is not None and b is not None and a['sha256'] == b['sha256']
+
+
+@attr.s
+class Stage:
+    """Pipeline stage with a checkpoint manifest
+
+    Parameters
+    ----------
+    name
+        Stage name (manifest filename)
+    manifest_path
+        Path to the JSON stage manifest
+    inputs
+        Input files of the stage
+    params
+        JSON serializable stage parameters affecting the stage outputs
+    tool_versions
+        Versions of the external tools run in the stage
+    resume
+        Whether the stage can be skipped if its manifest matches
+    digests
+        Per-run file content hashes shared with the other stages of the run
+    """
+    name: str = attr.ib()
+    manifest_path: Path = attr.ib()
+    inputs: List[Path] = attr.ib(converter=lambda xs: [Path(x) for x in xs])
+    params: Dict[str, Any] = attr.ib(factory=dict)
+    tool_versions: Dict[str, Optional[str]] = attr.ib(factory=dict)
+    resume: bool = attr.ib(default=False)
+    digests: FileDigests = attr.ib(factory=FileDigests)
+    _manifest: Optional[Dict[str, Any]] = attr.ib(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        self._manifest = read_manifest(self.manifest_path)
+
+    def _input_records(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        previous = (self._manifest or {}).get('inputs', {})
+        return {str(x): file_record(x, previous.get(str(x)), self.digests) for x in self.inputs}
+
+    def is_complete(self) -> bool:
+        """Check if the stage can be skipped because it already completed with the same inputs and parameters"""
+        if not self.resume or self._manifest is None:
+            return False
+        manifest = self._manifest
+        if manifest.get('params') != self.params or manifest.get('tool_versions') != self.tool_versions:
+            logger.info(f'Stage "{self.name}" parameters or tool versions changed since the last run')
+            return False
+        inputs = self._input_records()
+        if set(inputs) != set(manifest.get('inputs', {})) or \
+                not all(_same_content(inputs[k], manifest['inputs'][k]) for k in inputs):
+            logger.info(f'Stage "{self.name}" inputs changed since the last run')
+            return False
+        for path, record in manifest.get('outputs', {}).items():
+            if not _same_content(file_record(path, record, self.digests), record):
+                logger.info(f'Stage "{self.name}" output "{path}" is missing or changed since the last run')
+                return False
+        return True
+
+    def complete(self, outputs: Iterable[Union[str, Path]]) -> None:
+        """Record that the stage completed writing `outputs`"""
+        write_manifest(self.manifest_path, dict(stage=self.name,
+                                                inputs=self._input_records(),
+                                                outputs={str(x): file_record(x, digests=self.digests)
+                                                         for x in outputs},
+                                                params=self.params,
+                                                tool_versions=self.tool_versions))
+
+
+@attr.s
+class Checkpoints:
+    """Stage manifests stored in the checkpoint directory of an output directory
+
+    Parameters
+    ----------
+    outdir
+        Output directory of the run
+    resume
+        Skip stages whose manifests match
+    cached_digest_paths
+        Large, rarely changing input files like the HMM DB whose content hashes are cached across runs (see
+        :class:`FileDigests`)
+    """
+    outdir: Path = attr.ib(converter=Path)
+    resume: bool = attr.ib(default=False)
+    cached_digest_paths: List[Union[str, Path]] = attr.ib(factory=list)
+    digests: FileDigests = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        self.digests = FileDigests(self.cached_digest_paths)
+
+    @property
+    def directory(self) -> Path:
+        return self.outdir / CHECKPOINT_DIRNAME
+
+    def path(self, filename: str) -> Path:
+        """Path to an intermediate result file in the checkpoint directory"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / filename
+
+    def stage(self,
+              name: str,
+              inputs: Iterable[Union[str, Path]],
+              params: Optional[Dict[str, Any]] = None,
+              tool_versions: Optional[Dict[str, Optional[str]]] = None) -> Stage:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return Stage(name=name,
+                     manifest_path=self.directory / f'{name}.json',
+                     inputs=inputs,
+                     params=params or {},
+                     tool_versions=tool_versions or {},
+                     resume=self.resume,
+                     digests=self.digests)
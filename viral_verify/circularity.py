@@ -0,0 +1,72 @@
+"""Detection of contigs with matching prefix and suffix sequences (potentially circular contigs)
+
+The longest overlap between the start and end of a contig is found in linear time with the prefix function (as in
+Knuth-Morris-Pratt string matching) of the contig start and end sequences joined by a separator. Only the first and
+last `kmax` bases of each contig are needed, so detection is cheap enough to run on every contig.
+"""
+from typing import List, Optional
+
+import attr
+
+#: Separator between the contig start and end sequences that cannot occur in nucleotide sequences
+SEPARATOR = '\x00'
+
+
+@attr.s(slots=True, frozen=True)
+class CircularityPolicy:
+    """Which contigs are checked for circularity and which prefix-suffix overlaps are accepted
+
+    Contigs of at least `min_length` and at most `max_length` (no limit if None) bases are checked. A contig is
+    considered circular if its longest prefix-suffix overlap of at most `kmax` bases (and shorter than the contig) is
+    longer than `kmin` bases.
+    """
+    min_length: int = attr.ib(default=500)
+    max_length: Optional[int] = attr.ib(default=None)
+    kmax: int = attr.ib(default=200)
+    kmin: int = attr.ib(default=50)
+
+    def applies_to(self, seq_len: int) -> bool:
+        return seq_len >= self.min_length and (self.max_length is None or seq_len <= self.max_length)
+
+    def max_overlap(self, seq_len: int) -> int:
+        return max(0, min(self.kmax, seq_len - 1))
+
+
+def prefix_function(s: str) -> List[int]:
+    """Length of the longest proper prefix of `s` that is also a suffix of `s[:i + 1]` for each position `i`
+
+    Examples
+    --------
+    >>> prefix_function('abcabcd')
+    [0, 0, 0, 1, 2, 3, 0]
+    """
+    pi = [0] * len(s)
+    k = 0
+    for i in range(1, len(s)):
+        c = s[i]
+        while k and s[k] != c:
+            k = pi[k - 1]
+        if s[k] == c:
+            k += 1
+        pi[i] = k
+    return pi
+
+
+def end_overlap(start: str, end: str, kmin: int = 0) -> int:
+    """Length of the longest prefix of `start` that is a suffix of `end` if it is longer than `kmin`, otherwise 0
+
+    `start` and `end` are the first and last bases of a sequence. The prefix function of ``start + SEPARATOR + end``
+    is only computed if the first ``kmin + 1`` bases of `start` occur in `end`, which is necessary for any overlap
+    longer than `kmin`.
+
+    Examples
+    --------
+    >>> end_overlap('ACGTTT', 'GGACGT')
+    4
+    >>> end_overlap('ACGTTT', 'GGACGT', kmin=4)
+    0
+    """
+    if kmin >= len(start) or start[:kmin + 1] not in end:
+        return 0
+    k = prefix_function(f'{start}{SEPARATOR}{end}')[-1]
+    return k if k > kmin else 0
@@ -0,0 +1,224 @@
+"""Streaming writer of classified contigs to a FASTA file per classification
+
+Each classification output file has its own writer thread fed through a bounded queue so that the class files are
+written concurrently while contigs are dispatched as their classification becomes known. Only contig locations are
+queued: sequences are copied from the memory-mapped input FASTA file as raw bytes by byte offset (keeping the input
+line wrapping) in chunks of :data:`viral_verify.contig.CHUNK_SIZE` bytes. Contigs with irregular input line layouts or
+in-memory sequences are written with sequence lines wrapped at 60 characters like Biopython. Optionally, the files are
+BGZF compressed by a pool of compression threads shared by all files (see :class:`viral_verify.compression.BgzfWriter`).
+"""
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Dict, List, Optional, IO, Union
+
+import attr
+
+from viral_verify.compression import open_binary_output
+from viral_verify.contig import Contig, CHUNK_SIZE
+from viral_verify.naive_bayes.constants import Classification
+
+logger = logging.getLogger(__name__)
+
+#: Classification output file suffixes in the order the output files are listed
+CLASS_SUFFIXES = ('viral', 'plasmid', 'chromosome', 'viral_uncertain', 'plasmid_uncertain', 'unclassified')
+#: Maximum number of contigs queued per classification output file
+MAX_QUEUED_CONTIGS = 1024
+#: Sequence line length of contigs that cannot be copied as raw bytes
+FASTA_WRAP = 60
+
+_DONE = object()
+
+
+def classification_suffix(classification: str, output_plasmids_separately: bool) -> str:
+    """Output file suffix of a classification
+
+    Plasmid and uncertain plasmid or chromosomal contigs are output with chromosomal contigs unless
+    `output_plasmids_separately`.
+    """
+    if classification == Classification.VIRUS:
+        return 'viral'
+    if classification == Classification.CHROMOSOME:
+        return 'chromosome'
+    if classification == Classification.PLASMID:
+        return 'plasmid' if output_plasmids_separately else 'chromosome'
+    if classification == Classification.UNCERTAIN_VIRAL_OR_BACTERIAL:
+        return 'viral_uncertain'
+    if classification == Classification.UNCERTAIN_PLASMID_OR_CHROMOSOMAL:
+        return 'plasmid_uncertain' if output_plasmids_separately else 'chromosome'
+    return 'unclassified'
+
+
+@attr.s(slots=True)
+class LengthStats:
+    """Sequence length statistics of the contigs written to a classification output file"""
+    n_contigs: int = attr.ib(default=0)
+    total_length: int = attr.ib(default=0)
+    min_length: int = attr.ib(default=0)
+    max_length: int = attr.ib(default=0)
+    lengths: List[int] = attr.ib(factory=list, repr=False)
+
+    def add(self, length: int) -> None:
+        self.min_length = length if self.n_contigs == 0 else min(self.min_length, length)
+        self.max_length = max(self.max_length, length)
+        self.n_contigs += 1
+        self.total_length += length
+        self.lengths.append(length)
+
+    @property
+    def mean_length(self) -> float:
+        return self.total_length / self.n_contigs if self.n_contigs else 0.0
+
+    @property
+    def n50(self) -> int:
+        """Length of the shortest contig among the longest contigs making up at least half of the total length"""
+        acc = 0
+        for length in sorted(self.lengths, reverse=True):
+            acc += length
+            if 2 * acc >= self.total_length:
+                return length
+        return 0
+
+    def to_dict(self) -> Dict[str, Union[int, float]]:
+        return dict(n_contigs=self.n_contigs,
+                    total_length=self.total_length,
+                    min_length=self.min_length,
+                    max_length=self.max_length,
+                    mean_length=round(self.mean_length, 1),
+                    n50=self.n50)
+
+
+def write_contig_fasta_entry(contig: Contig, fout: IO[bytes], description: Optional[str] = None) -> None:
+    """Write the FASTA entry of a contig to a binary handle
+
+    The sequence lines are copied as raw bytes from the input FASTA file if it has a regular line layout.
+    """
+    fout.write(f'>{description or contig.description}\n'.encode())
+    if contig.fasta is not None and contig.sequence is None and contig.line_bases:
+        for i in range(0, contig.byte_len, CHUNK_SIZE):
+            chunk = contig.fasta.raw(contig, i, i + CHUNK_SIZE)
+            fout.write(chunk)
+        if contig.byte_len and not chunk.endswith(b'\n'):
+            fout.write(b'\n')
+        return
+    chunk_size = CHUNK_SIZE - CHUNK_SIZE % FASTA_WRAP
+    for i in range(0, contig.seq_len, chunk_size):
+        seq = contig.seq(i, i + chunk_size).encode()
+        fout.write(b''.join(seq[j:j + FASTA_WRAP] + b'\n' for j in range(0, len(seq), FASTA_WRAP)))
+
+
+class _ClassFile:
+    """Output file of a classification written by a worker thread from a queue of contigs"""
+
+    def __init__(self,
+                 path: Path,
+                 executor: ThreadPoolExecutor,
+                 length_stats: bool,
+                 threads: int = 1,
+                 compress_executor: Optional[ThreadPoolExecutor] = None):
+        self.path = path
+        self.threads = threads
+        self.compress_executor = compress_executor
+        self.queue: queue.Queue = queue.Queue(maxsize=MAX_QUEUED_CONTIGS)
+        self.stats: Optional[LengthStats] = LengthStats() if length_stats else None
+        self.future: Future = executor.submit(self._drain)
+
+    def _drain(self) -> None:
+        with open_binary_output(self.path, threads=self.threads, executor=self.compress_executor) as fout:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    return
+                contig, description = item
+                write_contig_fasta_entry(contig, fout, description)
+                if self.stats is not None:
+                    self.stats.add(contig.seq_len)
+
+    def put(self, item) -> None:
+        """Queue an item, raising the worker error if the worker thread stopped"""
+        while True:
+            if self.future.done():
+                self.future.result()
+                raise RuntimeError(f'Writer of "{self.path}" stopped before all contigs were written')
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self) -> None:
+        """Signal the worker thread that all contigs were queued; its errors are raised by `future.result()`"""
+        try:
+            self.put(_DONE)
+        except Exception:
+            pass
+
+
+class ClassifiedFastaWriter:
+    """Write classified contigs to a FASTA file per classification with a writer thread per file
+
+    Output files are created when the first contig of their classification is written. If `compress`, the files are
+    BGZF compressed (``.fasta.gz``) with `threads` compression threads.
+
+    Examples
+    --------
+    >>> with ClassifiedFastaWriter(outdir, prefix) as writer:  # doctest: +SKIP
+    ...     for name, contig in contigs.items():
+    ...         writer.write(contig, classification_suffix(classifications[name].classification, False))
+    >>> writer.paths  # doctest: +SKIP
+    """
+
+    def __init__(self, outdir: Path, prefix: str, length_stats: bool = False, compress: bool = False, threads: int = 1):
+        self.outdir = Path(outdir)
+        self.prefix = prefix
+        self.length_stats = length_stats
+        self.compress = compress
+        self.threads = threads
+        self._files: Dict[str, _ClassFile] = {}
+        self._executor = ThreadPoolExecutor(max_workers=len(CLASS_SUFFIXES), thread_name_prefix='classified-fasta')
+        self._compress_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bgzf') \
+            if compress and threads > 1 else None
+
+    def write(self, contig: Contig, suffix: str, description: Optional[str] = None) -> None:
+        """Queue a contig to be written to the output file of a classification `suffix` (see :data:`CLASS_SUFFIXES`)
+
+        `description` replaces the FASTA header of the contig if given.
+        """
+        class_file = self._files.get(suffix)
+        if class_file is None:
+            if suffix not in CLASS_SUFFIXES:
+                raise ValueError(f'Unknown classification output suffix "{suffix}". Expected one of {CLASS_SUFFIXES}')
+            path = self.outdir / f'{self.prefix}-{suffix}.fasta{".gz" if self.compress else ""}'
+            class_file = _ClassFile(path, self._executor, self.length_stats, self.threads, self._compress_executor)
+            self._files[suffix] = class_file
+        class_file.put((contig, description))
+
+    def close(self) -> None:
+        """Wait for all queued contigs to be written, raising the first writer error"""
+        try:
+            for class_file in self._files.values():
+                class_file.finish()
+            for class_file in self._files.values():
+                class_file.future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+            if self._compress_executor is not None:
+                self._compress_executor.shutdown(wait=True)
+
+    def __enter__(self) -> 'ClassifiedFastaWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def paths(self) -> List[Path]:
+        """Paths of the written output files in :data:`CLASS_SUFFIXES` order"""
+        return [self._files[x].path for x in CLASS_SUFFIXES if x in self._files]
+
+    @property
+    def stats(self) -> Dict[str, LengthStats]:
+        """Sequence length statistics per classification output suffix if `length_stats`"""
+        return {x: self._files[x].stats for x in CLASS_SUFFIXES
+                if x in self._files and self._files[x].stats is not None}
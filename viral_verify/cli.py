@@ -1,41 +1,134 @@
 """Console script for viral_verify."""
+import contextlib
 import logging
 import multiprocessing
 import sys
+import tempfile
+from itertools import chain
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 
+import attr
 import click
 
+from viral_verify.batch import read_sample_sheet, namespaced_contigs, write_namespaced_circular_contigs_fasta, \
+    split_by_sample, split_domtblout
+from viral_verify.circularity import CircularityPolicy
+from viral_verify.checkpoint import Checkpoints, read_json, write_json
+from viral_verify.compression import uncompressed_name
 from viral_verify.contig import Contig
-from viral_verify.hmmsearch import top_hmm_results, run_hmmsearch
+from viral_verify.hmm_index import load_hmm_names_to_desc
+from viral_verify.hmmsearch import top_hmm_results, DEFAULT_CPUS_PER_WORKER, hmmsearch_version
+from viral_verify.hmmsearch.dedup import run_hmmsearch_unique, ProteinSearchSummary
+from viral_verify.hmmsearch.hit_cache import DomainHitCache
 from viral_verify.io import parse_contigs, write_circular_contigs_fasta, filter_predicted_genes, \
-    output_classified_contigs, output_results_table, hmm_names_to_desc
+    output_classified_contigs, output_results_table, filter_predicted_gene_lines
 from viral_verify.log import init_logging
-from viral_verify.naive_bayes import naive_bayes_classification, DEFAULT_UNCERTAINTY_THRESHOLD, CLASSIFIER_TABLE
-from viral_verify.prodigal import prodigal_meta
+from viral_verify.metrics import RunMetrics, file_size
+from viral_verify.prefilter import ContigFilter, prefilter_contigs, filter_min_genes, skip_summary
+from viral_verify.naive_bayes import naive_bayes_classification, DEFAULT_UNCERTAINTY_THRESHOLD, CLASSIFIER_TABLE, \
+    compile_classifier_table, NaiveBayesClassification
+from viral_verify.prodigal import prodigal_meta, prodigal_meta_stream, prodigal_version
+from viral_verify.results import RESULTS_FORMATS, results_path, require_pyarrow
+from viral_verify.server import ServiceState, JobQueue, make_server
 
 logger = logging.getLogger(__name__)
 
+hmm_db_option = click.option(
+    '-H', '--hmm-db', type=click.Path(exists=True), required=True,
+    help='Path to Pfam-A HMM database')
+threads_option = click.option(
+    '-t', '--threads', type=int, default=multiprocessing.cpu_count(),
+    help=f'Number of threads (default={multiprocessing.cpu_count()})')
+output_plasmids_separately_option = click.option(
+    '-p', '--output-plasmids-separately', is_flag=True,
+    help='Output predicted plasmids separately?')
+uncertainty_threshold_option = click.option(
+    '--uncertainty-threshold', type=float, default=DEFAULT_UNCERTAINTY_THRESHOLD,
+    help=f'Uncertainty threshold (Natural log probability) (default={DEFAULT_UNCERTAINTY_THRESHOLD})')
+classifier_table_option = click.option(
+    '--naive-bayes-classifier-table', type=click.Path(exists=True), default=CLASSIFIER_TABLE,
+    help=f'Table of protein domain frequencies to use for Naive Bayes classification (default="{CLASSIFIER_TABLE}")')
+hmmsearch_sharding_option = click.option(
+    '--hmmsearch-sharding', type=click.Choice(['none', 'sequence', 'profile']), default='none',
+    help='Split hmmsearch into multiple processes over shards of the predicted proteins ("sequence") or cached '
+         'shards of the HMM DB profiles ("profile") (default=none)')
+hmmsearch_cpus_per_worker_option = click.option(
+    '--hmmsearch-cpus-per-worker', type=int, default=DEFAULT_CPUS_PER_WORKER,
+    help=f'Number of threads per hmmsearch process with sharding (default={DEFAULT_CPUS_PER_WORKER})')
+hmmsearch_shards_option = click.option(
+    '--hmmsearch-shards', type=int, default=None,
+    help='Number of shards for sharded hmmsearch (default: 4 per hmmsearch process with "sequence" and 1 per '
+         'hmmsearch process with "profile" sharding)')
+hit_cache_option = click.option(
+    '--hit-cache', type=click.Path(dir_okay=False), default=None,
+    help='SQLite database of cached hmmsearch domain hits per protein sequence. Only proteins not found in the cache '
+         'are searched with hmmsearch and the cache is updated with their domain hits (default: no cache)')
+circular_min_length_option = click.option(
+    '--circular-min-length', type=int, default=500,
+    help='Minimum contig length to check for matching ends (potentially circular contigs) (default=500)')
+circular_max_length_option = click.option(
+    '--circular-max-length', type=int, default=None,
+    help='Maximum contig length to check for matching ends (default: no limit)')
+circular_kmax_option = click.option(
+    '--circular-kmax', type=int, default=200,
+    help='Maximum length of matching contig ends (default=200)')
+circular_kmin_option = click.option(
+    '--circular-kmin', type=int, default=50,
+    help='Matching contig ends must be longer than this to consider a contig circular (default=50)')
+results_format_option = click.option(
+    '--results-format', type=click.Choice(list(RESULTS_FORMATS)), default='csv',
+    help='Results table format: CSV, TSV, newline-delimited JSON or Parquet (requires pyarrow) (default=csv)')
+compress_output_option = click.option(
+    '--compress-output', is_flag=True,
+    help='BGZF compress the classified contigs FASTA output files (".fasta.gz") with multiple threads')
+verbose_option = click.option('-v', '--verbose', default=2, count=True, help='Logging verbosity')
+
 
 @click.command()
 @click.option('-i', '--input-fasta', type=click.Path(exists=True),
-              required=True, help='Input fasta file')
+              required=True,
+              help='Input fasta file. gzip, BGZF or Zstandard compressed input is decompressed once to a temporary '
+                   'file in $TMPDIR, which needs space for the uncompressed file')
 @click.option('-o', '--outdir', type=click.Path(exists=False, writable=True),
               required=True, help='Output directory')
-@click.option('-H', '--hmm-db', type=click.Path(exists=True),
-              required=True, help='Path to Pfam-A HMM database')
-@click.option('-t', '--threads', type=int, default=multiprocessing.cpu_count(),
-              help=f'Number of threads (default={multiprocessing.cpu_count()})')
-@click.option('-p', '--output-plasmids-separately', is_flag=True,
-              help='Output predicted plasmids separately?')
+@hmm_db_option
+@threads_option
+@output_plasmids_separately_option
 @click.option('--prefix', default=None, help='Output file prefix (default: None)')
-@click.option('--uncertainty-threshold', type=float, default=DEFAULT_UNCERTAINTY_THRESHOLD,
-              help=f'Uncertainty threshold (Natural log probability) (default={DEFAULT_UNCERTAINTY_THRESHOLD})')
-@click.option('--naive-bayes-classifier-table', type=click.Path(exists=True), default=CLASSIFIER_TABLE,
-              help=f'Table of protein domain frequencies to use for Naive Bayes classification '
-                   f'(default="{CLASSIFIER_TABLE}")')
-@click.option('-v', '--verbose', default=2, count=True, help='Logging verbosity')
+@uncertainty_threshold_option
+@classifier_table_option
+@hmmsearch_sharding_option
+@hmmsearch_cpus_per_worker_option
+@hmmsearch_shards_option
+@hit_cache_option
+@circular_min_length_option
+@circular_max_length_option
+@circular_kmax_option
+@circular_kmin_option
+@results_format_option
+@compress_output_option
+@click.option('--min-contig-length', type=int, default=0,
+              help='Skip gene prediction and hmmsearch for contigs shorter than this (default=0)')
+@click.option('--min-genes', type=int, default=0,
+              help='Skip hmmsearch for contigs with fewer predicted genes than this (default=0)')
+@click.option('--max-n-fraction', type=float, default=1.0,
+              help='Skip gene prediction and hmmsearch for contigs with a greater fraction of N bases than this '
+                   '(default=1.0)')
+@click.option('--classified-length-stats', is_flag=True,
+              help='Write the number of contigs and the total, min, max, mean and N50 contig length of each '
+                   'classification to "<prefix>-classified-length-stats.csv"')
+@click.option('--stream', is_flag=True,
+              help='Stream circularized contigs through Prodigal and filter predicted proteins on the fly without '
+                   'writing intermediate files to the output directory')
+@click.option('--keep-raw-outputs', is_flag=True,
+              help='With --stream, also output Prodigal gene coordinates and raw hmmsearch output')
+@click.option('--resume', is_flag=True,
+              help='Resume a previous run in the same output directory, skipping stages that already completed with '
+                   'the same inputs, parameters and tool versions')
+@click.option('--profile', is_flag=True,
+              help='Save cProfile stats of the Python code run in each stage to "<prefix>-profile.prof"')
+@verbose_option
 @click.version_option()
 def main(input_fasta: str,
          outdir: str,
@@ -45,79 +138,584 @@ def main(input_fasta: str,
          prefix: Optional[str],
          uncertainty_threshold: float,
          naive_bayes_classifier_table: str,
+         hmmsearch_sharding: str,
+         hmmsearch_cpus_per_worker: int,
+         hmmsearch_shards: Optional[int],
+         hit_cache: Optional[str],
+         circular_min_length: int,
+         circular_max_length: Optional[int],
+         circular_kmax: int,
+         circular_kmin: int,
+         results_format: str,
+         compress_output: bool,
+         min_contig_length: int,
+         min_genes: int,
+         max_n_fraction: float,
+         classified_length_stats: bool,
+         stream: bool,
+         keep_raw_outputs: bool,
+         resume: bool,
+         profile: bool,
          verbose: int):
     """HMM and Naive Bayes classification of contig sequences as either viral, plasmid or chromosomal.
 
     Requires Prodigal for gene prediction and hmmsearch from HMMer3 for searching for Pfam HMM profiles.
+
+    Wall and CPU time, peak memory and input/output counts of each stage are written to "<prefix>-run-metrics.json".
+
+    Contigs skipped by the pre-filters (--min-contig-length, --min-genes and --max-n-fraction) are not classified but
+    are reported with their skip reason in the results CSV and the unclassified contigs FASTA output.
     """
     init_logging(verbose)
+    _check_results_format(results_format)
     input_fasta_path = Path(input_fasta).resolve()
     outdir_path = Path(outdir)
-    outdir_path.mkdir(parents=True)
+    outdir_path.mkdir(parents=True, exist_ok=resume)
     if prefix:
         logger.info(f'Output file prefix="{prefix}"')
     else:
-        prefix = input_fasta_path.stem
+        prefix = Path(uncompressed_name(input_fasta_path)).stem
         logger.info(f'Output file prefix not specified. Using input FASTA filename as prefix ("{prefix}")')
+    metrics = RunMetrics(profile=profile)
+
+    with metrics.stage('parse_contigs') as stage_metrics:
+        logger.info(f'Parsing contig sequences from "{input_fasta}" and determine if any could be circular')
+        contig_infos: Dict[str, Contig] = parse_contigs(input_fasta,
+                                                        min_length=circular_min_length,
+                                                        kmax=circular_kmax,
+                                                        kmin=circular_kmin,
+                                                        max_length=circular_max_length,
+                                                        threads=threads)
+        n_circular = sum(x.is_circular for x in contig_infos.values())
+        logger.info(f'Parsed {len(contig_infos)} contigs from "{input_fasta}" ({n_circular} potentially circular)')
+        stage_metrics.counts.update(input_bytes=file_size(input_fasta_path),
+                                    contigs=len(contig_infos),
+                                    circular_contigs=n_circular,
+                                    bases=sum(x.seq_len for x in contig_infos.values()))
+    contig_filter = ContigFilter(min_length=min_contig_length,
+                                 min_genes=min_genes,
+                                 max_n_fraction=max_n_fraction)
+    with metrics.stage('prefilter') as stage_metrics:
+        search_contigs, skip_reasons = prefilter_contigs(contig_infos, contig_filter)
+        if min_contig_length > 0 or max_n_fraction < 1.0:
+            logger.info(f'Skipping gene prediction and hmmsearch for {len(skip_reasons)} contigs shorter than '
+                        f'{min_contig_length} bp or with more than {max_n_fraction:.1%} N bases')
+        stage_metrics.counts.update(contigs=len(search_contigs), **skip_summary(contig_infos, skip_reasons))
+    checkpoints = Checkpoints(outdir_path, resume=resume, cached_digest_paths=[hmm_db])
+    circular_params = dict(min_length=circular_min_length,
+                           max_length=circular_max_length,
+                           kmax=circular_kmax,
+                           kmin=circular_kmin)
+    prefilter_params = dict(min_length=min_contig_length, max_n_fraction=max_n_fraction)
+    min_genes_skips_json = checkpoints.path('skipped-min-genes.json')
+    hmmsearch_tblout = outdir_path / (prefix + '-hmmsearch.domtblout')
+    if not search_contigs:
+        empty_outputs = [hmmsearch_tblout] if stream else [outdir_path / (prefix + '-proteins-circularized.fa'),
+                                                           hmmsearch_tblout]
+        logger.warning(f'Pre-filters skipped all {len(contig_infos)} contigs. Skipping Prodigal gene prediction and '
+                       f'hmmsearch. Writing empty outputs: {", ".join(str(x) for x in empty_outputs)}')
+        for path in empty_outputs:
+            path.write_text('')
+        min_genes_skips: Dict[str, str] = {}
+    elif stream:
+        genes_fasta_path: Optional[Path] = outdir_path / (prefix + '-genes.fa') if keep_raw_outputs else None
+        hmmsearch_raw_output: Optional[Path] = outdir_path / (prefix + '-hmmsearch.output') if keep_raw_outputs \
+            else None
+        with metrics.stage('prodigal_hmmsearch_stream') as stage_metrics:
+            stage = checkpoints.stage('hmmsearch',
+                                      inputs=[input_fasta_path, hmm_db],
+                                      params=dict(stream=True, circular=circular_params,
+                                                  prefilter=prefilter_params, min_genes=min_genes,
+                                                  keep_raw_outputs=keep_raw_outputs),
+                                      tool_versions=dict(prodigal=prodigal_version(), hmmsearch=hmmsearch_version()))
+            if stage.is_complete():
+                logger.info(f'Resuming: skipping streamed Prodigal gene prediction and hmmsearch. '
+                            f'Using hmmsearch tabular output "{hmmsearch_tblout}"')
+                min_genes_skips = read_json(min_genes_skips_json)
+                stage_metrics.skipped = True
+            else:
+                with tempfile.TemporaryDirectory(prefix=f'{prefix}-viral_verify-') as tmpdir:
+                    filtered_proteins_path = Path(tmpdir) / (prefix + '-proteins-circularized.fa')
+                    logger.info(f'Streaming circularized contig sequences through Prodigal gene prediction and '
+                                f'filtering out genes predicted over the expected end of each contig to '
+                                f'"{filtered_proteins_path}"')
+                    fasta_chunks = chain.from_iterable(x.iter_circular_seq_fasta() for x in search_contigs.values())
+                    protein_lines = prodigal_meta_stream(fasta_chunks, genes_output=genes_fasta_path)
+                    with open(filtered_proteins_path, 'w') as fout:
+                        n_kept, n_total = filter_predicted_gene_lines(protein_lines, fout, search_contigs)
+                    logger.info(f'Kept {n_kept} of {n_total} Prodigal predicted proteins')
+                    min_genes_skips, n_removed = _filter_min_genes(filtered_proteins_path, search_contigs, min_genes,
+                                                                   min_genes_skips_json)
+                    summary = _hmmsearch(hmm_db=hmm_db,
+                                         input_fasta=filtered_proteins_path,
+                                         raw_output=hmmsearch_raw_output,
+                                         tblout=hmmsearch_tblout,
+                                         threads=threads,
+                                         sharding=hmmsearch_sharding,
+                                         cpus_per_worker=hmmsearch_cpus_per_worker,
+                                         n_shards=hmmsearch_shards,
+                                         hit_cache=hit_cache)
+                stage.complete(x for x in [hmmsearch_tblout, genes_fasta_path, hmmsearch_raw_output,
+                                           min_genes_skips_json] if x)
+                stage_metrics.counts.update(predicted_proteins=n_total,
+                                            proteins=n_kept - n_removed,
+                                            min_genes_skipped_proteins=n_removed,
+                                            **_search_summary_counts(summary),
+                                            output_bytes=file_size(hmmsearch_tblout))
+    else:
+        input_fasta_circularized: Path = outdir_path / (prefix + "-circularized.fasta")
+        with metrics.stage('circularize') as stage_metrics:
+            stage = checkpoints.stage('circularize', inputs=[input_fasta_path],
+                                      params=dict(**circular_params, prefilter=prefilter_params))
+            if stage.is_complete():
+                logger.info(f'Resuming: using circularized contig sequences "{input_fasta_circularized}"')
+                stage_metrics.skipped = True
+            else:
+                logger.info(f'Writing circularized contig sequences to "{input_fasta_circularized}"')
+                write_circular_contigs_fasta(search_contigs, input_fasta_circularized)
+                stage.complete([input_fasta_circularized])
+                stage_metrics.counts.update(contigs=len(search_contigs),
+                                            output_bytes=file_size(input_fasta_circularized))
+
+        proteins_fasta_path: Path = outdir_path / (prefix + '-proteins.fa')
+        genes_fasta_path = outdir_path / (prefix + '-genes.fa')
+        with metrics.stage('prodigal') as stage_metrics:
+            stage = checkpoints.stage('prodigal',
+                                      inputs=[input_fasta_circularized],
+                                      tool_versions=dict(prodigal=prodigal_version()))
+            if stage.is_complete():
+                logger.info(f'Resuming: using Prodigal output "{proteins_fasta_path}" and "{genes_fasta_path}"')
+                stage_metrics.skipped = True
+            else:
+                logger.info(f'Running Prodigal gene prediction on "{input_fasta_circularized}"')
+                prodigal_meta(input_fasta=input_fasta_circularized,
+                              genes_fasta=genes_fasta_path,
+                              proteins_fasta=proteins_fasta_path,
+                              threads=threads)
+                logger.info(f'Prodigal protein sequence output at "{proteins_fasta_path}"')
+                logger.info(f'Prodigal nucleotide sequence output at "{genes_fasta_path}"')
+                stage.complete([proteins_fasta_path, genes_fasta_path])
+                stage_metrics.counts.update(input_bytes=file_size(input_fasta_circularized),
+                                            output_bytes=file_size(proteins_fasta_path) + file_size(genes_fasta_path))
+
+        filtered_proteins_path = outdir_path / (prefix + "-proteins-circularized.fa")
+        with metrics.stage('filter') as stage_metrics:
+            stage = checkpoints.stage('filter', inputs=[proteins_fasta_path, input_fasta_path],
+                                      params=dict(prefilter=prefilter_params, min_genes=min_genes))
+            if stage.is_complete():
+                logger.info(f'Resuming: using filtered Prodigal proteins "{filtered_proteins_path}"')
+                min_genes_skips = read_json(min_genes_skips_json)
+                stage_metrics.skipped = True
+            else:
+                logger.info(f'Filtering out genes predicted over the end of the expected end of each contig. '
+                            f'Output at "{filtered_proteins_path}"')
+                n_kept, n_total = filter_predicted_genes(proteins_fasta_path, filtered_proteins_path, search_contigs)
+                logger.info(f'Kept {n_kept} of {n_total} Prodigal predicted proteins')
+                min_genes_skips, n_removed = _filter_min_genes(filtered_proteins_path, search_contigs, min_genes,
+                                                               min_genes_skips_json)
+                stage.complete([filtered_proteins_path, min_genes_skips_json])
+                stage_metrics.counts.update(predicted_proteins=n_total,
+                                            proteins=n_kept - n_removed,
+                                            min_genes_skipped_proteins=n_removed,
+                                            output_bytes=file_size(filtered_proteins_path))
+
+        hmmsearch_raw_output = outdir_path / (prefix + '-hmmsearch.output')
+        with metrics.stage('hmmsearch') as stage_metrics:
+            stage = checkpoints.stage('hmmsearch',
+                                      inputs=[filtered_proteins_path, hmm_db],
+                                      params=dict(stream=False),
+                                      tool_versions=dict(hmmsearch=hmmsearch_version()))
+            if stage.is_complete():
+                logger.info(f'Resuming: using hmmsearch tabular output "{hmmsearch_tblout}"')
+                stage_metrics.skipped = True
+            else:
+                summary = _hmmsearch(hmm_db=hmm_db,
+                                     input_fasta=filtered_proteins_path,
+                                     raw_output=hmmsearch_raw_output,
+                                     tblout=hmmsearch_tblout,
+                                     threads=threads,
+                                     sharding=hmmsearch_sharding,
+                                     cpus_per_worker=hmmsearch_cpus_per_worker,
+                                     n_shards=hmmsearch_shards,
+                                     hit_cache=hit_cache)
+                stage.complete([hmmsearch_tblout, hmmsearch_raw_output])
+                stage_metrics.counts.update(**_search_summary_counts(summary),
+                                            output_bytes=file_size(hmmsearch_tblout))
+
+    contig_domains_json = checkpoints.path('contig-domains.json')
+    with metrics.stage('parse_domtblout') as stage_metrics:
+        stage = checkpoints.stage('parse', inputs=[hmmsearch_tblout])
+        if stage.is_complete():
+            logger.info(f'Resuming: using top protein domains per contig "{contig_domains_json}"')
+            contig_domains = read_json(contig_domains_json)
+            stage_metrics.skipped = True
+        else:
+            logger.info(f'Parsing hmmsearch tabular output "{hmmsearch_tblout}"')
+            contig_domains, top_domains = top_hmm_results(hmmsearch_tblout)
+            n_top_domains = sum(len(vs) for vs in top_domains.values())
+            logger.info(f'Parsed {n_top_domains} protein domain results for '
+                        f'{len(top_domains)} contigs (out of {len(contig_infos)} total contigs) from hmmsearch tabular '
+                        f'output "{hmmsearch_tblout}"')
+            logger.debug(f'Top domains={top_domains}')
+            write_json(contig_domains_json, contig_domains)
+            stage.complete([contig_domains_json])
+            stage_metrics.counts.update(input_bytes=file_size(hmmsearch_tblout),
+                                        proteins_with_hits=len(top_domains),
+                                        top_domain_hits=n_top_domains,
+                                        contigs_with_hits=len(contig_domains))
+    logger.debug(f'Contig domains={contig_domains}')
+
+    classifications_json = checkpoints.path('classifications.json')
+    with metrics.stage('classify') as stage_metrics:
+        stage = checkpoints.stage('classify',
+                                  inputs=[contig_domains_json, naive_bayes_classifier_table],
+                                  params=dict(uncertainty_threshold=uncertainty_threshold))
+        if stage.is_complete():
+            logger.info(f'Resuming: using Naive Bayes classifications "{classifications_json}"')
+            contig_classifications = {x['contig_name']: NaiveBayesClassification(**x)
+                                      for x in read_json(classifications_json)}
+            stage_metrics.skipped = True
+        else:
+            logger.info('Naive Bayes classification of top predicted protein domains in each contig')
+            contig_classifications = naive_bayes_classification(contig_domains=contig_domains,
+                                                                classifier_table_path=naive_bayes_classifier_table,
+                                                                uncertainty_threshold=uncertainty_threshold)
+            write_json(classifications_json, [attr.asdict(x) for x in contig_classifications.values()])
+            stage.complete([classifications_json])
+            stage_metrics.counts.update(contigs=len(contig_classifications))
+
+    skip_reasons.update(min_genes_skips)
+    skipped = skip_summary(contig_infos, skip_reasons)
+    if contig_filter.active:
+        logger.info(f'Pre-filters skipped {skipped["skipped_contigs"]} of {len(contig_infos)} contigs '
+                    f'({skipped["skipped_bases"]} of {sum(x.seq_len for x in contig_infos.values())} bases): '
+                    f'{len(min_genes_skips)} contigs with fewer than {min_genes} genes were not searched with '
+                    f'hmmsearch and the rest were not run through Prodigal gene prediction')
+
+    results_table_path = results_path(outdir_path, prefix, results_format)
+    length_stats_path = outdir_path / (prefix + '-classified-length-stats.csv') if classified_length_stats else None
+    with metrics.stage('output') as stage_metrics:
+        stage = checkpoints.stage('output',
+                                  inputs=[classifications_json, contig_domains_json, input_fasta_path, hmm_db],
+                                  params=dict(output_plasmids_separately=output_plasmids_separately,
+                                              classified_length_stats=classified_length_stats,
+                                              results_format=results_format,
+                                              compress_output=compress_output,
+                                              prefilter=attr.asdict(contig_filter)))
+        stage_metrics.counts.update(skipped)
+        if stage.is_complete():
+            logger.info('Resuming: all stages already completed')
+            stage_metrics.skipped = True
+        else:
+            protein_name_to_desc = _hmm_names_to_desc(hmm_db)
+            logger.info(f'Writing output results table to "{results_table_path}"')
+            output_results_table(results_csv_path=results_table_path,
+                                 contigs=contig_infos,
+                                 contig_domains=contig_domains,
+                                 contig_classifications=contig_classifications,
+                                 protein_name_to_desc=protein_name_to_desc,
+                                 skip_reasons=skip_reasons if contig_filter.active else None,
+                                 fmt=results_format)
+            classified_fasta_paths = output_classified_contigs(contig_classifications=contig_classifications,
+                                                               contigs=contig_infos,
+                                                               outdir=outdir_path,
+                                                               output_plasmids_separately=output_plasmids_separately,
+                                                               prefix=prefix,
+                                                               skip_reasons=skip_reasons,
+                                                               length_stats_path=length_stats_path,
+                                                               compress=compress_output,
+                                                               threads=threads)
+            if length_stats_path:
+                logger.info(f'Classified contig length statistics written to "{length_stats_path}"')
+                classified_fasta_paths.append(length_stats_path)
+            stage.complete([results_table_path, *classified_fasta_paths])
+            stage_metrics.counts.update(contigs=len(contig_infos),
+                                        output_bytes=sum(file_size(x) for x in [results_table_path,
+                                                                                *classified_fasta_paths]))
 
-    logger.info(f'Parsing contig sequences from "{input_fasta}" and determine if any could be circular')
-    contig_infos: Dict[str, Contig] = parse_contigs(input_fasta)
-    logger.info(f'Parsed {len(contig_infos)} contigs from "{input_fasta}"')
-    input_fasta_circularized: Path = outdir_path / (prefix + "-circularized.fasta")
-    logger.info(f'Writing circularized contig sequences to "{input_fasta_circularized}"')
-    write_circular_contigs_fasta(contig_infos, input_fasta_circularized)
+    metrics.write(outdir_path / (prefix + '-run-metrics.json'))
+    if profile:
+        metrics.dump_profile(outdir_path / (prefix + '-profile.prof'))
+    logger.info(f'Done! Results can be found in "{outdir_path}". '
+                f'Classification results can be found at "{results_table_path}"')
+
+
+@click.command()
+@click.argument('sample_sheet', type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--outdir', type=click.Path(), required=True, help='Output directory')
+@hmm_db_option
+@threads_option
+@output_plasmids_separately_option
+@uncertainty_threshold_option
+@classifier_table_option
+@hmmsearch_sharding_option
+@hmmsearch_cpus_per_worker_option
+@hmmsearch_shards_option
+@hit_cache_option
+@circular_min_length_option
+@circular_max_length_option
+@circular_kmax_option
+@circular_kmin_option
+@results_format_option
+@compress_output_option
+@verbose_option
+@click.version_option()
+def batch(sample_sheet: str,
+          outdir: str,
+          hmm_db: str,
+          threads: int,
+          output_plasmids_separately: bool,
+          uncertainty_threshold: float,
+          naive_bayes_classifier_table: str,
+          hmmsearch_sharding: str,
+          hmmsearch_cpus_per_worker: int,
+          hmmsearch_shards: Optional[int],
+          hit_cache: Optional[str],
+          circular_min_length: int,
+          circular_max_length: Optional[int],
+          circular_kmax: int,
+          circular_kmin: int,
+          results_format: str,
+          compress_output: bool,
+          verbose: int):
+    """Classify the contigs of multiple samples with a single Prodigal and hmmsearch run.
+
+    SAMPLE_SHEET is a tab- or comma-separated table with "sample" and "fasta" columns. Contig IDs are namespaced
+    with the sample name for gene prediction and hmmsearch over the combined contigs of all samples. Results are
+    output per sample to "OUTDIR/<sample>/" as with viral_verify using the sample name as output file prefix.
+    """
+    init_logging(verbose)
+    _check_results_format(results_format)
+    samples = read_sample_sheet(sample_sheet)
+    logger.info(f'Read {len(samples)} samples from sample sheet "{sample_sheet}"')
+    outdir_path = Path(outdir)
+    outdir_path.mkdir(parents=True, exist_ok=True)
+    batch_dir = outdir_path / 'batch'
+    batch_dir.mkdir(exist_ok=True)
+
+    sample_contigs: Dict[str, Dict[str, Contig]] = {}
+    for sample in samples:
+        sample_contigs[sample.name] = parse_contigs(sample.fasta,
+                                                    min_length=circular_min_length,
+                                                    kmax=circular_kmax,
+                                                    kmin=circular_kmin,
+                                                    max_length=circular_max_length,
+                                                    threads=threads)
+        logger.info(f'Parsed {len(sample_contigs[sample.name])} contigs from "{sample.fasta}" of sample '
+                    f'"{sample.name}" '
+                    f'({sum(x.is_circular for x in sample_contigs[sample.name].values())} potentially circular)')
+    contig_infos = namespaced_contigs(sample_contigs)
+
+    input_fasta_circularized = batch_dir / 'batch-circularized.fasta'
+    logger.info(f'Writing circularized contig sequences of all samples to "{input_fasta_circularized}"')
+    write_namespaced_circular_contigs_fasta(sample_contigs, input_fasta_circularized)
+    proteins_fasta_path = batch_dir / 'batch-proteins.fa'
+    genes_fasta_path = batch_dir / 'batch-genes.fa'
     logger.info(f'Running Prodigal gene prediction on "{input_fasta_circularized}"')
-    proteins_fasta_path: Path = outdir_path / (prefix + '-proteins.fa')
-    genes_fasta_path: Path = outdir_path / (prefix + '-genes.fa')
     prodigal_meta(input_fasta=input_fasta_circularized,
                   genes_fasta=genes_fasta_path,
-                  proteins_fasta=proteins_fasta_path)
-    logger.info(f'Prodigal protein sequence output at "{proteins_fasta_path}"')
-    logger.info(f'Prodigal nucleotide sequence output at "{genes_fasta_path}"')
-
-    filtered_proteins_path = outdir_path / (prefix + "-proteins-circularized.fa")
+                  proteins_fasta=proteins_fasta_path,
+                  threads=threads)
+    filtered_proteins_path = batch_dir / 'batch-proteins-circularized.fa'
     logger.info(f'Filtering out genes predicted over the end of the expected end of each contig. '
                 f'Output at "{filtered_proteins_path}"')
     filter_predicted_genes(proteins_fasta_path, filtered_proteins_path, contig_infos)
-    logger.info(f'Parsing HMM names and descriptions from "{hmm_db}"')
-    protein_name_to_desc = hmm_names_to_desc(hmm_db)
-    logger.info(f'Parsed {len(protein_name_to_desc)} names and descriptions from "{hmm_db}"')
-    logger.info(f'hmmsearch of "{filtered_proteins_path}" against HMM DB "{hmm_db}" with {threads} threads.')
-    hmmsearch_raw_output = outdir_path / (prefix + '-hmmsearch.output')
-    hmmsearch_tblout = outdir_path / (prefix + '-hmmsearch.domtblout')
-    run_hmmsearch(hmm_db=hmm_db,
-                  input_fasta=filtered_proteins_path,
-                  raw_output=hmmsearch_raw_output,
-                  tblout=hmmsearch_tblout,
-                  threads=threads)
-    logger.info(f'hmmsearch raw results output at "{hmmsearch_raw_output}"')
-    logger.info(f'hmmsearch tabular output at "{hmmsearch_tblout}"')
+    hmmsearch_tblout = batch_dir / 'batch-hmmsearch.domtblout'
+    _hmmsearch(hmm_db=hmm_db,
+               input_fasta=filtered_proteins_path,
+               raw_output=batch_dir / 'batch-hmmsearch.output',
+               tblout=hmmsearch_tblout,
+               threads=threads,
+               sharding=hmmsearch_sharding,
+               cpus_per_worker=hmmsearch_cpus_per_worker,
+               n_shards=hmmsearch_shards,
+               hit_cache=hit_cache)
+
     logger.info(f'Parsing hmmsearch tabular output "{hmmsearch_tblout}"')
-    contig_domains, top_domains = top_hmm_results(hmmsearch_tblout)
-    logger.info(f'Parsed {sum(1 for k, vs in top_domains.items() for v in vs)} protein domain results for '
-                f'{len(top_domains)} contigs (out of {len(contig_infos)} total contigs) from hmmsearch tabular '
-                f'output "{hmmsearch_tblout}"')
-    logger.debug(f'Top domains={top_domains}')
-    logger.debug(f'Contig domains={contig_domains}')
-    logger.info(f'Naive Bayes classification of top predicted protein domains in each contig')
+    contig_domains, _ = top_hmm_results(hmmsearch_tblout)
+    logger.info('Naive Bayes classification of top predicted protein domains in each contig')
     contig_classifications = naive_bayes_classification(contig_domains=contig_domains,
                                                         classifier_table_path=naive_bayes_classifier_table,
                                                         uncertainty_threshold=uncertainty_threshold)
-    results_csv_path = outdir_path / (prefix + '-results.csv')
-    logger.info(f'Writing output results CSV to "{results_csv_path}"')
-    output_results_table(results_csv_path=results_csv_path,
-                         contigs=contig_infos,
-                         contig_domains=contig_domains,
-                         contig_classifications=contig_classifications,
-                         protein_name_to_desc=protein_name_to_desc)
-    output_classified_contigs(contig_classifications=contig_classifications,
-                              contigs=contig_infos,
-                              outdir=outdir_path,
-                              output_plasmids_separately=output_plasmids_separately,
-                              prefix=prefix)
+    sample_domains = split_by_sample(contig_domains, samples)
+    sample_classifications = split_by_sample(contig_classifications, samples)
+    protein_name_to_desc = _hmm_names_to_desc(hmm_db)
+    sample_dirs = {x.name: outdir_path / x.name for x in samples}
+    for sample_dir in sample_dirs.values():
+        sample_dir.mkdir(exist_ok=True)
+    split_domtblout(hmmsearch_tblout, {sample: sample_dir / f'{sample}-hmmsearch.domtblout'
+                                       for sample, sample_dir in sample_dirs.items()})
+    for sample in samples:
+        sample_dir = sample_dirs[sample.name]
+        classifications = {name: attr.evolve(x, contig_name=name)
+                           for name, x in sample_classifications[sample.name].items()}
+        results_table_path = results_path(sample_dir, sample.name, results_format)
+        logger.info(f'Writing output results table of sample "{sample.name}" to "{results_table_path}"')
+        output_results_table(results_csv_path=results_table_path,
+                             contigs=sample_contigs[sample.name],
+                             contig_domains=sample_domains[sample.name],
+                             contig_classifications=classifications,
+                             protein_name_to_desc=protein_name_to_desc,
+                             fmt=results_format)
+        output_classified_contigs(contig_classifications=classifications,
+                                  contigs=sample_contigs[sample.name],
+                                  outdir=sample_dir,
+                                  output_plasmids_separately=output_plasmids_separately,
+                                  prefix=sample.name,
+                                  compress=compress_output,
+                                  threads=threads)
+    logger.info(f'Done! Results of {len(samples)} samples can be found in "{outdir_path}"')
 
-    logger.info(f'Done! Results can be found in "{outdir_path}". '
-                f'Classification results can be found at "{results_csv_path}"')
+
+@click.command()
+@hmm_db_option
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False), default=None,
+              help='Listen on a local Unix socket at this path instead of a TCP port')
+@click.option('--host', default='127.0.0.1', help='Host to listen on (default=127.0.0.1)')
+@click.option('--port', type=int, default=8765, help='TCP port to listen on (default=8765)')
+@click.option('-w', '--workers', type=int, default=1, help='Number of jobs run at the same time (default=1)')
+@click.option('-t', '--threads', type=int, default=1,
+              help='Number of threads for Prodigal and hmmsearch per job (default=1)')
+@click.option('--max-queue', type=int, default=100,
+              help='Maximum number of queued jobs. Further job submissions are rejected (default=100)')
+@classifier_table_option
+@hit_cache_option
+@circular_min_length_option
+@circular_max_length_option
+@circular_kmax_option
+@circular_kmin_option
+@verbose_option
+@click.version_option()
+def serve(hmm_db: str,
+          socket_path: Optional[str],
+          host: str,
+          port: int,
+          workers: int,
+          threads: int,
+          max_queue: int,
+          naive_bayes_classifier_table: str,
+          hit_cache: Optional[str],
+          circular_min_length: int,
+          circular_max_length: Optional[int],
+          circular_kmax: int,
+          circular_kmin: int,
+          verbose: int):
+    """Run a classification service accepting jobs over HTTP with a JSON API.
+
+    The classifier table, HMM names and descriptions and HMM DB metadata are loaded once and shared by all jobs.
+    """
+    init_logging(verbose)
+    state = ServiceState.load(hmm_db=hmm_db,
+                              classifier_table_path=naive_bayes_classifier_table,
+                              hit_cache=hit_cache)
+    job_queue = JobQueue(state=state,
+                         workers=workers,
+                         threads=threads,
+                         max_queue=max_queue,
+                         circularity=CircularityPolicy(min_length=circular_min_length,
+                                                       max_length=circular_max_length,
+                                                       kmax=circular_kmax,
+                                                       kmin=circular_kmin))
+    server = make_server(job_queue, socket_path=socket_path, host=host, port=port)
+    logger.info(f'Listening on {socket_path or f"http://{host}:{server.server_address[1]}"} with {workers} '
+                f'workers')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('Shutting down')
+    finally:
+        server.server_close()
+        job_queue.shutdown()
+        if socket_path and Path(socket_path).is_socket():
+            Path(socket_path).unlink()
+
+
+@click.command()
+@click.option('--naive-bayes-classifier-table', type=click.Path(exists=True), default=CLASSIFIER_TABLE,
+              help=f'Table of protein domain frequencies to compile (default="{CLASSIFIER_TABLE}")')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Compiled classifier table output path (default: cached next to the classifier table, or in the '
+                   'user cache directory if that is not writable)')
+@click.option('-v', '--verbose', default=2, count=True, help='Logging verbosity')
+@click.version_option()
+def compile_classifier(naive_bayes_classifier_table: str,
+                       output: Optional[str],
+                       verbose: int):
+    """Compile a Naive Bayes classifier table into a binary table of log frequencies.
+
+    The compiled table is memory-mapped by viral_verify instead of parsing the classifier table on every run.
+    """
+    init_logging(verbose)
+    compiled_path = compile_classifier_table(naive_bayes_classifier_table, output)
+    click.echo(str(compiled_path))
+
+
+def _hmm_names_to_desc(hmm_db: str) -> Dict[str, str]:
+    logger.info(f'Parsing HMM names and descriptions from "{hmm_db}"')
+    protein_name_to_desc = load_hmm_names_to_desc(hmm_db)
+    logger.info(f'Parsed {len(protein_name_to_desc)} names and descriptions from "{hmm_db}"')
+    return protein_name_to_desc
+
+
+def _hmmsearch(hmm_db: str,
+               input_fasta: Path,
+               raw_output: Optional[Path],
+               tblout: Path,
+               threads: int,
+               sharding: str,
+               cpus_per_worker: int,
+               n_shards: Optional[int],
+               hit_cache: Optional[str]) -> ProteinSearchSummary:
+    logger.info(f'hmmsearch of "{input_fasta}" against HMM DB "{hmm_db}" with {threads} threads.')
+    with contextlib.ExitStack() as stack:
+        cache = stack.enter_context(DomainHitCache.open(hit_cache, hmm_db)) if hit_cache else None
+        summary = run_hmmsearch_unique(hmm_db=hmm_db,
+                                       input_fasta=input_fasta,
+                                       raw_output=raw_output,
+                                       tblout=tblout,
+                                       threads=threads,
+                                       sharding=sharding,
+                                       cpus_per_worker=cpus_per_worker,
+                                       n_shards=n_shards,
+                                       hit_cache=cache)
+    logger.info(f'Removed {summary.n_duplicates} duplicate proteins out of {summary.n_proteins} proteins before '
+                f'hmmsearch')
+    if cache is not None:
+        logger.info(f'Domain hit cache hit rate: {summary.n_cached}/{summary.n_proteins} proteins '
+                    f'({summary.n_cached / summary.n_proteins if summary.n_proteins else 0.0:.1%})')
+    if raw_output:
+        logger.info(f'hmmsearch raw results output at "{raw_output}"')
+    logger.info(f'hmmsearch tabular output at "{tblout}"')
+    return summary
+
+
+def _filter_min_genes(proteins_fasta: Path,
+                      contigs: Dict[str, Contig],
+                      min_genes: int,
+                      skips_json: Path) -> Tuple[Dict[str, str], int]:
+    """Remove the proteins of contigs with fewer than `min_genes` genes saving their skip reasons to `skips_json`"""
+    skips, n_removed = filter_min_genes(proteins_fasta, contigs, min_genes)
+    if min_genes > 0:
+        logger.info(f'Skipping hmmsearch for {len(skips)} contigs with fewer than {min_genes} predicted genes '
+                    f'({n_removed} proteins not searched)')
+    write_json(skips_json, skips)
+    return skips, n_removed
+
+
+def _check_results_format(results_format: str) -> None:
+    """Fail early if the optional dependencies of a results table format are not installed"""
+    if results_format == 'parquet':
+        try:
+            require_pyarrow()
+        except ImportError as ex:
+            raise click.BadParameter(str(ex), param_hint='--results-format')
+
+
+def _search_summary_counts(summary: ProteinSearchSummary) -> Dict[str, int]:
+    return dict(hmmsearch_proteins=summary.n_proteins,
+                unique_proteins=summary.n_unique,
+                cached_proteins=summary.n_cached,
+                searched_proteins=summary.n_searched)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+"""Transparent reading of gzip, BGZF and Zstandard compressed files and a multi-threaded BGZF writer
+
+Compression is detected from the magic bytes at the start of a file, not from its name. BGZF (blocked gzip, as
+written by ``bgzip`` and :class:`BgzfWriter`) files are a series of independent gzip members of up to 64 KiB of
+uncompressed data, so their blocks are decompressed in parallel. Plain gzip files are decompressed sequentially.
+Decompressed data is streamed in chunks (see :func:`decompress_to_file`) so that large files are never held in memory
+whole.
+Zstandard support requires the optional ``zstandard`` package (``pip install viral_verify[zstd]``).
+
+Files written with :func:`open_text_output` are BGZF compressed if their name ends with a gzip suffix (``.gz``,
+``.bgz``). BGZF files can be read by any gzip reader and indexed with ``samtools faidx``.
+"""
+import gzip
+import io
+import mmap
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Union, Iterator, Tuple, List, Optional, IO, Deque
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+#: File name suffixes of gzip compressed files written as BGZF by :func:`open_text_output`
+GZIP_SUFFIXES = ('.gz', '.bgz')
+#: File name suffixes of compressed files
+COMPRESSION_SUFFIXES = GZIP_SUFFIXES + ('.bgzf', '.zst', '.zstd')
+#: Maximum uncompressed data per BGZF block so that a compressed block always fits in 64 KiB
+BGZF_BLOCK_SIZE = 0xff00
+#: Empty BGZF block marking the end of a BGZF file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+#: Number of BGZF blocks decompressed per task
+BGZF_BLOCKS_PER_TASK = 64
+#: Default gzip compression level of BGZF output
+DEFAULT_COMPRESSION_LEVEL = 6
+#: Bytes read per chunk when decompressing gzip and Zstandard files
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+_BGZF_HEADER = struct.Struct('<4BI2BH2BHH')
+_GZIP_TRAILER = struct.Struct('<II')
+
+
+class Compression:
+    """Compression formats detected by :func:`detect_compression`"""
+    NONE = 'none'
+    GZIP = 'gzip'
+    BGZF = 'bgzf'
+    ZSTD = 'zstd'
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as ex:
+        raise ImportError('Reading Zstandard compressed files requires the zstandard package. '
+                          'Install it with "pip install viral_verify[zstd]"') from ex
+    return zstandard
+
+
+def _bgzf_extra_bsize(header: bytes) -> Optional[int]:
+    """Get the BSIZE of the BGZF ``BC`` extra subfield of a gzip header or None if it has none"""
+    if len(header) < 12 or header[:2] != GZIP_MAGIC or not header[3] & 4:
+        return None
+    xlen = struct.unpack_from('<H', header, 10)[0]
+    pos = 12
+    end = min(len(header), 12 + xlen)
+    while pos + 4 <= end:
+        si1, si2, slen = struct.unpack_from('<BBH', header, pos)
+        if si1 == 66 and si2 == 67 and slen == 2 and pos + 6 <= end:
+            return struct.unpack_from('<H', header, pos + 4)[0]
+        pos += 4 + slen
+    return None
+
+
+def detect_compression(path: Union[str, Path]) -> str:
+    """Detect the compression format of a file from its first bytes (see :class:`Compression`)"""
+    with open(path, 'rb') as fh:
+        head = fh.read(512)
+    if head.startswith(GZIP_MAGIC):
+        return Compression.BGZF if _bgzf_extra_bsize(head) is not None else Compression.GZIP
+    if head.startswith(ZSTD_MAGIC):
+        return Compression.ZSTD
+    return Compression.NONE
+
+
+def uncompressed_name(path: Union[str, Path]) -> str:
+    """File name without a compression suffix, e.g. "contigs.fasta" for "contigs.fasta.gz\""""
+    path = Path(path)
+    return path.stem if path.suffix.lower() in COMPRESSION_SUFFIXES else path.name
+
+
+def bgzf_blocks(buf) -> Iterator[Tuple[int, int, int]]:
+    """Scan the blocks of BGZF data yielding the start and end of the raw deflate data and the uncompressed size of
+    each block"""
+    pos = 0
+    size = len(buf)
+    while pos < size:
+        bsize = _bgzf_extra_bsize(bytes(buf[pos:pos + 512]))
+        if bsize is None:
+            raise ValueError(f'Invalid BGZF block at byte offset {pos}')
+        xlen = struct.unpack_from('<H', buf, pos + 10)[0]
+        block_end = pos + bsize + 1
+        if block_end > size:
+            raise ValueError(f'Truncated BGZF block at byte offset {pos}')
+        isize = struct.unpack_from('<I', buf, block_end - 4)[0]
+        yield pos + 12 + xlen, block_end - 8, isize
+        pos = block_end
+
+
+def _inflate_blocks(buf, blocks: List[Tuple[int, int, int]]) -> bytes:
+    return b''.join(zlib.decompress(buf[start:end], -15) for start, end, _ in blocks)
+
+
+def iter_bgzf_chunks(path: Union[str, Path], threads: int = 1) -> Iterator[bytes]:
+    """Decompress a BGZF file in order yielding the decompressed data of :data:`BGZF_BLOCKS_PER_TASK` blocks at a time
+
+    Groups of blocks are decompressed by `threads` threads with at most 4 groups per thread held in memory.
+    """
+    if Path(path).stat().st_size == 0:
+        return
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        tasks: List[List[Tuple[int, int, int]]] = [[]]
+        for block in bgzf_blocks(buf):
+            if len(tasks[-1]) == BGZF_BLOCKS_PER_TASK:
+                tasks.append([])
+            tasks[-1].append(block)
+        if threads <= 1:
+            for blocks in tasks:
+                yield _inflate_blocks(buf, blocks)
+            return
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            pending: Deque[Future] = deque()
+            for blocks in tasks:
+                pending.append(executor.submit(_inflate_blocks, buf, blocks))
+                if len(pending) >= 4 * threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def iter_decompressed_chunks(path: Union[str, Path], threads: int = 1) -> Iterator[bytes]:
+    """Read a file in chunks decompressing it if it is gzip, BGZF or Zstandard compressed
+
+    BGZF files are decompressed with `threads` threads (see :func:`iter_bgzf_chunks`).
+    """
+    compression = detect_compression(path)
+    if compression == Compression.BGZF:
+        yield from iter_bgzf_chunks(path, threads)
+        return
+    if compression == Compression.GZIP:
+        fh = gzip.open(path, 'rb')
+    elif compression == Compression.ZSTD:
+        zstandard = _import_zstandard()
+        fh = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    else:
+        fh = open(path, 'rb')
+    with fh:
+        yield from iter(lambda: fh.read(DECOMPRESS_CHUNK_SIZE), b'')
+
+
+def decompress_file(path: Union[str, Path], threads: int = 1) -> bytearray:
+    """Read a whole file into memory decompressing it if it is gzip, BGZF or Zstandard compressed
+
+    Use :func:`decompress_to_file` for large files.
+    """
+    out = bytearray()
+    for chunk in iter_decompressed_chunks(path, threads):
+        out += chunk
+    return out
+
+
+def decompress_to_file(path: Union[str, Path], fout: IO[bytes], threads: int = 1) -> int:
+    """Decompress a gzip, BGZF or Zstandard compressed file to a binary handle returning the number of bytes written
+
+    Only a bounded number of decompressed chunks are held in memory at a time.
+    """
+    n_bytes = 0
+    for chunk in iter_decompressed_chunks(path, threads):
+        fout.write(chunk)
+        n_bytes += len(chunk)
+    return n_bytes
+
+
+def open_text(path: Union[str, Path]) -> IO[str]:
+    """Open a plain text, gzip, BGZF or Zstandard compressed file for reading text lines"""
+    compression = detect_compression(path)
+    if compression in (Compression.GZIP, Compression.BGZF):
+        return gzip.open(path, 'rt')
+    if compression == Compression.ZSTD:
+        zstandard = _import_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True,
+                                                            closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader))
+    return open(path)
+
+
+def compress_bgzf_block(data: bytes, level: int = DEFAULT_COMPRESSION_LEVEL) -> bytes:
+    """Compress up to :data:`BGZF_BLOCK_SIZE` bytes into a BGZF block"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    bsize = _BGZF_HEADER.size + len(cdata) + _GZIP_TRAILER.size
+    header = _BGZF_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, bsize - 1)
+    return header + cdata + _GZIP_TRAILER.pack(zlib.crc32(data), len(data))
+
+
+class BgzfWriter(io.RawIOBase):
+    """Binary BGZF file writer compressing blocks with a pool of threads
+
+    Written data is cut into blocks of :data:`BGZF_BLOCK_SIZE` bytes that are compressed concurrently and written in
+    order. At most 4 blocks per thread are in flight at a time. An `executor` of `threads` threads can be shared
+    between writers.
+    """
+
+    def __init__(self,
+                 path: Union[str, Path],
+                 threads: int = 1,
+                 level: int = DEFAULT_COMPRESSION_LEVEL,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        super().__init__()
+        self.path = Path(path)
+        self.level = level
+        self._fh = open(self.path, 'wb')
+        self._buf = b''
+        self._own_executor = executor is None and threads > 1
+        self._executor = ThreadPoolExecutor(max_workers=threads) if self._own_executor else executor
+        self._max_pending = 4 * max(1, threads)
+        self._pending: Deque[Future] = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = self._buf + bytes(b) if self._buf else bytes(b)
+        pos = 0
+        while len(data) - pos >= BGZF_BLOCK_SIZE:
+            self._submit(data[pos:pos + BGZF_BLOCK_SIZE])
+            pos += BGZF_BLOCK_SIZE
+        self._buf = data[pos:]
+        return len(b)
+
+    def _submit(self, block: bytes) -> None:
+        if self._executor is None:
+            self._fh.write(compress_bgzf_block(block, self.level))
+            return
+        self._pending.append(self._executor.submit(compress_bgzf_block, block, self.level))
+        while len(self._pending) > self._max_pending:
+            self._fh.write(self._pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buf:
+                self._submit(self._buf)
+                self._buf = b''
+            while self._pending:
+                self._fh.write(self._pending.popleft().result())
+            self._fh.write(BGZF_EOF)
+        finally:
+            self._fh.close()
+            if self._own_executor:
+                self._executor.shutdown(wait=True)
+            super().close()
+
+
+def is_gzip_name(path: Union[str, Path]) -> bool:
+    return Path(path).suffix.lower() in GZIP_SUFFIXES
+
+
+def open_binary_output(path: Union[str, Path],
+                       threads: int = 1,
+                       executor: Optional[ThreadPoolExecutor] = None) -> IO[bytes]:
+    """Open a binary output file, BGZF compressed if its name ends with a gzip suffix"""
+    if is_gzip_name(path):
+        return io.BufferedWriter(BgzfWriter(path, threads=threads, executor=executor), buffer_size=BGZF_BLOCK_SIZE)
+    return open(path, 'wb')
+
+
+def open_text_output(path: Union[str, Path], threads: int = 1) -> IO[str]:
+    """Open a text output file, BGZF compressed if its name ends with a gzip suffix"""
+    if is_gzip_name(path):
+        return io.TextIOWrapper(open_binary_output(path, threads=threads))
+    return open(path, 'w')
@@ -1,56 +1,122 @@
+from typing import Iterator, Optional
+
 import attr
+from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 
+from viral_verify.circularity import CircularityPolicy, end_overlap
+from viral_verify.faidx import IndexedFasta, FastaIndexEntry
+
+#: Number of bases read from the input FASTA file at a time when writing circularized contig sequences
+CHUNK_SIZE = 1 << 20
 
-@attr.s
+
+@attr.s(slots=True)
 class Contig:
-    seq_rec: SeqRecord = attr.ib()
+    """Contig location in the input FASTA file and circularity info
+
+    The sequence is not held in memory but read back from the memory-mapped input FASTA file by byte offset (see
+    :class:`viral_verify.faidx.IndexedFasta`) unless the contig was created from an in-memory `sequence`.
+    """
+    name: str = attr.ib()
+    description: str = attr.ib()
+    seq_len: int = attr.ib()
+    offset: int = attr.ib(default=0)
+    byte_len: int = attr.ib(default=0)
+    line_bases: int = attr.ib(default=0)
+    line_width: int = attr.ib(default=0)
     is_circular: bool = attr.ib(default=False)
     n_matching_ends: int = attr.ib(default=0)
     min_length: int = attr.ib(default=500)
     kmax: int = attr.ib(default=200)
     kmin: int = attr.ib(default=50)
+    fasta: Optional[IndexedFasta] = attr.ib(default=None, repr=False, eq=False)
+    sequence: Optional[str] = attr.ib(default=None, repr=False)
+
+    def seq(self, start: int = 0, end: Optional[int] = None) -> str:
+        """Contig sequence from `start` to `end` (0-based, end exclusive)"""
+        if self.sequence is not None:
+            return self.sequence[start:end]
+        return self.fasta.fetch(self, start, end)
 
     @property
-    def seq_len(self) -> int:
-        return len(self.seq_rec.seq)
+    def seq_rec(self) -> SeqRecord:
+        """Contig sequence as a Biopython SeqRecord, read from the input FASTA file"""
+        return SeqRecord(Seq(self.seq()), id=self.name, name=self.name, description=self.description)
 
     def circular_seq(self) -> str:
-        seq = str(self.seq_rec.seq)
-        return seq if not self.is_circular else seq + seq[self.n_matching_ends:]
+        return ''.join(self.iter_circular_seq())
+
+    def iter_circular_seq(self, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """Contig sequence followed by the sequence after the matching ends if circular in chunks of `chunk_size`"""
+        for i in range(0, self.seq_len, chunk_size):
+            yield self.seq(i, i + chunk_size)
+        if self.is_circular:
+            for i in range(self.n_matching_ends, self.seq_len, chunk_size):
+                yield self.seq(i, i + chunk_size)
 
     def circular_seq_fasta(self) -> str:
-        seq = self.circular_seq()
-        return f'>{self.seq_rec.description}{" circular" if self.is_circular else ""}\n{seq}\n'
+        return ''.join(self.iter_circular_seq_fasta())
+
+    def iter_circular_seq_fasta(self, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """FASTA entry of the circularized contig sequence in chunks so that the doubled sequence is never built"""
+        yield f'>{self.description}{" circular" if self.is_circular else ""}\n'
+        yield from self.iter_circular_seq(chunk_size)
+        yield '\n'
+
+    @classmethod
+    def from_seq_record(cls, rec: SeqRecord, min_length=500, kmax=200, kmin=50, max_length=None):
+        return cls.from_sequence(rec.id, str(rec.seq), rec.description, min_length=min_length, kmax=kmax, kmin=kmin,
+                                 max_length=max_length)
 
     @classmethod
-    def from_seq_record(cls, rec: SeqRecord, min_length=500, kmax=200, kmin=50):
-        seq_len = len(rec.seq)
-        seq = str(rec.seq)
-        is_circular, k = Contig.find_matching_at_ends(seq, kmax, kmin) if seq_len < min_length else False, 0
-        return cls(seq_rec=rec,
+    def from_sequence(cls, name: str, seq: str, description: Optional[str] = None, min_length=500, kmax=200, kmin=50,
+                      max_length=None):
+        """Contig with an in-memory sequence"""
+        policy = CircularityPolicy(min_length=min_length, max_length=max_length, kmax=kmax, kmin=kmin)
+        is_circular, k = Contig.find_matching_at_ends(seq, kmax, kmin) if policy.applies_to(len(seq)) else (False, 0)
+        return cls(name=name,
+                   description=description or name,
+                   seq_len=len(seq),
                    is_circular=is_circular,
                    n_matching_ends=k,
                    min_length=min_length,
                    kmax=kmax,
-                   kmin=kmin)
+                   kmin=kmin,
+                   sequence=seq)
+
+    @classmethod
+    def from_fasta_index(cls, fasta: IndexedFasta, entry: FastaIndexEntry, min_length=500, kmax=200, kmin=50,
+                         max_length=None):
+        """Contig from its FASTA index entry checking for circularity with only the first and last `kmax` bases"""
+        seq_len = entry.seq_len
+        policy = CircularityPolicy(min_length=min_length, max_length=max_length, kmax=kmax, kmin=kmin)
+        k = 0
+        if policy.applies_to(seq_len):
+            m = policy.max_overlap(seq_len)
+            k = end_overlap(fasta.fetch(entry, 0, m), fasta.fetch(entry, seq_len - m), kmin)
+        return cls(name=entry.name,
+                   description=entry.description,
+                   seq_len=seq_len,
+                   offset=entry.offset,
+                   byte_len=entry.byte_len,
+                   line_bases=entry.line_bases,
+                   line_width=entry.line_width,
+                   is_circular=k > 0,
+                   n_matching_ends=k,
+                   min_length=min_length,
+                   kmax=kmax,
+                   kmin=kmin,
+                   fasta=fasta)
 
     @staticmethod
     def find_matching_at_ends(seq: str, kmax: int = 200, kmin: int = 50) -> (bool, int):
         """Find number of matching characters at the ends of a sequence
 
-        Starting at a length of `kmax` (200) until `kmin` (50), see if there are up to `kmax` matching characters at
-        the ends of `seq`.
+        Find the longest overlap of up to `kmax` (200) characters (and shorter than `seq`) between the start and end
+        of `seq`. The sequence is considered circular if the overlap is longer than `kmin` (50) characters. The number
+        of matching characters is 0 if the sequence is not circular.
         """
-        k = 0
-        is_circular = False
-        seq_len = len(seq)
-        for k in range(kmax, kmin, -1):
-            if k >= seq_len:
-                continue
-            start: str = seq[:k]
-            end: str = seq[-k:]
-            if start == end:
-                is_circular = True
-                break
-        return is_circular, k
+        m = max(0, min(kmax, len(seq) - 1))
+        k = end_overlap(seq[:m], seq[len(seq) - m:], kmin)
+        return k > 0, k
@@ -0,0 +1,123 @@
+"""Disk-backed FASTA index for reading sequences back from the input file by byte offset
+
+Similar to a samtools ``.fai`` index, each record is described by its name, sequence length, the byte offset of its
+first sequence line and its line layout. The FASTA file is memory-mapped so that sequences are only read into memory
+when they are needed. Compressed (gzip, BGZF or Zstandard) FASTA files are decompressed to a temporary file that is
+memory-mapped instead (see :func:`viral_verify.fasta.fasta_buffer`).
+"""
+import mmap
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, Union
+
+from viral_verify.compression import detect_compression
+from viral_verify.fasta import SEQUENCE_WHITESPACE, fasta_buffer, record_offsets
+
+
+class FastaIndexEntry(NamedTuple):
+    """Location of a FASTA record sequence within a file
+
+    `offset` is the byte offset of the first sequence line and `byte_len` the number of bytes up to the next record
+    header. `line_bases` and `line_width` are the number of bases and bytes per sequence line (like a ``.fai``); both
+    are 0 when the record has irregular line lengths or whitespace other than ``\\n`` line endings.
+    """
+    name: str
+    description: str
+    seq_len: int
+    offset: int
+    byte_len: int
+    line_bases: int
+    line_width: int
+
+
+def _line_layout(block: bytes, seq_len: int) -> (int, int):
+    """Get the bases and bytes per line of a sequence block if all lines except the last have the same length"""
+    if seq_len == 0 or any(x in block for x in (b'\r', b' ', b'\t')):
+        return 0, 0
+    line_bases = block.find(b'\n')
+    if line_bases == -1:
+        return seq_len, seq_len + 1
+    if line_bases == 0:
+        return 0, 0
+    line_width = line_bases + 1
+    body = block[:-1] if block.endswith(b'\n') else block
+    line_ends = body[line_bases::line_width]
+    if line_ends.count(b'\n') != len(line_ends) or body.count(b'\n') != len(line_ends):
+        return 0, 0
+    return line_bases, line_width
+
+
+class IndexedFasta:
+    """Memory-mapped FASTA file
+
+    Records are parsed like Biopython's FASTA parser: the record ID is the first word of the header line and the
+    description the whole header line; trailing whitespace, spaces and carriage returns are removed from sequence
+    lines. Compressed files are decompressed to a temporary file in ``$TMPDIR``, BGZF files with `threads` threads.
+
+    Examples
+    --------
+    >>> with IndexedFasta('tests/data/test.fasta') as fasta:
+    ...     entry = next(fasta.index())
+    ...     fasta.fetch(entry, 0, 10)
+    'GATCTAAAGC'
+    """
+
+    def __init__(self, path: Union[str, Path], threads: int = 1):
+        self.path = Path(path)
+        self.compression = detect_compression(self.path)
+        self._buf = fasta_buffer(self.path, threads=threads)
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def __enter__(self) -> 'IndexedFasta':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def index(self) -> Iterator[FastaIndexEntry]:
+        """Scan the FASTA file for the location and line layout of each record
+
+        Each record sequence is only held in memory while it is being scanned.
+        """
+        buf = self._buf
+        for header_start, seq_start, seq_end in record_offsets(buf):
+            title = bytes(buf[header_start + 1:seq_start]).decode().rstrip()
+            block = buf[seq_start:seq_end]
+            seq_len = len(block.translate(None, SEQUENCE_WHITESPACE))
+            line_bases, line_width = _line_layout(block, seq_len)
+            words = title.split(None, 1)
+            yield FastaIndexEntry(name=words[0] if words else '',
+                                  description=title,
+                                  seq_len=seq_len,
+                                  offset=seq_start,
+                                  byte_len=seq_end - seq_start,
+                                  line_bases=line_bases,
+                                  line_width=line_width)
+
+    def fetch(self, entry, start: int = 0, end: Optional[int] = None) -> str:
+        """Read the sequence of an indexed record from `start` to `end` (0-based, end exclusive)
+
+        `entry` is a :class:`FastaIndexEntry` or any object with the same location attributes such as
+        :class:`viral_verify.contig.Contig`.
+        """
+        start, end, _ = slice(start, end).indices(entry.seq_len)
+        if end <= start:
+            return ''
+        if entry.line_bases:
+            lb = entry.line_bases
+            lw = entry.line_width
+            byte_start = entry.offset + (start // lb) * lw + start % lb
+            byte_end = entry.offset + ((end - 1) // lb) * lw + (end - 1) % lb + 1
+            return self._buf[byte_start:byte_end].replace(b'\n', b'').decode()
+        block = self._buf[entry.offset:entry.offset + entry.byte_len]
+        return block.translate(None, SEQUENCE_WHITESPACE)[start:end].decode()
+
+    def raw(self, entry, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Bytes `start` to `end` of the sequence lines of an indexed record as they are in the file
+
+        Line breaks are included. By default, all `entry.byte_len` bytes up to the next record header are read.
+        """
+        start, end, _ = slice(start, end).indices(entry.byte_len)
+        return self._buf[entry.offset + start:entry.offset + max(start, end)]
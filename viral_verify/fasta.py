@@ -0,0 +1,170 @@
+"""Lean bytes-level FASTA reader and writer
+
+FASTA files are scanned for record boundaries in a memory-mapped buffer without building a per-record object. gzip,
+BGZF and Zstandard compressed files are decompressed once to an anonymous temporary file in the system temporary
+directory (``$TMPDIR``) that is memory-mapped, see :func:`fasta_buffer`. Records are yielded as ``(header,
+sequence lines)`` tuples where the header is the header line bytes without the ``>`` and line ending and the sequence
+lines are a memoryview of the raw sequence lines, line breaks included, that is only copied if the sequence is needed
+(see :func:`sequence`). The same scanner backs
+:class:`viral_verify.faidx.IndexedFasta` and the FASTA sharding in :mod:`viral_verify.shard`.
+
+Examples
+--------
+>>> for header, seq_lines in read_fasta('tests/data/test.fasta'):
+...     print(split_header(header)[0].decode(), len(sequence(seq_lines)))
+...     break
+AP011954.1 93185
+"""
+import mmap
+import re
+import tempfile
+from pathlib import Path
+from typing import Iterator, Tuple, Union, IO
+
+from viral_verify.compression import detect_compression, decompress_to_file, Compression
+
+#: Characters removed from FASTA sequence lines
+SEQUENCE_WHITESPACE = b' \t\r\n'
+
+#: Prodigal protein FASTA header fast path matching the contig name (gene ID without the ``_<gene number>`` suffix)
+#: and the gene start, e.g. ``k141_2229_1 # 197 # 379 # 1 # ID=4_1;...``
+PRODIGAL_HEADER = re.compile(rb'(\S+)_\d+ # (\d+) #')
+_PRODIGAL_HEADER_TEXT = re.compile(PRODIGAL_HEADER.pattern.decode())
+_GENE_NUMBER_SUFFIX = re.compile(r'_\d+$')
+
+FastaBuffer = Union[mmap.mmap, bytes, bytearray]
+
+
+def fasta_buffer(path: Union[str, Path], threads: int = 1) -> FastaBuffer:
+    """Memory-map a FASTA file
+
+    A compressed file is first decompressed (BGZF with `threads` threads) to an anonymous temporary file in the system
+    temporary directory (``$TMPDIR``, see :func:`tempfile.gettempdir`) which needs free space for the decompressed
+    file. The file descriptor of a memory-mapped file is closed right away; the map, and with it the temporary file,
+    is released when it is closed or garbage collected.
+    """
+    path = Path(path)
+    if detect_compression(path) != Compression.NONE:
+        with tempfile.TemporaryFile(prefix=f'viral_verify-{path.name}-') as fh:
+            if decompress_to_file(path, fh, threads=threads) == 0:
+                return b''
+            fh.flush()
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if path.stat().st_size == 0:
+        return b''
+    with open(path, 'rb') as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def record_offsets(buf: FastaBuffer) -> Iterator[Tuple[int, int, int]]:
+    """Scan a FASTA buffer yielding the byte offsets of the header, first sequence line and end of each record
+
+    Any text before the first header line is skipped. A record ends at the start of the next header line.
+    """
+    size = len(buf)
+    pos = 0 if buf[:1] == b'>' else buf.find(b'\n>')
+    if pos == -1:
+        return
+    if buf[pos:pos + 1] == b'\n':
+        pos += 1
+    find = buf.find
+    while pos < size:
+        header_end = find(b'\n', pos)
+        if header_end == -1:
+            header_end = size
+        seq_start = min(header_end + 1, size)
+        seq_end = find(b'\n>', header_end)
+        seq_end = size if seq_end == -1 else seq_end + 1
+        yield pos, seq_start, seq_end
+        pos = seq_end
+
+
+def iter_records(buf: FastaBuffer) -> Iterator[Tuple[bytes, memoryview]]:
+    """Iterate over the header (without ``>`` and trailing whitespace) and sequence lines view of each record in a
+    FASTA buffer"""
+    view = memoryview(buf)
+    for header_start, seq_start, seq_end in record_offsets(buf):
+        yield bytes(buf[header_start + 1:seq_start]).rstrip(), view[seq_start:seq_end]
+
+
+def load_fasta(fasta: Union[str, Path, IO, bytes], threads: int = 1) -> FastaBuffer:
+    """Buffer of a FASTA file path (see :func:`fasta_buffer`), an open text or binary handle that is read into memory
+    or the FASTA file contents"""
+    if isinstance(fasta, (str, Path)):
+        return fasta_buffer(fasta, threads=threads)
+    if isinstance(fasta, (bytes, bytearray)):
+        return fasta
+    buf = fasta.read()
+    return buf.encode() if isinstance(buf, str) else buf
+
+
+def read_fasta(fasta: Union[str, Path, IO, bytes], threads: int = 1) -> Iterator[Tuple[bytes, memoryview]]:
+    """Iterate over the header and sequence lines of each record of a (compressed) FASTA file
+
+    See :func:`load_fasta` for the accepted `fasta` sources and :func:`iter_records`.
+    """
+    return iter_records(load_fasta(fasta, threads=threads))
+
+
+def sequence(seq_lines: memoryview) -> bytes:
+    """Sequence of the raw sequence lines of a record with line breaks and whitespace removed"""
+    return bytes(seq_lines).translate(None, SEQUENCE_WHITESPACE)
+
+
+def split_header(header: bytes) -> Tuple[bytes, bytes]:
+    """Split a header into the record ID (first word) and the rest of the description"""
+    words = header.split(None, 1)
+    if len(words) == 2:
+        return words[0], words[1]
+    return header, b''
+
+
+def parse_prodigal_header(header: Union[bytes, str]) -> Tuple[Union[bytes, str], int]:
+    """Get the contig name and gene start of a Prodigal protein FASTA header
+
+    Headers are matched with the precompiled :data:`PRODIGAL_HEADER` expression, falling back to splitting the header
+    on ``#`` for other header layouts.
+
+    Examples
+    --------
+    >>> parse_prodigal_header(b'k141_2229_1 # 197 # 379 # 1 # ID=4_1;partial=00;start_type=ATG')
+    (b'k141_2229', 197)
+    >>> parse_prodigal_header('k141_2229_1 #  197 # 379 # 1')
+    ('k141_2229', 197)
+    """
+    is_text = isinstance(header, str)
+    match = (_PRODIGAL_HEADER_TEXT if is_text else PRODIGAL_HEADER).match(header)
+    if match is not None:
+        return match.group(1), int(match.group(2))
+    text = header if is_text else header.decode()
+    contig_name = _GENE_NUMBER_SUFFIX.sub('', text.split(None, 1)[0])
+    gene_start = int(text.split('#')[1].strip())
+    return (contig_name if is_text else contig_name.encode()), gene_start
+
+
+def iter_prodigal_records(buf: FastaBuffer) -> Iterator[Tuple[bytes, int, memoryview]]:
+    """Iterate over the contig name, gene start and raw FASTA record (header and sequence lines) of each protein in a
+    Prodigal protein FASTA buffer
+
+    Headers are matched with :data:`PRODIGAL_HEADER` in place without copying them out of the buffer (see
+    :func:`parse_prodigal_header`).
+    """
+    view = memoryview(buf)
+    match = PRODIGAL_HEADER.match
+    for header_start, seq_start, seq_end in record_offsets(buf):
+        header_match = match(buf, header_start + 1, seq_start)
+        if header_match is None:
+            contig_name, gene_start = parse_prodigal_header(bytes(buf[header_start + 1:seq_start]).rstrip())
+        else:
+            contig_name, gene_start = header_match.group(1), int(header_match.group(2))
+        yield contig_name, gene_start, view[header_start:seq_end]
+
+
+def write_record(fout: IO[bytes], header: bytes, seq_lines: Union[memoryview, bytes]) -> None:
+    """Write a FASTA record with its sequence lines as they are, adding a final line break if missing"""
+    fout.write(b'>')
+    fout.write(header)
+    fout.write(b'\n')
+    fout.write(seq_lines)
+    if len(seq_lines) and seq_lines[-1:] != b'\n':
+        fout.write(b'\n')
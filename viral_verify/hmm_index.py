@@ -0,0 +1,147 @@
+"""Fast scanning and cached sidecar index of HMM profile names and descriptions"""
+import logging
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from viral_verify.cache import file_fingerprint, cache_path, read_manifest, write_manifest
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.names.json'
+"""Suffix of the HMM name and description sidecar index file"""
+PFAM_DAT_SUFFIX = '.dat'
+"""Suffix of the Pfam HMM annotation file (e.g. ``Pfam-A.hmm.dat`` for ``Pfam-A.hmm``)"""
+
+
+def _header_value(line: bytes, tag: bytes) -> str:
+    return line.replace(tag, b'').strip().decode()
+
+
+def scan_hmm_names_to_desc(hmm_path: Union[str, Path]) -> Dict[str, Optional[str]]:
+    """Get the NAME and DESC of each HMM in an HMMer3 HMM file by scanning only the HMM headers
+
+    The HMM file is memory-mapped and only the header lines of each HMM entry up to the ``HMM`` model line are
+    parsed. The model body is skipped by searching for the ``//`` entry terminator.
+    """
+    out: Dict[str, Optional[str]] = {}
+    if os.path.getsize(hmm_path) == 0:
+        return out
+    with open(hmm_path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        pos = 0
+        while pos < size:
+            header_end = mm.find(b'\nHMM ', pos)
+            entry_end = mm.find(b'\n//', pos)
+            if entry_end == -1:
+                entry_end = size
+            if header_end == -1 or header_end > entry_end:
+                header_end = entry_end
+            name = None
+            desc = None
+            for line in mm[pos:header_end].splitlines():
+                if name is None and line.startswith(b'NAME'):
+                    name = _header_value(line, b'NAME')
+                elif desc is None and line.startswith(b'DESC'):
+                    desc = _header_value(line, b'DESC')
+            if name is not None or desc is not None:
+                out[name] = desc
+            next_line = mm.find(b'\n', entry_end + 1)
+            pos = size if next_line == -1 else next_line + 1
+    return out
+
+
+def parse_pfam_dat_names_to_desc(dat_path: Union[str, Path]) -> Dict[str, Optional[str]]:
+    """Get HMM names and descriptions from a Pfam HMM annotation file (``Pfam-A.hmm.dat``)
+
+    Each entry has ``#=GF ID`` (HMM NAME) and ``#=GF DE`` (HMM DESC) lines and ends with ``//``.
+    """
+    out: Dict[str, Optional[str]] = {}
+    name = None
+    desc = None
+    with open(dat_path) as fh:
+        for line in fh:
+            if line.startswith('#=GF ID'):
+                name = line[7:].strip()
+            elif line.startswith('#=GF DE'):
+                desc = line[7:].strip()
+            elif line.startswith('//'):
+                if name is not None:
+                    out[name] = desc
+                name = None
+                desc = None
+    return out
+
+
+class HmmNamesToDesc(dict):
+    """HMM names to descriptions built from a Pfam annotation file that falls back to the HMM file for missing names
+
+    The first lookup of a name missing from the annotation file scans the HMM file headers (see
+    :func:`scan_hmm_names_to_desc`) for the names and descriptions of all HMMs missing from the annotation file and
+    rewrites the sidecar `index_path` with them.
+    """
+
+    def __init__(self, names_to_desc: Dict[str, Optional[str]], hmm_path: Union[str, Path], index_path: Path,
+                 manifest: Dict[str, Any]):
+        super().__init__(names_to_desc)
+        self.hmm_path = hmm_path
+        self.index_path = index_path
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    def __missing__(self, name: str) -> Optional[str]:
+        with self._lock:
+            if not self._scanned:
+                self._scanned = True
+                logger.warning(f'HMM "{name}" not found in Pfam annotation file. Scanning HMM file "{self.hmm_path}" '
+                               f'for the names and descriptions of HMMs missing from the annotation file')
+                missing = {k: v for k, v in scan_hmm_names_to_desc(self.hmm_path).items() if k not in self}
+                logger.info(f'Found {len(missing)} HMMs missing from the Pfam annotation file')
+                self.update(missing)
+                _write_index(self.index_path, dict(self.manifest, complete=True, names_to_desc=dict(self)))
+        if name in self:
+            return self[name]
+        raise KeyError(name)
+
+
+def load_hmm_names_to_desc(hmm_path: Union[str, Path]) -> Dict[str, Optional[str]]:
+    """Get HMM names and descriptions from a cached sidecar index, building the index if necessary
+
+    The sidecar index is stored next to the HMM file (or in the user cache directory if that is not writable) and
+    is rebuilt if the path, size or modification time of the HMM file or of its Pfam annotation file change. If a Pfam
+    annotation file (e.g. ``Pfam-A.hmm.dat``) exists next to the HMM file, the index is built from it instead of the
+    much larger HMM file. Names missing from the annotation file are looked up in the HMM file on first use (see
+    :class:`HmmNamesToDesc`).
+    """
+    index_path = cache_path(hmm_path, INDEX_SUFFIX)
+    dat_path = Path(str(hmm_path) + PFAM_DAT_SUFFIX)
+    manifest = dict(hmm_db=file_fingerprint(hmm_path), dat=file_fingerprint(dat_path) if dat_path.exists() else None)
+    index = read_manifest(index_path)
+    if index and all(index.get(k) == v for k, v in manifest.items()):
+        logger.debug(f'Using cached HMM names and descriptions index "{index_path}"')
+        names_to_desc = index['names_to_desc']
+        if manifest['dat'] is not None and not index.get('complete'):
+            return HmmNamesToDesc(names_to_desc, hmm_path, index_path, manifest)
+        return names_to_desc
+
+    if manifest['dat'] is not None:
+        logger.info(f'Building HMM names and descriptions index from Pfam annotation file "{dat_path}"')
+        names_to_desc = HmmNamesToDesc(parse_pfam_dat_names_to_desc(dat_path), hmm_path, index_path, manifest)
+        _write_index(index_path, dict(manifest, complete=False, names_to_desc=dict(names_to_desc)))
+    else:
+        logger.info(f'Building HMM names and descriptions index from HMM file "{hmm_path}"')
+        names_to_desc = scan_hmm_names_to_desc(hmm_path)
+        _write_index(index_path, dict(manifest, complete=True, names_to_desc=names_to_desc))
+    return names_to_desc
+
+
+def _write_index(index_path: Path, index: Dict[str, Any]) -> None:
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        write_manifest(index_path, index)
+        logger.info(f'Wrote HMM names and descriptions index "{index_path}"')
+    except OSError as ex:
+        logger.warning(f'Could not write HMM names and descriptions index "{index_path}": {ex}')
@@ -1,2 +1,4 @@
 from viral_verify.hmmsearch.io import top_hmm_results
-from viral_verify.hmmsearch.process import run_hmmsearch
+from viral_verify.hmmsearch.process import run_hmmsearch, run_hmmsearch_sequence_sharded, \
+    run_hmmsearch_profile_sharded, run_hmmsearch_with_sharding, DEFAULT_CPUS_PER_WORKER, \
+    hmmsearch_version
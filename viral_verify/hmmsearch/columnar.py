@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Columnar, parallel parsing of hmmsearch domtblout tables"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union, List, Tuple, Dict, Optional
+
+import attr
+import numpy as np
+
+from viral_verify.hmmsearch.result import HmmSearchResult
+
+PARALLEL_PARSE_MIN_BYTES = 64 * 1024 * 1024
+"""Minimum domtblout size in bytes for parsing in parallel with multiple processes"""
+
+_Chunk = Tuple[List[str], np.ndarray, List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+@attr.s
+class DomTable:
+    """Columnar hmmsearch domtblout table of the values necessary for Naive Bayes classification
+
+    Target (e.g. predicted protein gene ID) and query (e.g. protein domain) names are interned: `target_id` and
+    `query_id` index into `target_names` and `query_names`, which are sorted so that comparing IDs is the same as
+    comparing names.
+    """
+    target_names: List[str] = attr.ib()
+    query_names: List[str] = attr.ib()
+    target_id: np.ndarray = attr.ib()
+    query_id: np.ndarray = attr.ib()
+    domain_score: np.ndarray = attr.ib()
+    ali_coord_from: np.ndarray = attr.ib()
+    ali_coord_to: np.ndarray = attr.ib()
+
+    def __len__(self) -> int:
+        return len(self.target_id)
+
+    def take(self, indices: np.ndarray) -> 'DomTable':
+        """New DomTable of the rows at `indices`"""
+        return attr.evolve(self,
+                           target_id=self.target_id[indices],
+                           query_id=self.query_id[indices],
+                           domain_score=self.domain_score[indices],
+                           ali_coord_from=self.ali_coord_from[indices],
+                           ali_coord_to=self.ali_coord_to[indices])
+
+    def sort_order(self) -> np.ndarray:
+        """Row order by descending target name, domain score and alignment start
+
+        Rows with equal keys keep their table order, i.e. the same order as a stable descending sort.
+        """
+        return np.lexsort((-self.ali_coord_from.astype(np.int64),
+                           -self.domain_score,
+                           -self.target_id.astype(np.int64)))
+
+    def sorted(self) -> 'DomTable':
+        """Table sorted by descending target name, domain score and alignment start"""
+        return self.take(self.sort_order())
+
+    def scores(self) -> List[float]:
+        """Domain scores as Python floats
+
+        hmmsearch reports scores with one decimal place, so values are rounded back to one decimal place after
+        being stored as float32.
+        """
+        return np.round(self.domain_score.astype(np.float64), 1).tolist()
+
+    def to_results(self) -> List[HmmSearchResult]:
+        """Materialize the table rows as HmmSearchResult objects"""
+        target_names = np.array(self.target_names, dtype=object)
+        query_names = np.array(self.query_names, dtype=object)
+        return list(map(HmmSearchResult,
+                        target_names[self.target_id].tolist(),
+                        query_names[self.query_id].tolist(),
+                        self.scores(),
+                        self.ali_coord_from.tolist(),
+                        self.ali_coord_to.tolist()))
+
+
+def _parse_lines(text: str) -> _Chunk:
+    """Parse domtblout lines interning target and query names in order of first occurrence"""
+    target_index: Dict[str, int] = {}
+    query_index: Dict[str, int] = {}
+    target_ids: List[int] = []
+    query_ids: List[int] = []
+    scores: List[float] = []
+    ali_froms: List[int] = []
+    ali_tos: List[int] = []
+    for line in text.splitlines():
+        if not line or line[0] == '#':
+            continue
+        cells = line.split(None, 19)
+        target_ids.append(target_index.setdefault(cells[0], len(target_index)))
+        query_ids.append(query_index.setdefault(cells[3], len(query_index)))
+        scores.append(float(cells[13]))
+        ali_froms.append(int(cells[17]))
+        ali_tos.append(int(cells[18]))
+    return (list(target_index),
+            np.array(target_ids, dtype=np.int32),
+            list(query_index),
+            np.array(query_ids, dtype=np.int32),
+            np.array(scores, dtype=np.float32),
+            np.array(ali_froms, dtype=np.int32),
+            np.array(ali_tos, dtype=np.int32))
+
+
+def _parse_byte_range(path: str, start: int, end: int) -> _Chunk:
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        return _parse_lines(fh.read(end - start).decode())
+
+
+def newline_aligned_ranges(path: Union[str, Path], n_ranges: int) -> List[Tuple[int, int]]:
+    """Split a file into at most `n_ranges` byte ranges that start and end at line boundaries"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as fh:
+        for i in range(1, n_ranges):
+            offset = max(size * i // n_ranges, bounds[-1])
+            fh.seek(offset)
+            if offset > 0:
+                fh.seek(offset - 1)
+                fh.readline()
+            bounds.append(min(fh.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _merge_names(chunk_names: List[List[str]], chunk_ids: List[np.ndarray]) -> Tuple[List[str], np.ndarray]:
+    """Map per-chunk interned IDs to IDs into the sorted list of all unique names"""
+    names = sorted(set().union(*chunk_names))
+    index = {name: i for i, name in enumerate(names)}
+    ids = [np.array([index[x] for x in local_names], dtype=np.int32)[local_ids] if len(local_ids)
+           else np.zeros(0, dtype=np.int32)
+           for local_names, local_ids in zip(chunk_names, chunk_ids)]
+    return names, np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32)
+
+
+def parse_domtblout_columnar(domtblout: Union[str, Path], processes: Optional[int] = None) -> DomTable:
+    """Parse an HMMer3 hmmsearch domtblout table into a columnar DomTable in file row order
+
+    Large tables are split into newline-aligned byte ranges that are parsed in parallel by a pool of `processes`
+    worker processes (default: number of CPUs).
+    """
+    domtblout = str(domtblout)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes > 1 and os.path.getsize(domtblout) >= PARALLEL_PARSE_MIN_BYTES:
+        ranges = newline_aligned_ranges(domtblout, processes)
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            chunks = list(executor.map(_parse_byte_range,
+                                       [domtblout] * len(ranges),
+                                       [start for start, _ in ranges],
+                                       [end for _, end in ranges]))
+    else:
+        with open(domtblout) as fh:
+            chunks = [_parse_lines(fh.read())]
+    target_names, target_id = _merge_names([x[0] for x in chunks], [x[1] for x in chunks])
+    query_names, query_id = _merge_names([x[2] for x in chunks], [x[3] for x in chunks])
+    return DomTable(target_names=target_names,
+                    query_names=query_names,
+                    target_id=target_id,
+                    query_id=query_id,
+                    domain_score=np.concatenate([x[4] for x in chunks]),
+                    ali_coord_from=np.concatenate([x[5] for x in chunks]),
+                    ali_coord_to=np.concatenate([x[6] for x in chunks]))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Splitting of HMM profile DBs into cached profile shards"""
+import hashlib
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Union, List, Dict, Any, Optional
+
+from viral_verify.cache import file_fingerprint, cache_path, read_manifest, write_manifest
+from viral_verify.io import parse_hmms
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def contiguous_shards(sizes: List[int], n_shards: int) -> List[range]:
+    """Partition items into at most `n_shards` contiguous ranges with similar total size
+
+    Examples
+    --------
+    >>> contiguous_shards([4, 4, 1, 1, 1, 1], 2)
+    [range(0, 2), range(2, 6)]
+    """
+    total = sum(sizes)
+    n_shards = max(1, min(n_shards, len(sizes)))
+    shards: List[range] = []
+    start = 0
+    cumulative = 0
+    for i, size in enumerate(sizes):
+        cumulative += size
+        if cumulative >= total * (len(shards) + 1) / n_shards and len(shards) < n_shards - 1:
+            shards.append(range(start, i + 1))
+            start = i + 1
+    if start < len(sizes):
+        shards.append(range(start, len(sizes)))
+    return shards
+
+
+def split_hmm_db(hmm_db: Union[str, Path], n_shards: int) -> List[Path]:
+    """Split an HMM profile DB into `n_shards` profile shards, reusing previously cached shards
+
+    HMM profiles are split with :func:`viral_verify.io.parse_hmms` into contiguous ranges of profiles balanced by
+    HMM entry size so that concatenating the per-shard hmmsearch results gives rows in the same order as searching
+    the whole DB. Shards are cached next to the HMM DB (or in the user cache directory if that is not writable) in a
+    subdirectory named after the HMM DB path, size and modification time, along with a manifest used to check if the
+    cache is complete.
+
+    A cached shard set is never modified or removed, so concurrent runs can safely share it. Each run writes new
+    shards to a private temporary directory that is renamed into place; if another run renamed a valid shard set into
+    place first, it is used instead. Shard sets of previous versions of the HMM DB are left in place.
+
+    Returns
+    -------
+    List[Path]
+        HMM profile DB shard paths
+    """
+    fingerprint = file_fingerprint(hmm_db)
+    key = hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+    cache_dir = cache_path(hmm_db, f'.shards-{n_shards}') / key
+    shards = _cached_shards(cache_dir, fingerprint)
+    if shards is not None:
+        logger.info(f'Using {len(shards)} cached HMM DB shards in "{cache_dir}"')
+        return shards
+
+    logger.info(f'Splitting HMM DB "{hmm_db}" into {n_shards} shards in "{cache_dir}"')
+    entries = list(parse_hmms(hmm_db))
+    cache_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{cache_dir.name}-', dir=cache_dir.parent))
+    shard_names: List[str] = []
+    for i, shard in enumerate(contiguous_shards([len(x) for x in entries], n_shards)):
+        shard_name = f'shard-{i}.hmm'
+        with open(tmp_dir / shard_name, 'w') as fout:
+            fout.writelines(entries[j] for j in shard)
+        shard_names.append(shard_name)
+    write_manifest(tmp_dir / MANIFEST_FILENAME, dict(hmm_db=fingerprint, shards=shard_names))
+    try:
+        tmp_dir.rename(cache_dir)
+    except OSError:
+        # another run renamed its shards into place first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shards = _cached_shards(cache_dir, fingerprint)
+        if shards is None:
+            raise
+        logger.info(f'Using {len(shards)} HMM DB shards written to "{cache_dir}" by a concurrent run')
+        return shards
+    logger.info(f'Split {len(entries)} HMM profiles into {len(shard_names)} shards in "{cache_dir}"')
+    return [cache_dir / x for x in shard_names]
+
+
+def _cached_shards(cache_dir: Path, fingerprint: Dict[str, Any]) -> Optional[List[Path]]:
+    """Shard paths of a complete shard set of an HMM DB with `fingerprint` in `cache_dir`, or None"""
+    manifest = read_manifest(cache_dir / MANIFEST_FILENAME)
+    if manifest and manifest['hmm_db'] == fingerprint and all((cache_dir / x).exists() for x in manifest['shards']):
+        return [cache_dir / x for x in manifest['shards']]
+    return None
@@ -0,0 +1,164 @@
+"""hmmsearch of unique protein sequences with domain hits fanned back out to identical proteins
+
+Collapsed repeats, redundant assemblies and co-assemblies can produce many identical predicted protein sequences.
+Only one representative protein per unique sequence is searched with hmmsearch and the domtblout rows of each
+representative are copied to every other protein with the same sequence under its own ID and description.
+Identical sequences get identical domain hits and bit scores, so the reported domains and scores are the same as when
+searching every protein. The number of target sequences (``-Z``) and of significant sequences (``--domZ``) for
+E-value calculation are both fixed to the total number of proteins so that E-values do not depend on the number of
+duplicates removed or on the hmmsearch sharding. Domain conditional and independent E-values therefore differ from a
+plain hmmsearch run of every protein, which sets ``--domZ`` to the number of sequences reported as significant.
+Proteins found in an optional :class:`viral_verify.hmmsearch.hit_cache.DomainHitCache` are not searched at all.
+"""
+import logging
+import tempfile
+from pathlib import Path
+from typing import Union, Dict, List, Iterator, Tuple, Optional, Set, IO
+
+import attr
+
+from viral_verify.fasta import read_fasta, sequence, split_header, write_record
+from viral_verify.hmmsearch.hit_cache import DomainHitCache, protein_digest
+from viral_verify.hmmsearch.process import run_hmmsearch_with_sharding, DEFAULT_CPUS_PER_WORKER
+
+logger = logging.getLogger(__name__)
+
+N_DOMTBLOUT_FIELDS = 22
+"""Number of space-delimited domtblout fields before the free text target description"""
+
+
+def iter_fasta_entries(fasta_path: Union[str, Path]) -> Iterator[Tuple[str, str, str]]:
+    """Iterate over the ID, description (header line after the ID) and sequence of each entry in a (compressed) FASTA
+    file"""
+    for header, seq_lines in read_fasta(fasta_path):
+        gene_id, desc = split_header(header)
+        yield gene_id.decode(), desc.decode(), sequence(seq_lines).decode()
+
+
+def domtblout_row_fields(line: str) -> Tuple[str, str]:
+    """Split a domtblout row into the target name and the fields up to the target description"""
+    fields = line.split(None, N_DOMTBLOUT_FIELDS)
+    return fields[0], ' '.join(fields[1:N_DOMTBLOUT_FIELDS])
+
+
+@attr.s
+class ProteinIndex:
+    """Sequence digest and description of each protein in a FASTA file
+
+    Sequences are not kept in memory.
+    """
+    gene_digest: Dict[str, str] = attr.ib(factory=dict)
+    gene_desc: Dict[str, str] = attr.ib(factory=dict)
+
+    @classmethod
+    def from_fasta(cls, fasta_path: Union[str, Path]) -> 'ProteinIndex':
+        index = cls()
+        for gene_id, desc, seq in iter_fasta_entries(fasta_path):
+            index.gene_digest[gene_id] = protein_digest(seq)
+            index.gene_desc[gene_id] = desc
+        return index
+
+    def __len__(self) -> int:
+        return len(self.gene_digest)
+
+    def members(self) -> Dict[str, List[str]]:
+        """Protein IDs with each unique sequence digest in input order; the first is the representative"""
+        out: Dict[str, List[str]] = {}
+        for gene_id, digest in self.gene_digest.items():
+            if digest in out:
+                out[digest].append(gene_id)
+            else:
+                out[digest] = [gene_id]
+        return out
+
+    def write_row(self, fout: IO, gene_id: str, row: str) -> None:
+        """Write domtblout row fields (without target name and description) for a protein"""
+        fout.write(f'{gene_id} {row} {self.gene_desc[gene_id] or "-"}\n')
+
+
+@attr.s
+class ProteinSearchSummary:
+    """Number of proteins searched with hmmsearch, deduplicated and found in the domain hit cache"""
+    n_proteins: int = attr.ib(default=0)
+    n_unique: int = attr.ib(default=0)
+    n_cached: int = attr.ib(default=0)
+    n_searched: int = attr.ib(default=0)
+
+    @property
+    def n_duplicates(self) -> int:
+        """Number of proteins not searched because an identical protein was searched"""
+        return self.n_proteins - self.n_unique
+
+
+def _write_proteins(input_fasta: Union[str, Path], output_fasta: Union[str, Path], gene_ids: Set[str]) -> None:
+    gene_id_bytes = {x.encode() for x in gene_ids}
+    with open(output_fasta, 'wb') as fout:
+        for header, seq_lines in read_fasta(input_fasta):
+            if split_header(header)[0] in gene_id_bytes:
+                write_record(fout, header, seq_lines)
+
+
+def run_hmmsearch_unique(hmm_db: Union[str, Path],
+                         input_fasta: Union[str, Path],
+                         raw_output: Optional[Union[str, Path]],
+                         tblout: Union[str, Path],
+                         threads: int = 1,
+                         sharding: str = 'none',
+                         cpus_per_worker: int = DEFAULT_CPUS_PER_WORKER,
+                         n_shards: Optional[int] = None,
+                         hit_cache: Optional[DomainHitCache] = None) -> ProteinSearchSummary:
+    """Run hmmsearch on unique protein sequences not in the domain hit cache and fan out hits to all proteins
+
+    The hmmsearch run on the representative proteins is the same as :func:`run_hmmsearch_with_sharding`. The raw
+    hmmsearch output only contains the searched representative proteins. If a `hit_cache` is given, it is updated
+    with the domain hits of the searched proteins.
+    """
+    index = ProteinIndex.from_fasta(input_fasta)
+    members = index.members()
+    cached = hit_cache.lookup(members.keys()) if hit_cache is not None else {}
+    representatives = {digest: gene_ids[0] for digest, gene_ids in members.items() if digest not in cached}
+    summary = ProteinSearchSummary(n_proteins=len(index),
+                                   n_unique=len(members),
+                                   n_cached=sum(len(members[x]) for x in cached),
+                                   n_searched=len(representatives))
+    logger.info(f'Searching {summary.n_searched} unique proteins out of {summary.n_proteins} proteins '
+                f'({summary.n_duplicates} duplicates removed, {summary.n_cached} proteins with cached domain hits)')
+    tblout = Path(tblout)
+    with open(tblout, 'w') as fout:
+        if representatives:
+            with tempfile.TemporaryDirectory(prefix='hmmsearch-unique-', dir=tblout.parent) as tmpdir:
+                unique_fasta = Path(tmpdir) / 'proteins.fasta'
+                _write_proteins(input_fasta, unique_fasta, set(representatives.values()))
+                unique_tblout = Path(tmpdir) / 'unique.domtblout'
+                run_hmmsearch_with_sharding(hmm_db=hmm_db,
+                                            input_fasta=unique_fasta,
+                                            raw_output=raw_output,
+                                            tblout=unique_tblout,
+                                            threads=threads,
+                                            sharding=sharding,
+                                            cpus_per_worker=cpus_per_worker,
+                                            n_shards=n_shards,
+                                            z=len(index),
+                                            dom_z=len(index))
+                new_rows: Dict[str, List[str]] = {digest: [] for digest in representatives}
+                with open(unique_tblout) as fh:
+                    for line in fh:
+                        fout.write(line)
+                        if line.startswith('#'):
+                            continue
+                        target, row = domtblout_row_fields(line)
+                        digest = index.gene_digest[target]
+                        new_rows[digest].append(row)
+                        for gene_id in members[digest][1:]:
+                            index.write_row(fout, gene_id, row)
+            if hit_cache is not None:
+                hit_cache.store(new_rows)
+        else:
+            if raw_output:
+                Path(raw_output).write_text('# all proteins found in the domain hit cache\n')
+            fout.write('# domain hits of all proteins from the domain hit cache\n')
+        for digest, rows in cached.items():
+            for gene_id in members[digest]:
+                for row in rows:
+                    index.write_row(fout, gene_id, row)
+    return summary
@@ -0,0 +1,119 @@
+"""Persistent cache of hmmsearch domain hits per protein sequence across runs
+
+Proteins are identified by the digest of their sequence. The cache is an SQLite database in which each entry is keyed
+by the protein digest and a search key derived from the HMM DB contents, the hmmsearch version and search parameters.
+A searched protein is recorded even if it has no domain hits so that it is not searched again.
+
+Only the proteins missing from the cache are searched with hmmsearch (see
+:func:`viral_verify.hmmsearch.dedup.run_hmmsearch_unique`). The cached domtblout rows of the other proteins are merged
+into the domtblout output under the current run's Prodigal gene IDs and descriptions. Since domains are reported with
+the model-specific noise cutoffs (``--cut_nc``), which are bit score thresholds, the set of cached domains and their
+bit scores do not depend on the number of proteins searched. E-values do: the E-values in cached rows were computed
+with ``-Z`` and ``--domZ`` set to the total number of proteins of the run the rows were cached from, so a domtblout
+with cached rows mixes E-values of different runs and is not equivalent to searching every protein in one run.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Union, Dict, List, Iterable
+
+import attr
+
+from viral_verify.cache import cached_file_digest
+from viral_verify.hmmsearch.process import hmmsearch_version
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS searched (
+    search_key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (search_key, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hits (
+    search_key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hits_search_key_digest ON hits (search_key, digest);
+'''
+
+SEARCH_PARAMS = dict(thresholds='--cut_nc')
+"""hmmsearch parameters affecting which domain hits are reported"""
+QUERY_BATCH_SIZE = 500
+
+
+def protein_digest(seq: str) -> str:
+    """Digest identifying a protein sequence"""
+    return hashlib.blake2b(seq.encode(), digest_size=16).hexdigest()
+
+
+def search_key(hmm_db: Union[str, Path]) -> str:
+    """Key identifying the hmmsearch results for an HMM DB by its contents, the hmmsearch version and parameters"""
+    key = dict(hmm_db_sha256=cached_file_digest(hmm_db),
+               hmmsearch=hmmsearch_version(),
+               **SEARCH_PARAMS)
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+@attr.s
+class DomainHitCache:
+    """SQLite cache of domtblout rows per protein digest for one search key
+
+    Rows are stored without the target name and description fields.
+    """
+    path: Path = attr.ib(converter=Path)
+    search_key: str = attr.ib()
+    _conn: sqlite3.Connection = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=300)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path: Union[str, Path], hmm_db: Union[str, Path]) -> 'DomainHitCache':
+        return cls(path=path, search_key=search_key(hmm_db))
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'DomainHitCache':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def lookup(self, digests: Iterable[str]) -> Dict[str, List[str]]:
+        """Get the cached domtblout rows of each searched protein digest (empty list if searched without hits)"""
+        digests = list(dict.fromkeys(digests))
+        out: Dict[str, List[str]] = {}
+        for i in range(0, len(digests), QUERY_BATCH_SIZE):
+            batch = digests[i:i + QUERY_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for (digest,) in self._conn.execute(f'SELECT digest FROM searched '
+                                                f'WHERE search_key = ? AND digest IN ({placeholders})',
+                                                [self.search_key, *batch]):
+                out[digest] = []
+            for digest, row in self._conn.execute(f'SELECT digest, row FROM hits '
+                                                  f'WHERE search_key = ? AND digest IN ({placeholders}) '
+                                                  f'ORDER BY rowid',
+                                                  [self.search_key, *batch]):
+                out[digest].append(row)
+        return out
+
+    def store(self, digest_rows: Dict[str, List[str]]) -> None:
+        """Cache the domtblout rows of searched protein digests in a single transaction
+
+        Digests already cached (e.g. by a concurrent run) are skipped.
+        """
+        with self._conn:
+            for digest, rows in digest_rows.items():
+                cursor = self._conn.execute('INSERT OR IGNORE INTO searched (search_key, digest) VALUES (?, ?)',
+                                            (self.search_key, digest))
+                if cursor.rowcount:
+                    self._conn.executemany('INSERT INTO hits (search_key, digest, row) VALUES (?, ?, ?)',
+                                           ((self.search_key, digest, row) for row in rows))
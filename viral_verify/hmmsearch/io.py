@@ -3,41 +3,64 @@
 import collections
 from collections import OrderedDict
 from pathlib import Path
-from typing import Union, IO, List, Tuple, Mapping, Dict
+from typing import Union, IO, List, Tuple, Mapping, Dict, TYPE_CHECKING
 
-import pandas as pd
+import numpy as np
 
+from viral_verify.hmmsearch.columnar import parse_domtblout_columnar
 from viral_verify.hmmsearch.constants import REGEX_PRODIGAL_GENE_NUMBER
+from viral_verify.hmmsearch.overlap import top_domain_mask, NonOverlappingIntervals
 from viral_verify.hmmsearch.result import HmmSearchResult
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 def parse_domtblout(domtblout: Union[str, Path, IO]) -> List[HmmSearchResult]:
-    """Parse an HMMer3 hmmsearch domtblout table of protein domain predictions into a list of HmmSearchResult"""
-    with open(domtblout) as fh:
-        out = []
-        for line in fh:
-            if line.startswith('#'):
-                continue
-            out.append(HmmSearchResult.from_row_str(line))
-
-    def sort_key(hmm_result: HmmSearchResult):
-        return hmm_result.target_name, hmm_result.domain_score, hmm_result.ali_coord_from
-
-    out.sort(key=sort_key, reverse=True)
-    return out
-
-
-def domtblout_to_dataframe(tblout: Union[str, Path, IO]) -> pd.DataFrame:
-    """Parse an HMMer3 hmmsearch domtblout table of protein predictions into a Pandas DataFrame"""
-    from viral_verify.hmmsearch.constants import HMMSEARCH_DOMTBLOUT_COLUMNS
-    df = pd.read_table(tblout,
-                       sep=r'\s+',
-                       header=None,
-                       comment='#',
-                       usecols=range(0, 22),
-                       names=HMMSEARCH_DOMTBLOUT_COLUMNS)
-    df.sort_values(['target_name', 'domain_score', 'ali_coord_from'], ascending=False, inplace=True)
-    return df
+    """Parse an HMMer3 hmmsearch domtblout table of protein domain predictions into a list of HmmSearchResult
+
+    Results are sorted by descending target name, domain score and alignment start.
+    """
+    return parse_domtblout_columnar(domtblout).sorted().to_results()
+
+
+def merge_domtblouts(domtblouts: List[Union[str, Path]], output: Union[str, Path]) -> None:
+    """Merge multiple hmmsearch domtblout tables into one
+
+    Result rows are written in the order of the input tables, between the leading and trailing comment lines of the
+    first table.
+    """
+    with open(output, 'w') as fout:
+        trailer: List[str] = []
+        for i, domtblout in enumerate(domtblouts):
+            with open(domtblout) as fh:
+                seen_rows = False
+                for line in fh:
+                    if line.startswith('#'):
+                        if i == 0:
+                            if seen_rows:
+                                trailer.append(line)
+                            else:
+                                fout.write(line)
+                        continue
+                    seen_rows = True
+                    fout.write(line)
+        fout.writelines(trailer)
+
+
+def domtblout_to_dataframe(tblout: Union[str, Path, IO]) -> 'pd.DataFrame':
+    """Parse an HMMer3 hmmsearch domtblout table of protein predictions into a Pandas DataFrame
+
+    The DataFrame has the target and query name, domain score and alignment coordinate columns sorted by descending
+    target name, domain score and alignment start. Pandas is only imported when this function is called.
+    """
+    import pandas as pd
+    table = parse_domtblout_columnar(tblout).sorted()
+    return pd.DataFrame(dict(target_name=np.array(table.target_names, dtype=object)[table.target_id],
+                             query_name=np.array(table.query_names, dtype=object)[table.query_id],
+                             domain_score=table.scores(),
+                             ali_coord_from=table.ali_coord_from,
+                             ali_coord_to=table.ali_coord_to))
 
 
 def top_hmm_results(tblout: Union[str, Path, IO]) -> Tuple[Mapping[str, List[str]], Dict[str, List[HmmSearchResult]]]:
@@ -54,8 +77,15 @@ def top_hmm_results(tblout: Union[str, Path, IO]) -> Tuple[Mapping[str, List[str
         2 element tuple: dict of contig name to top predicted protein domains; dict of Prodigal gene name
         to list of HmmSearchResult
     """
-    hmm_results: List[HmmSearchResult] = parse_domtblout(tblout)
-    top_domains = top_domains_per_predicted_gene(hmm_results)
+    table = parse_domtblout_columnar(tblout).sorted()
+    top_table = table.take(top_domain_mask(table))
+    target_names = np.array(top_table.target_names, dtype=object)[top_table.target_id].tolist()
+    top_domains: Dict[str, List[HmmSearchResult]] = {}
+    for target_name, hmm_result in zip(target_names, top_table.to_results()):
+        if target_name not in top_domains:
+            top_domains[target_name] = [hmm_result]
+        else:
+            top_domains[target_name].append(hmm_result)
     contig_domains = top_domains_per_contig(top_domains)
     return contig_domains, top_domains
 
@@ -73,12 +103,18 @@ def top_domains_per_contig(top_domains: Dict[str, List[HmmSearchResult]]) -> Map
 
 
 def top_domains_per_predicted_gene(hmm_results: List[HmmSearchResult]) -> Dict[str, List[HmmSearchResult]]:
-    top_domains = {}
+    """Greedily select the top non-overlapping domains of each predicted gene
+
+    Each result is selected if its alignment does not overlap any result already selected for the same gene, so
+    `hmm_results` should be sorted by descending domain score (see :func:`parse_domtblout`).
+    """
+    top_domains: Dict[str, List[HmmSearchResult]] = {}
+    intervals: Dict[str, NonOverlappingIntervals] = {}
     for hmm_result in hmm_results:
         target_name: str = hmm_result.target_name
         if target_name not in top_domains:
-            top_domains[target_name] = [hmm_result]
-        else:
-            if not hmm_result.overlaps(top_domains[target_name]):
-                top_domains[target_name] += [hmm_result]
+            intervals[target_name] = NonOverlappingIntervals()
+            top_domains[target_name] = []
+        if intervals[target_name].add_if_disjoint(hmm_result.ali_coord_from, hmm_result.ali_coord_to):
+            top_domains[target_name].append(hmm_result)
     return top_domains
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Selection of top non-overlapping protein domains with sorted interval structures"""
+from bisect import bisect_left, insort
+from typing import List, Tuple
+
+import numpy as np
+
+from viral_verify.hmmsearch.columnar import DomTable
+
+
+class NonOverlappingIntervals:
+    """Set of mutually non-overlapping alignment intervals kept sorted by (start, end)
+
+    Intervals ``a`` and ``b`` overlap if ``a.end > b.start and a.start < b.end`` (see
+    :meth:`viral_verify.hmmsearch.result.HmmSearchResult.overlaps`). For intervals with ``start <= end`` that do not
+    overlap each other, ordering by (start, end) also orders the ends, so the only interval that can overlap a new
+    interval is the last one starting before the new interval ends, which is found by binary search.
+    """
+    __slots__ = ('intervals', 'sorted_ends')
+
+    def __init__(self):
+        self.intervals: List[Tuple[int, int]] = []
+        self.sorted_ends = True
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Does the interval overlap any interval in the set?"""
+        if not self.sorted_ends:
+            return any(end > s and start < e for s, e in self.intervals)
+        i = bisect_left(self.intervals, (end,))
+        return i > 0 and self.intervals[i - 1][1] > start
+
+    def add_if_disjoint(self, start: int, end: int) -> bool:
+        """Add the interval to the set if it does not overlap any interval already in the set"""
+        if self.overlaps(start, end):
+            return False
+        if start > end:
+            # ends are no longer guaranteed to be ordered with reversed coordinates
+            self.sorted_ends = False
+        insort(self.intervals, (start, end))
+        return True
+
+
+def top_domain_mask(table: DomTable) -> np.ndarray:
+    """Greedily select the top non-overlapping domains of each target in a sorted DomTable
+
+    `table` must be sorted with :meth:`DomTable.sorted` so that the rows of each target are contiguous and in
+    descending domain score order. The first (top scoring) domain of each target is always selected, so targets with
+    a single domain are handled with a vectorized pass. For targets with multiple domains, each domain is selected if
+    it does not overlap any already selected domain of the target, which takes O(k log k) comparisons for k domains.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean mask of selected rows
+    """
+    n = len(table)
+    mask = np.zeros(n, dtype=bool)
+    if n == 0:
+        return mask
+    target_id = table.target_id
+    starts = np.flatnonzero(np.concatenate(([True], target_id[1:] != target_id[:-1])))
+    ends = np.append(starts[1:], n)
+    mask[starts] = True
+    ali_from = table.ali_coord_from
+    ali_to = table.ali_coord_to
+    for start, end in zip(starts[ends - starts > 1].tolist(), ends[ends - starts > 1].tolist()):
+        intervals = NonOverlappingIntervals()
+        froms = ali_from[start:end].tolist()
+        tos = ali_to[start:end].tolist()
+        for i, (f, t) in enumerate(zip(froms, tos)):
+            if intervals.add_if_disjoint(f, t) and i:
+                mask[start + i] = True
+    return mask
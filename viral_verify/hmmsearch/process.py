@@ -1,16 +1,43 @@
 import logging
+import os
+import re
 import subprocess as sp
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Union, IO
+from typing import Union, IO, Optional, List
+
+from viral_verify.hmmsearch.db import split_hmm_db
+from viral_verify.hmmsearch.io import merge_domtblouts
+from viral_verify.shard import write_fasta_shards, fasta_record_spans
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CPUS_PER_WORKER = 4
+"""Default number of worker threads per hmmsearch process when running sharded searches"""
+REGEX_HMMER_VERSION = re.compile(r'HMMER \S+')
+"""Regular expression to match the HMMER version (e.g. "HMMER 3.3.2") in ``hmmsearch -h`` output"""
+
+
+@lru_cache()
+def hmmsearch_version() -> Optional[str]:
+    """Get the version of HMMER hmmsearch in the PATH (e.g. "HMMER 3.3.2") or None if it cannot be determined"""
+    try:
+        proc = sp.run(['hmmsearch', '-h'], stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.STDOUT, timeout=60)
+    except (OSError, sp.SubprocessError):
+        return None
+    m = REGEX_HMMER_VERSION.search(proc.stdout.decode(errors='replace'))
+    return m.group(0) if m else None
+
 
 def run_hmmsearch(hmm_db: Union[str, Path, IO],
                   input_fasta: Union[str, Path, IO],
-                  raw_output: Union[str, Path, IO],
+                  raw_output: Optional[Union[str, Path, IO]],
                   tblout: Union[str, Path, IO],
-                  threads: int = 1) -> None:
+                  threads: int = 1,
+                  z: Optional[int] = None,
+                  dom_z: Optional[int] = None) -> None:
     """Run HMMer3 hmmsearch with a protein sequence FASTA against an HMM profile DB like Pfam.
 
     Parameters
@@ -19,21 +46,226 @@ def run_hmmsearch(hmm_db: Union[str, Path, IO],
         HMM profile DB path
     input_fasta : Union[str, Path, IO]
         Protein FASTA path
-    raw_output : Union[str, Path, IO]
-        Raw hmmsearch output path
+    raw_output : Optional[Union[str, Path, IO]]
+        Raw hmmsearch output path; discarded if None
     tblout : Union[str, Path, IO]
         Tabular space-delimited ``--domtblout`` protein domain output path
     threads : int
         Number of threads to run hmmsearch with
+    z : Optional[int]
+        Number of target sequences for E-value calculation (``-Z``)
+    dom_z : Optional[int]
+        Number of significant sequences for domain E-value calculation (``--domZ``)
     """
     cmd_list = ['hmmsearch', '--noali', '--cut_nc',
-                '-o', str(raw_output), '--domtblout', str(tblout),
-                '--cpu', str(threads),
-                str(hmm_db), str(input_fasta)]
+                '-o', str(raw_output) if raw_output else os.devnull, '--domtblout', str(tblout),
+                '--cpu', str(threads)]
+    if z is not None:
+        cmd_list += ['-Z', str(z)]
+    if dom_z is not None:
+        cmd_list += ['--domZ', str(dom_z)]
+    cmd_list += [str(hmm_db), str(input_fasta)]
     cmd = ' '.join(cmd_list)
     logger.info(f'Running hmmsearch command: {cmd}')
     sp.run(cmd_list,
-           stdout=sp.PIPE,
+           stdout=sp.DEVNULL,
            stderr=sp.PIPE,
            check=True)
-    logger.info(f'Ran hmmsearch with tabular output at "{tblout}" and raw output at "{raw_output}"')
+    logger.info(f'Ran hmmsearch with tabular output at "{tblout}"'
+                + (f' and raw output at "{raw_output}"' if raw_output else ''))
+
+
+def run_hmmsearch_sequence_sharded(hmm_db: Union[str, Path],
+                                   input_fasta: Union[str, Path],
+                                   raw_output: Optional[Union[str, Path]],
+                                   tblout: Union[str, Path],
+                                   threads: int = 1,
+                                   cpus_per_worker: int = DEFAULT_CPUS_PER_WORKER,
+                                   n_shards: Optional[int] = None,
+                                   z: Optional[int] = None) -> None:
+    """Run multiple hmmsearch processes over shards of a protein FASTA and merge their output.
+
+    hmmsearch multithreading does not scale well past a few worker threads, so the protein FASTA is split into
+    `n_shards` shards balanced by total residues that are pulled from a work queue by ``threads // cpus_per_worker``
+    concurrent hmmsearch processes each running with `cpus_per_worker` threads. The number of target sequences
+    (``-Z``) and significant sequences (``--domZ``) are fixed to the total number of input proteins (or `z`) so that
+    E-values do not depend on the sharding.
+
+    Parameters
+    ----------
+    hmm_db : Union[str, Path]
+        HMM profile DB path
+    input_fasta : Union[str, Path]
+        Protein FASTA path
+    raw_output : Optional[Union[str, Path]]
+        Merged raw hmmsearch output path; discarded if None
+    tblout : Union[str, Path]
+        Merged tabular space-delimited ``--domtblout`` protein domain output path
+    threads : int
+        Total number of threads to use
+    cpus_per_worker : int
+        Number of threads for each hmmsearch process
+    n_shards : Optional[int]
+        Number of protein FASTA shards (default: 4 shards per hmmsearch process)
+    z : Optional[int]
+        Number of target sequences for E-value calculation (default: number of input proteins)
+    """
+    cpus_per_worker = max(1, min(cpus_per_worker, threads))
+    n_workers = max(1, threads // cpus_per_worker)
+    if n_shards is None:
+        n_shards = n_workers * 4
+    n_proteins = len(fasta_record_spans(input_fasta))
+    if z is None:
+        z = n_proteins
+    tblout = Path(tblout)
+    with tempfile.TemporaryDirectory(prefix='hmmsearch-shards-', dir=tblout.parent) as tmpdir:
+        shards = write_fasta_shards(input_fasta, tmpdir, n_shards, prefix='proteins')
+        logger.info(f'Split {n_proteins} proteins in "{input_fasta}" into {len(shards)} shards for {n_workers} '
+                    f'hmmsearch processes with {cpus_per_worker} threads each')
+        shard_raw_outputs: List[Optional[Path]] = [s.path.with_suffix('.output') if raw_output else None
+                                                   for s in shards]
+        shard_tblouts: List[Path] = [s.path.with_suffix('.domtblout') for s in shards]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(run_hmmsearch,
+                                       hmm_db=hmm_db,
+                                       input_fasta=shard.path,
+                                       raw_output=shard_raw_output,
+                                       tblout=shard_tblout,
+                                       threads=cpus_per_worker,
+                                       z=z,
+                                       dom_z=z)
+                       for shard, shard_raw_output, shard_tblout in zip(shards, shard_raw_outputs, shard_tblouts)]
+            for future in futures:
+                future.result()
+        if raw_output:
+            _concatenate_files(shard_raw_outputs, raw_output)
+        merge_domtblouts(shard_tblouts, tblout)
+    logger.info(f'Ran {len(shards)} sharded hmmsearch jobs with merged tabular output at "{tblout}" and raw output '
+                f'at "{raw_output}"')
+
+
+def run_hmmsearch_profile_sharded(hmm_db: Union[str, Path],
+                                  input_fasta: Union[str, Path],
+                                  raw_output: Optional[Union[str, Path]],
+                                  tblout: Union[str, Path],
+                                  threads: int = 1,
+                                  cpus_per_worker: int = DEFAULT_CPUS_PER_WORKER,
+                                  n_shards: Optional[int] = None,
+                                  z: Optional[int] = None,
+                                  dom_z: Optional[int] = None) -> None:
+    """Run hmmsearch concurrently against shards of the HMM profile DB and merge their output.
+
+    For small inputs with few proteins, most of the hmmsearch run time is spent scanning the HMM profiles, so
+    splitting the proteins gives little parallelism. Instead, the HMM DB is split into `n_shards` cached profile
+    shards (see :func:`viral_verify.hmmsearch.db.split_hmm_db`) and each shard is searched by a concurrent hmmsearch
+    process running with `cpus_per_worker` threads. Since every hmmsearch process searches all proteins, scores and
+    E-values are the same as searching the whole HMM DB.
+
+    Parameters
+    ----------
+    hmm_db : Union[str, Path]
+        HMM profile DB path
+    input_fasta : Union[str, Path]
+        Protein FASTA path
+    raw_output : Optional[Union[str, Path]]
+        Merged raw hmmsearch output path; discarded if None
+    tblout : Union[str, Path]
+        Merged tabular space-delimited ``--domtblout`` protein domain output path
+    threads : int
+        Total number of threads to use
+    cpus_per_worker : int
+        Number of threads for each hmmsearch process
+    n_shards : Optional[int]
+        Number of HMM profile DB shards (default: one per hmmsearch process)
+    z : Optional[int]
+        Number of target sequences for E-value calculation (``-Z``)
+    dom_z : Optional[int]
+        Number of significant sequences for domain E-value calculation (``--domZ``)
+    """
+    cpus_per_worker = max(1, min(cpus_per_worker, threads))
+    n_workers = max(1, threads // cpus_per_worker)
+    if n_shards is None:
+        n_shards = n_workers
+    hmm_shards = split_hmm_db(hmm_db, n_shards)
+    tblout = Path(tblout)
+    with tempfile.TemporaryDirectory(prefix='hmmsearch-shards-', dir=tblout.parent) as tmpdir:
+        logger.info(f'Searching "{input_fasta}" against {len(hmm_shards)} HMM DB shards with {n_workers} '
+                    f'hmmsearch processes with {cpus_per_worker} threads each')
+        shard_raw_outputs: List[Optional[Path]] = [Path(tmpdir) / f'profiles-{i}.output' if raw_output else None
+                                                   for i in range(len(hmm_shards))]
+        shard_tblouts: List[Path] = [Path(tmpdir) / f'profiles-{i}.domtblout' for i in range(len(hmm_shards))]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(run_hmmsearch,
+                                       hmm_db=hmm_shard,
+                                       input_fasta=input_fasta,
+                                       raw_output=shard_raw_output,
+                                       tblout=shard_tblout,
+                                       threads=cpus_per_worker,
+                                       z=z,
+                                       dom_z=dom_z)
+                       for hmm_shard, shard_raw_output, shard_tblout in zip(hmm_shards,
+                                                                            shard_raw_outputs,
+                                                                            shard_tblouts)]
+            for future in futures:
+                future.result()
+        if raw_output:
+            _concatenate_files(shard_raw_outputs, raw_output)
+        merge_domtblouts(shard_tblouts, tblout)
+    logger.info(f'Ran {len(hmm_shards)} HMM DB sharded hmmsearch jobs with merged tabular output at "{tblout}" and '
+                f'raw output at "{raw_output}"')
+
+
+def run_hmmsearch_with_sharding(hmm_db: Union[str, Path],
+                                input_fasta: Union[str, Path],
+                                raw_output: Optional[Union[str, Path]],
+                                tblout: Union[str, Path],
+                                threads: int = 1,
+                                sharding: str = 'none',
+                                cpus_per_worker: int = DEFAULT_CPUS_PER_WORKER,
+                                n_shards: Optional[int] = None,
+                                z: Optional[int] = None,
+                                dom_z: Optional[int] = None) -> None:
+    """Run hmmsearch with sequence (``"sequence"``), HMM profile (``"profile"``) or no sharding (``"none"``)
+
+    `z` and `dom_z` optionally set the number of target sequences (``-Z``) and significant sequences (``--domZ``) for
+    E-value calculation. Sequence sharding always fixes ``--domZ`` to `z` (see
+    :func:`run_hmmsearch_sequence_sharded`).
+    """
+    if sharding == 'sequence':
+        run_hmmsearch_sequence_sharded(hmm_db=hmm_db,
+                                       input_fasta=input_fasta,
+                                       raw_output=raw_output,
+                                       tblout=tblout,
+                                       threads=threads,
+                                       cpus_per_worker=cpus_per_worker,
+                                       n_shards=n_shards,
+                                       z=z)
+    elif sharding == 'profile':
+        run_hmmsearch_profile_sharded(hmm_db=hmm_db,
+                                      input_fasta=input_fasta,
+                                      raw_output=raw_output,
+                                      tblout=tblout,
+                                      threads=threads,
+                                      cpus_per_worker=cpus_per_worker,
+                                      n_shards=n_shards,
+                                      z=z,
+                                      dom_z=dom_z)
+    else:
+        run_hmmsearch(hmm_db=hmm_db,
+                      input_fasta=input_fasta,
+                      raw_output=raw_output,
+                      tblout=tblout,
+                      threads=threads,
+                      z=z,
+                      dom_z=dom_z)
+
+
+def _concatenate_files(paths: List[Path], output_path: Union[str, Path]) -> None:
+    with open(output_path, 'wb') as fout:
+        for path in paths:
+            with open(path, 'rb') as fh:
+                while True:
+                    chunk = fh.read(1 << 20)
+                    if not chunk:
+                        break
+                    fout.write(chunk)
@@ -3,22 +3,22 @@ from typing import List
 import attr
 
 
-@attr.s
+@attr.s(slots=True)
 class HmmSearchResult:
     """HMMer3 hmmsearch protein domain prediction result
 
     Only values necessary for Naive Bayes classification are used, i.e. domain
     score and alignment coordinates for checking overlap with other predicted
-    domains."""
+    domains. Values are cast by the converters, so no validators are needed."""
     target_name: str = attr.ib(init=True)
     """Target sequence name (e.g. predicted protein gene ID)"""
     query_name: str = attr.ib(init=True)
     """Query sequence name (e.g. protein domain name)"""
-    domain_score: float = attr.ib(init=True, converter=float, validator=attr.validators.instance_of(float))
+    domain_score: float = attr.ib(init=True, converter=float)
     """hmmsearch protein domain prediction score"""
-    ali_coord_from: int = attr.ib(init=True, converter=int, validator=attr.validators.instance_of(int))
+    ali_coord_from: int = attr.ib(init=True, converter=int)
     """hmmsearch result alignment start index"""
-    ali_coord_to: int = attr.ib(init=True, converter=int, validator=attr.validators.instance_of(int))
+    ali_coord_to: int = attr.ib(init=True, converter=int)
     """hmmsearch result alignment end index"""
 
     @classmethod
@@ -27,9 +27,9 @@ class HmmSearchResult:
         cells = row.strip().split()
         return cls(target_name=cells[0],
                    query_name=cells[3],
-                   domain_score=float(cells[13]),
-                   ali_coord_from=int(cells[17]),
-                   ali_coord_to=int(cells[18]))
+                   domain_score=cells[13],
+                   ali_coord_from=cells[17],
+                   ali_coord_to=cells[18])
 
     def overlaps(self, target_results: List['HmmSearchResult']) -> bool:
         """Does this HmmSearchResult overlap other HmmSearchResults?"""
@@ -1,131 +1,198 @@
-import re
+import contextlib
+import csv
 from pathlib import Path
-from typing import Dict, Union, IO, List, Mapping, Iterator
-
-import attr
-import pandas as pd
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
+from typing import Dict, Union, IO, List, Mapping, Iterator, Iterable, Tuple, Optional
 
+from viral_verify.classified_fasta import ClassifiedFastaWriter, classification_suffix
+from viral_verify.compression import open_binary_output
 from viral_verify.contig import Contig
+from viral_verify.faidx import IndexedFasta
+from viral_verify.fasta import load_fasta, iter_prodigal_records, parse_prodigal_header
+from viral_verify.hmm_index import scan_hmm_names_to_desc
 from viral_verify.naive_bayes import NaiveBayesClassification
-from viral_verify.naive_bayes.constants import Classification
-from viral_verify.prodigal import prodigal_gene_start
+from viral_verify.results import open_results_writer, result_row
 
 
 def write_circular_contigs_fasta(contig_infos: Dict[str, Contig],
                                  output_path: Union[str, Path, IO]) -> None:
     with open(output_path, 'w') as fout:
         for contig_info in contig_infos.values():
-            fout.write(contig_info.circular_seq_fasta())
+            fout.writelines(contig_info.iter_circular_seq_fasta())
 
 
-def parse_contigs(fasta_path: Union[str, Path, IO],
+def parse_contigs(fasta_path: Union[str, Path],
                   min_length: int = 500,
                   kmax: int = 200,
-                  kmin: int = 50) -> Dict[str, Contig]:
-    return {rec.id: Contig.from_seq_record(rec,
-                                           min_length=min_length,
-                                           kmax=kmax,
-                                           kmin=kmin) for rec in SeqIO.parse(fasta_path, 'fasta')}
+                  kmin: int = 50,
+                  max_length: Optional[int] = None,
+                  threads: int = 1) -> Dict[str, Contig]:
+    """Index the contigs in a FASTA file and determine which could be circular
+
+    Only the location of each contig sequence in the memory-mapped FASTA file is kept in memory (see
+    :class:`viral_verify.faidx.IndexedFasta`). Sequences are read back from the file when they are written out.
+    Contigs of `min_length` up to `max_length` bases are checked for circularity (see
+    :class:`viral_verify.circularity.CircularityPolicy`).
+
+    gzip, BGZF and Zstandard compressed FASTA files are decompressed into memory, BGZF files using `threads` threads.
+    """
+    fasta = IndexedFasta(fasta_path, threads=threads)
+    return {entry.name: Contig.from_fasta_index(fasta,
+                                                entry,
+                                                min_length=min_length,
+                                                kmax=kmax,
+                                                kmin=kmin,
+                                                max_length=max_length) for entry in fasta.index()}
+
+
+def write_contigs_fasta(contigs: Iterable[Contig],
+                        output_path: Union[str, Path],
+                        wrap: int = 60) -> None:
+    """Write contig sequences to a FASTA file with sequence lines wrapped at `wrap` characters
+
+    Sequences are read from the input FASTA file one contig at a time.
+    """
+    with open(output_path, 'w') as fout:
+        for contig in contigs:
+            fout.write(f'>{contig.description}\n')
+            seq = contig.seq()
+            for i in range(0, len(seq), wrap):
+                fout.write(seq[i:i + wrap])
+                fout.write('\n')
 
 
 def output_classified_contigs(contig_classifications: Dict[str, NaiveBayesClassification],
                               contigs: Dict[str, Contig],
                               outdir: Path,
                               output_plasmids_separately: bool,
-                              prefix: str) -> None:
+                              prefix: str,
+                              skip_reasons: Optional[Mapping[str, str]] = None,
+                              length_stats_path: Optional[Path] = None,
+                              compress: bool = False,
+                              threads: int = 1) -> List[Path]:
+    """Write classified contigs to a FASTA file per classification returning the paths of the written files
+
+    Contigs are streamed to the classification output files in a single pass, with the files written concurrently
+    and sequences copied from the input FASTA file by byte offset (see :class:`ClassifiedFastaWriter`).
+
+    Contigs skipped by pre-filters (see :mod:`viral_verify.prefilter`) are written to the unclassified contigs FASTA
+    with their skip reason (``skip_reason=<reason>``) appended to the FASTA header.
+
+    If `length_stats_path` is given, the number of contigs, total, min, max, mean and N50 length of the contigs in
+    each output file are written there as CSV.
+
+    If `compress`, the FASTA files are BGZF compressed (``.fasta.gz``) using `threads` threads.
+    """
     prediction_fasta_dir: Path = outdir / 'classified-fasta-output'
     prediction_fasta_dir.mkdir(parents=True, exist_ok=True)
-    viral_recs = []
-    plasmid_recs = []
-    chromosome_recs = []
-    viral_uncertain_recs = []
-    plasmid_uncertain_recs = []
-    unclassified_recs = []
-
     contig: str
     info: Contig
-    for contig, info in contigs.items():
-        if contig not in contig_classifications:
-            continue
-        nbc: NaiveBayesClassification = contig_classifications[contig]
-        # output_fasta_entry = f'>{info.seq_rec.description}\n{str(info.seq_rec.seq)}\n'
-        if nbc.classification == Classification.VIRUS:
-            viral_recs.append(info.seq_rec)
-        elif nbc.classification == Classification.CHROMOSOME:
-            chromosome_recs.append(info.seq_rec)
-        elif nbc.classification == Classification.PLASMID:
-            if output_plasmids_separately:
-                plasmid_recs.append(info.seq_rec)
-            else:
-                chromosome_recs.append(info.seq_rec)
-        elif nbc.classification == Classification.UNCERTAIN_VIRAL_OR_BACTERIAL:
-            viral_uncertain_recs.append(info.seq_rec)
-        elif nbc.classification == Classification.UNCERTAIN_PLASMID_OR_CHROMOSOMAL:
-            if output_plasmids_separately:
-                plasmid_uncertain_recs.append(info.seq_rec)
-            else:
-                chromosome_recs.append(info.seq_rec)
-        else:
-            unclassified_recs.append(info.seq_rec)
-
-    if len(viral_recs) > 0:
-        SeqIO.write(viral_recs,
-                    prediction_fasta_dir / (prefix + '-viral.fasta'),
-                    'fasta')
-    if len(plasmid_recs) > 0:
-        SeqIO.write(plasmid_recs,
-                    prediction_fasta_dir / (prefix + '-plasmid.fasta'),
-                    'fasta')
-    if len(chromosome_recs) > 0:
-        SeqIO.write(chromosome_recs,
-                    prediction_fasta_dir / (prefix + '-chromosome.fasta'),
-                    'fasta')
-    if len(viral_uncertain_recs) > 0:
-        SeqIO.write(viral_uncertain_recs,
-                    prediction_fasta_dir / (prefix + '-viral_uncertain.fasta'),
-                    'fasta')
-    if len(plasmid_uncertain_recs) > 0:
-        SeqIO.write(plasmid_uncertain_recs,
-                    prediction_fasta_dir / (prefix + '-plasmid_uncertain.fasta'),
-                    'fasta')
-    if len(unclassified_recs) > 0:
-        SeqIO.write(unclassified_recs,
-                    prediction_fasta_dir / (prefix + '-unclassified.fasta'),
-                    'fasta')
+    with ClassifiedFastaWriter(prediction_fasta_dir,
+                               prefix,
+                               length_stats=length_stats_path is not None,
+                               compress=compress,
+                               threads=threads) as writer:
+        for contig, info in contigs.items():
+            if contig in contig_classifications:
+                writer.write(info, classification_suffix(contig_classifications[contig].classification,
+                                                         output_plasmids_separately))
+            elif skip_reasons and contig in skip_reasons:
+                writer.write(info, 'unclassified', description=f'{info.description} skip_reason={skip_reasons[contig]}')
+    if length_stats_path is not None:
+        with open(length_stats_path, 'w', newline='') as fout:
+            csv_writer = csv.writer(fout)
+            csv_writer.writerow(['classification', 'n_contigs', 'total_length', 'min_length', 'max_length',
+                                 'mean_length', 'n50'])
+            for suffix, stats in writer.stats.items():
+                csv_writer.writerow([suffix, *stats.to_dict().values()])
+    return writer.paths
 
 
 def filter_predicted_genes(input_fasta: Union[str, Path, IO],
                            output_fasta: Union[str, Path, IO],
-                           contig_len_circ: Dict[str, Contig]) -> None:
-    filtered_recs: List[SeqRecord] = []
-    for rec in SeqIO.parse(input_fasta, 'fasta'):
-        contig_name = re.sub(r'_\d+$', '', rec.id)
-        gene_start = prodigal_gene_start(rec.description)
-        contig_info = contig_len_circ[contig_name]
-        if gene_start < contig_info.seq_len:
-            filtered_recs.append(rec)
-    SeqIO.write(filtered_recs, output_fasta, 'fasta')
+                           contig_len_circ: Dict[str, Contig]) -> Tuple[int, int]:
+    """Filter Prodigal predicted proteins to genes starting within the original contig sequence
+
+    Proteins are read with the bytes-level FASTA reader (see :func:`viral_verify.fasta.iter_prodigal_records`) and
+    the entries of kept proteins are copied to the output as they are. Input and output paths may be compressed (see
+    :func:`viral_verify.compression.open_binary_output`); an output handle must be opened in binary mode.
+
+    Returns the number of proteins written and the total number of proteins.
+    """
+    seq_lens = {name.encode(): contig.seq_len for name, contig in contig_len_circ.items()}
+    n_kept = 0
+    n_total = 0
+    with contextlib.ExitStack() as stack:
+        if isinstance(output_fasta, (str, Path)):
+            output_fasta = stack.enter_context(open_binary_output(output_fasta))
+        write = output_fasta.write
+        last_record = b''
+        for contig_name, gene_start, record in iter_prodigal_records(load_fasta(input_fasta)):
+            n_total += 1
+            if gene_start < seq_lens[contig_name]:
+                write(record)
+                last_record = record
+                n_kept += 1
+        if len(last_record) and last_record[-1:] != b'\n':
+            write(b'\n')
+    return n_kept, n_total
+
+
+def filter_predicted_gene_lines(lines: Iterable[str],
+                                fout: IO,
+                                contig_len_circ: Dict[str, Contig]) -> Tuple[int, int]:
+    """Filter streamed Prodigal protein FASTA lines to genes starting within the original contig sequence
+
+    Parameters
+    ----------
+    lines
+        Prodigal protein FASTA output lines
+    fout
+        Text handle to write filtered protein FASTA entries to
+    contig_len_circ
+        Contig name to Contig info
+
+    Returns
+    -------
+    Tuple[int, int]
+        Number of proteins written and total number of proteins
+    """
+    n_kept = 0
+    n_total = 0
+    keep = False
+    for line in lines:
+        if line.startswith('>'):
+            n_total += 1
+            contig_name, gene_start = parse_prodigal_header(line[1:])
+            keep = gene_start < contig_len_circ[contig_name].seq_len
+            if keep:
+                n_kept += 1
+        if keep:
+            fout.write(line)
+    return n_kept, n_total
 
 
 def output_results_table(results_csv_path: Path,
                          contigs: Dict[str, Contig],
                          contig_domains: Mapping[str, List[str]],
                          contig_classifications: Dict[str, NaiveBayesClassification],
-                         protein_name_to_desc: Dict[str, str]) -> None:
-    results: List[Dict] = []
-    for contig_name, contig in contigs.items():
-        if contig_name in contig_classifications:
-            result = attr.asdict(contig_classifications[contig_name])
-            result['protein_domains'] = ';'.join((f'{x} [{protein_name_to_desc[x]}]'
-                                                  for x in contig_domains[contig_name]))
-            results.append(result)
-        else:
-            results.append(dict(contig_name=contig_name,
-                                classification='Unclassified'))
-    df_results = pd.DataFrame(results)
-    df_results.to_csv(results_csv_path, index=False)
+                         protein_name_to_desc: Dict[str, str],
+                         skip_reasons: Optional[Mapping[str, str]] = None,
+                         fmt: str = 'csv') -> None:
+    """Write the classification results of all contigs to a table one contig at a time
+
+    The table is written as CSV by default or in another format `fmt` (see
+    :func:`viral_verify.results.open_results_writer`).
+
+    If `skip_reasons` are given (i.e. pre-filters are active), the table has a ``skip_reason`` column with the reason
+    each contig was skipped by the pre-filters (empty if it was not skipped).
+    """
+    with open_results_writer(results_csv_path, fmt, skip_reason=skip_reasons is not None) as writer:
+        for contig_name in contigs:
+            row = result_row(contig_name, contig_classifications.get(contig_name), contig_domains,
+                             protein_name_to_desc)
+            if skip_reasons is not None:
+                row['skip_reason'] = skip_reasons.get(contig_name)
+            writer.write(row)
 
 
 def parse_hmms(hmm_path: Union[str, Path]) -> Iterator[str]:
@@ -142,18 +209,18 @@ def parse_hmms(hmm_path: Union[str, Path]) -> Iterator[str]:
         HMM entry text
     """
     with open(hmm_path) as handle:
-        entry = ''
+        lines: List[str] = []
         for line in handle:
             if line.startswith('//'):
-                entry += line
-                yield entry
-                entry = ''
+                lines.append(line)
+                yield ''.join(lines)
+                lines = []
             elif line.rstrip() == '':
                 continue
             else:
-                entry += line
-        if entry != '':
-            yield entry
+                lines.append(line)
+        if lines:
+            yield ''.join(lines)
 
 
 def hmm_name(entry_text: str) -> str:
@@ -171,5 +238,9 @@ def hmm_desc(entry_text: str) -> str:
 
 
 def hmm_names_to_desc(hmm_path: Union[str, Path]) -> Dict[str, str]:
-    """Parse an HMM file into a dictionary of protein names to descriptions"""
-    return {hmm_name(x): hmm_desc(x) for x in parse_hmms(hmm_path)}
+    """Parse an HMM file into a dictionary of protein names to descriptions
+
+    Only the HMM entry headers are scanned (see :func:`viral_verify.hmm_index.scan_hmm_names_to_desc`). Use
+    :func:`viral_verify.hmm_index.load_hmm_names_to_desc` to use a cached sidecar index.
+    """
+    return scan_hmm_names_to_desc(hmm_path)
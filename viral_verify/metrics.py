@@ -0,0 +1,121 @@
+"""Per-stage run metrics: wall and CPU time, child process CPU time, peak memory and input/output counts
+
+Stage metrics are written as JSON to ``<prefix>-run-metrics.json`` in the output directory. CPU times and peak
+resident set sizes (RSS) come from :func:`resource.getrusage` for this process and for its terminated child processes
+(e.g. Prodigal and hmmsearch). Peak RSS values are the peaks up to the end of each stage since ``ru_maxrss`` is a high
+water mark. Optionally, the Python code run in the stages is profiled with :mod:`cProfile`.
+"""
+import cProfile
+import contextlib
+import logging
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Iterator, Any, Union
+
+import attr
+
+from viral_verify.cache import write_manifest
+
+logger = logging.getLogger(__name__)
+
+#: ``ru_maxrss`` is in bytes on macOS and kilobytes elsewhere
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _cpu_seconds(usage: resource.struct_rusage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+@attr.s
+class StageMetrics:
+    """Resource usage and input/output counts of a pipeline stage
+
+    Counts such as the number of contigs, proteins, domain hits and bytes are added to `counts` by the stage.
+    """
+    name: str = attr.ib()
+    wall_seconds: float = attr.ib(default=0.0)
+    cpu_seconds: float = attr.ib(default=0.0)
+    child_cpu_seconds: float = attr.ib(default=0.0)
+    peak_rss_bytes: int = attr.ib(default=0)
+    child_peak_rss_bytes: int = attr.ib(default=0)
+    skipped: bool = attr.ib(default=False)
+    counts: Dict[str, int] = attr.ib(factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = attr.asdict(self)
+        out['throughput_per_second'] = {k: v / self.wall_seconds for k, v in self.counts.items()} \
+            if self.wall_seconds > 0 and not self.skipped else {}
+        return out
+
+
+@attr.s
+class RunMetrics:
+    """Metrics of each stage of a run
+
+    Parameters
+    ----------
+    profile
+        Profile the Python code run in stages with cProfile
+    """
+    profile: bool = attr.ib(default=False)
+    stages: List[StageMetrics] = attr.ib(factory=list)
+    _profiler: Optional[cProfile.Profile] = attr.ib(init=False, default=None, repr=False)
+    _start: float = attr.ib(init=False, factory=time.perf_counter, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.profile:
+            self._profiler = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """Record the resource usage of the code run in the context as a stage
+
+        The stage metrics are recorded even if the stage raises an exception.
+        """
+        metrics = StageMetrics(name=name)
+        self.stages.append(metrics)
+        self_start = resource.getrusage(resource.RUSAGE_SELF)
+        children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall_start = time.perf_counter()
+        if self._profiler is not None:
+            self._profiler.enable()
+        try:
+            yield metrics
+        finally:
+            if self._profiler is not None:
+                self._profiler.disable()
+            metrics.wall_seconds = time.perf_counter() - wall_start
+            self_end = resource.getrusage(resource.RUSAGE_SELF)
+            children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+            metrics.cpu_seconds = _cpu_seconds(self_end) - _cpu_seconds(self_start)
+            metrics.child_cpu_seconds = _cpu_seconds(children_end) - _cpu_seconds(children_start)
+            metrics.peak_rss_bytes = self_end.ru_maxrss * MAXRSS_UNIT
+            metrics.child_peak_rss_bytes = children_end.ru_maxrss * MAXRSS_UNIT
+            logger.debug(f'Stage "{name}": {metrics.wall_seconds:.3f}s wall, {metrics.cpu_seconds:.3f}s CPU, '
+                         f'{metrics.child_cpu_seconds:.3f}s child process CPU, counts={metrics.counts}')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(wall_seconds=time.perf_counter() - self._start,
+                    stages=[x.to_dict() for x in self.stages])
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the run metrics to a JSON file"""
+        write_manifest(Path(path), self.to_dict())
+        logger.info(f'Run metrics written to "{path}"')
+
+    def dump_profile(self, path: Union[str, Path]) -> None:
+        """Write the cProfile stats of the profiled stages (see :mod:`pstats`)"""
+        if self._profiler is None:
+            raise ValueError('Stages were not profiled')
+        self._profiler.dump_stats(str(path))
+        logger.info(f'cProfile stats of the Python stages written to "{path}"')
+
+
+def file_size(path: Optional[Union[str, Path]]) -> int:
+    """Size of a file in bytes or 0 if it does not exist"""
+    try:
+        return Path(path).stat().st_size if path else 0
+    except OSError:
+        return 0
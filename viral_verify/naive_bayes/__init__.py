@@ -1,2 +1,3 @@
 from viral_verify.naive_bayes.classification import naive_bayes_classification, NaiveBayesClassification
+from viral_verify.naive_bayes.compiled import compile_classifier_table, load_classifier_table
 from viral_verify.naive_bayes.constants import DEFAULT_UNCERTAINTY_THRESHOLD, CLASSIFIER_TABLE
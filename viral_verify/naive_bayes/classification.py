@@ -4,11 +4,12 @@ from typing import List, Dict, Mapping, Union
 
 import attr
 
+from viral_verify.naive_bayes.compiled import CompiledClassifierTable, load_classifier_table
 from viral_verify.naive_bayes.constants import Classification
-from viral_verify.naive_bayes.io import parse_naive_bayes_classifier_table, NaiveBayesClassifierFreqs
+from viral_verify.naive_bayes.io import NaiveBayesClassifierFreqs
 
 
-@attr.s
+@attr.s(slots=True)
 class NaiveBayesClassification:
     """Naive Bayes classification result"""
     contig_name: str = attr.ib()
@@ -25,27 +26,56 @@ class NaiveBayesClassification:
     def from_contig_domains(cls,
                             contig: str,
                             domains: List[str],
-                            classifier_table: Dict[str, NaiveBayesClassifierFreqs],
+                            classifier_table: Union[Dict[str, NaiveBayesClassifierFreqs], CompiledClassifierTable],
                             uncertainty_threshold: float = 3.0):
         log_chrom_prob = 0.0
         log_plasmid_prob = 0.0
         log_viral_prob = 0.0
         log_plasmid_or_chrom_prob = 0.0
-        for domain in domains:
-            try:
-                freqs: NaiveBayesClassifierFreqs = classifier_table[domain]
-                log_plasmid_prob += math.log(freqs.plasmid_freq)
-                log_chrom_prob += math.log(freqs.chrom_freq)
-                log_viral_prob += math.log(freqs.viral_freq)
-                log_plasmid_or_chrom_prob += math.log(freqs.plasmid_or_chrom_freq)
-            except KeyError:
-                continue
+        if isinstance(classifier_table, CompiledClassifierTable):
+            index = classifier_table.index
+            for domain in domains:
+                i = index.get(domain)
+                if i is None:
+                    continue
+                log_plasmid_prob += classifier_table.log_plasmid_freq[i]
+                log_chrom_prob += classifier_table.log_chrom_freq[i]
+                log_viral_prob += classifier_table.log_viral_freq[i]
+                log_plasmid_or_chrom_prob += classifier_table.log_plasmid_or_chrom_freq[i]
+        else:
+            for domain in domains:
+                try:
+                    freqs: NaiveBayesClassifierFreqs = classifier_table[domain]
+                    log_plasmid_prob += math.log(freqs.plasmid_freq)
+                    log_chrom_prob += math.log(freqs.chrom_freq)
+                    log_viral_prob += math.log(freqs.viral_freq)
+                    log_plasmid_or_chrom_prob += math.log(freqs.plasmid_or_chrom_freq)
+                except KeyError:
+                    continue
+        return cls.from_log_probs(contig=contig,
+                                  n_domains=len(domains),
+                                  log_viral_prob=log_viral_prob,
+                                  log_plasmid_prob=log_plasmid_prob,
+                                  log_chrom_prob=log_chrom_prob,
+                                  log_plasmid_or_chrom_prob=log_plasmid_or_chrom_prob,
+                                  uncertainty_threshold=uncertainty_threshold)
+
+    @classmethod
+    def from_log_probs(cls,
+                       contig: str,
+                       n_domains: int,
+                       log_viral_prob: float,
+                       log_plasmid_prob: float,
+                       log_chrom_prob: float,
+                       log_plasmid_or_chrom_prob: float,
+                       uncertainty_threshold: float = 3.0):
+        """Classify a contig given the summed log frequencies of the `n_domains` protein domains found in it"""
         log_viral_minus_plasmid_or_chrom_prob = log_viral_prob - log_plasmid_or_chrom_prob
         log_plasmid_minus_chrom_prob = log_plasmid_prob - log_chrom_prob
         if log_viral_minus_plasmid_or_chrom_prob > uncertainty_threshold:
             classification = Classification.VIRUS
         elif log_viral_minus_plasmid_or_chrom_prob > (-1) * uncertainty_threshold:
-            if len(domains) > 2:
+            if n_domains > 2:
                 classification = Classification.UNCERTAIN_VIRAL_OR_BACTERIAL
             else:
                 classification = Classification.UNCERTAIN_TOO_SHORT
@@ -75,12 +105,14 @@ def naive_bayes_classification(contig_domains: Mapping[str, List[str]],
     using hmmsearch of Prodigal gene predictions against an HMM profile DB like Pfam.
     2. Given the frequencies that certain protein domains appear in viral, plasmid or chromosomal sequences, use Naive
     Bayesian method to classify sequences.
+
+    The classifier table is loaded from its compiled, memory-mapped form (see
+    :func:`viral_verify.naive_bayes.compiled.load_classifier_table`) and all contigs are classified at once with
+    :func:`viral_verify.naive_bayes.vectorized.classify_contig_domains`.
     """
-    classifier_table: Dict[str, NaiveBayesClassifierFreqs] = parse_naive_bayes_classifier_table(classifier_table_path)
-    out: Dict[str, NaiveBayesClassification] = {}
-    for contig, domains in contig_domains.items():
-        out[contig] = NaiveBayesClassification.from_contig_domains(contig=contig,
-                                                                   domains=domains,
-                                                                   classifier_table=classifier_table,
-                                                                   uncertainty_threshold=uncertainty_threshold)
-    return out
+    # imported here since the vectorized engine builds NaiveBayesClassification objects
+    from viral_verify.naive_bayes.vectorized import classify_contig_domains
+    classifier_table: CompiledClassifierTable = load_classifier_table(classifier_table_path)
+    return classify_contig_domains(contig_domains=contig_domains,
+                                   classifier_table=classifier_table,
+                                   uncertainty_threshold=uncertainty_threshold)
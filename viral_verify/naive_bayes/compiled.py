@@ -0,0 +1,161 @@
+"""Compiled binary Naive Bayes classifier table of precomputed log frequencies
+
+The compiled table is a little-endian binary file with the following layout:
+
+1. header: magic bytes, number of domains, size of the domain names blob, size and modification time (ns) of the
+   source classifier table TSV
+2. 4 contiguous float64 arrays of natural log frequencies (plasmid, chromosome, viral, plasmid or chromosome) in
+   domain name order
+3. newline delimited UTF-8 blob of sorted domain names
+
+so that it can be memory-mapped and used without parsing or computing any logarithms.
+"""
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Union, Optional, Sequence, Tuple
+
+import attr
+
+from viral_verify.cache import cache_path
+from viral_verify.naive_bayes.io import parse_naive_bayes_classifier_table, NaiveBayesClassifierFreqs
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VVNBCT01'
+HEADER = struct.Struct('<8sQQQq')
+COMPILED_SUFFIX = '.compiled'
+
+
+@attr.s
+class CompiledClassifierTable:
+    """Naive Bayes classifier table of natural log frequencies for each protein domain
+
+    Frequencies for the i-th domain in sorted `names` are found at index i of each log frequency array.
+    """
+    names: List[str] = attr.ib()
+    log_plasmid_freq: Sequence[float] = attr.ib()
+    log_chrom_freq: Sequence[float] = attr.ib()
+    log_viral_freq: Sequence[float] = attr.ib()
+    log_plasmid_or_chrom_freq: Sequence[float] = attr.ib()
+    index: Dict[str, int] = attr.ib(init=False)
+    _mmap: Optional[mmap.mmap] = attr.ib(default=None, repr=False)
+
+    def __attrs_post_init__(self):
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def log_freqs(self, domain: str) -> Optional[Tuple[float, float, float, float]]:
+        """Get the (plasmid, chromosome, viral, plasmid or chromosome) log frequencies of a domain if in the table"""
+        i = self.index.get(domain)
+        if i is None:
+            return None
+        return (self.log_plasmid_freq[i],
+                self.log_chrom_freq[i],
+                self.log_viral_freq[i],
+                self.log_plasmid_or_chrom_freq[i])
+
+    @classmethod
+    def from_freqs(cls, classifier_table: Dict[str, NaiveBayesClassifierFreqs]) -> 'CompiledClassifierTable':
+        names = sorted(classifier_table)
+        freqs = [classifier_table[x] for x in names]
+        return cls(names=names,
+                   log_plasmid_freq=[math.log(x.plasmid_freq) for x in freqs],
+                   log_chrom_freq=[math.log(x.chrom_freq) for x in freqs],
+                   log_viral_freq=[math.log(x.viral_freq) for x in freqs],
+                   log_plasmid_or_chrom_freq=[math.log(x.plasmid_or_chrom_freq) for x in freqs])
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]) -> 'CompiledClassifierTable':
+        """Memory-map a compiled classifier table file"""
+        with open(path, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, names_size, _, _ = HEADER.unpack_from(mm)
+        if magic != MAGIC:
+            raise ValueError(f'"{path}" is not a compiled viral_verify classifier table')
+        arrays = memoryview(mm)[HEADER.size:HEADER.size + 4 * 8 * n].cast('d')
+        names_offset = HEADER.size + 4 * 8 * n
+        names = mm[names_offset:names_offset + names_size].decode().split('\n') if n else []
+        return cls(names=names,
+                   log_plasmid_freq=arrays[0:n],
+                   log_chrom_freq=arrays[n:2 * n],
+                   log_viral_freq=arrays[2 * n:3 * n],
+                   log_plasmid_or_chrom_freq=arrays[3 * n:4 * n],
+                   mmap=mm)
+
+
+def _source_stat(classifier_table_path: Union[str, Path]) -> Tuple[int, int]:
+    stat = os.stat(classifier_table_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def compile_classifier_table(classifier_table_path: Union[str, Path],
+                             output_path: Optional[Union[str, Path]] = None) -> Path:
+    """Compile a Naive Bayes classifier table TSV into a memory-mappable binary table of log frequencies
+
+    Parameters
+    ----------
+    classifier_table_path
+        Naive Bayes classifier table TSV path
+    output_path
+        Compiled table output path (default: cached next to the classifier table TSV)
+
+    Returns
+    -------
+    Path
+        Compiled classifier table path
+    """
+    if output_path is None:
+        output_path = cache_path(classifier_table_path, COMPILED_SUFFIX)
+    output_path = Path(output_path)
+    table = CompiledClassifierTable.from_freqs(parse_naive_bayes_classifier_table(classifier_table_path))
+    names_blob = '\n'.join(table.names).encode()
+    size, mtime_ns = _source_stat(classifier_table_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f'.{output_path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as fout:
+        fout.write(HEADER.pack(MAGIC, len(table), len(names_blob), size, mtime_ns))
+        for values in (table.log_plasmid_freq,
+                       table.log_chrom_freq,
+                       table.log_viral_freq,
+                       table.log_plasmid_or_chrom_freq):
+            fout.write(struct.pack(f'<{len(values)}d', *values))
+        fout.write(names_blob)
+    os.replace(tmp_path, output_path)
+    logger.info(f'Compiled Naive Bayes classifier table "{classifier_table_path}" with {len(table)} domains to '
+                f'"{output_path}"')
+    return output_path
+
+
+def _is_compiled_table_current(compiled_path: Path, classifier_table_path: Union[str, Path]) -> bool:
+    try:
+        with open(compiled_path, 'rb') as fh:
+            magic, _, _, size, mtime_ns = HEADER.unpack(fh.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and (size, mtime_ns) == _source_stat(classifier_table_path)
+
+
+def load_classifier_table(classifier_table_path: Union[str, Path]) -> CompiledClassifierTable:
+    """Load a Naive Bayes classifier table, compiling and caching it next to the TSV if necessary
+
+    The cached compiled table is used if it was compiled from a TSV of the same size and modification time. If the
+    compiled table cannot be written or memory-mapped, the TSV is parsed instead.
+    """
+    if sys.byteorder != 'little':
+        return CompiledClassifierTable.from_freqs(parse_naive_bayes_classifier_table(classifier_table_path))
+    compiled_path = cache_path(classifier_table_path, COMPILED_SUFFIX)
+    try:
+        if not _is_compiled_table_current(compiled_path, classifier_table_path):
+            compile_classifier_table(classifier_table_path, compiled_path)
+        return CompiledClassifierTable.from_file(compiled_path)
+    except (OSError, ValueError) as ex:
+        logger.warning(f'Could not use compiled Naive Bayes classifier table "{compiled_path}" ({ex}). '
+                       f'Parsing "{classifier_table_path}" instead.')
+        return CompiledClassifierTable.from_freqs(parse_naive_bayes_classifier_table(classifier_table_path))
@@ -3,7 +3,7 @@ from typing import Dict
 import attr
 
 
-@attr.s
+@attr.s(slots=True)
 class NaiveBayesClassifierFreqs:
     """Naive Bayes classification table frequency values entry
 
@@ -0,0 +1,81 @@
+"""Vectorized NumPy Naive Bayes classification of many contigs at once"""
+import itertools
+from typing import Mapping, List, Dict
+
+import numpy as np
+
+from viral_verify.naive_bayes.classification import NaiveBayesClassification
+from viral_verify.naive_bayes.compiled import CompiledClassifierTable
+from viral_verify.naive_bayes.constants import Classification
+
+
+def log_freq_matrix(classifier_table: CompiledClassifierTable) -> np.ndarray:
+    """Dense domain × class matrix of log frequencies
+
+    Columns are the plasmid, chromosome, viral and plasmid or chromosome log frequencies.
+    """
+    return np.column_stack([np.asarray(classifier_table.log_plasmid_freq, dtype=np.float64),
+                            np.asarray(classifier_table.log_chrom_freq, dtype=np.float64),
+                            np.asarray(classifier_table.log_viral_freq, dtype=np.float64),
+                            np.asarray(classifier_table.log_plasmid_or_chrom_freq, dtype=np.float64)]) \
+        if len(classifier_table) else np.zeros((0, 4), dtype=np.float64)
+
+
+def classify_contig_domains(contig_domains: Mapping[str, List[str]],
+                            classifier_table: CompiledClassifierTable,
+                            uncertainty_threshold: float = 3.0) -> Dict[str, NaiveBayesClassification]:
+    """Naive Bayes classification of all contigs at once using NumPy
+
+    Domain names are interned to integer IDs of the classifier table and the domain hits of all contigs form a
+    sparse contig × domain matrix in coordinate format. Its product with the dense domain × class log frequency
+    matrix gives the log probabilities of each class for every contig. The product is computed with weighted
+    ``np.bincount`` over the matrix entries in hit order, so that the sums are accumulated in exactly the same order
+    as :meth:`NaiveBayesClassification.from_contig_domains` and the results are identical. The classification
+    decision tree is applied to all contigs with vectorized masks.
+    """
+    contigs = list(contig_domains.keys())
+    n_contigs = len(contigs)
+    if n_contigs == 0:
+        return {}
+    index = classifier_table.index
+    n_domains = np.fromiter(map(len, contig_domains.values()), dtype=np.int64, count=n_contigs)
+    n_hits = int(n_domains.sum())
+    domain_ids = np.fromiter(map(index.get,
+                                 itertools.chain.from_iterable(contig_domains.values()),
+                                 itertools.repeat(-1, n_hits)),
+                             dtype=np.int64, count=n_hits)
+    contig_ids = np.repeat(np.arange(n_contigs, dtype=np.int64), n_domains)
+    in_table = domain_ids >= 0
+    contig_ids = contig_ids[in_table]
+    log_freqs = log_freq_matrix(classifier_table)[domain_ids[in_table]]
+    log_plasmid, log_chrom, log_viral, log_plasmid_or_chrom = (np.bincount(contig_ids,
+                                                                           weights=log_freqs[:, i],
+                                                                           minlength=n_contigs)
+                                                               for i in range(4))
+    log_viral_minus_plasmid_or_chrom = log_viral - log_plasmid_or_chrom
+    log_plasmid_minus_chrom = log_plasmid - log_chrom
+    classifications = np.select(
+        [log_viral_minus_plasmid_or_chrom > uncertainty_threshold,
+         (log_viral_minus_plasmid_or_chrom > -uncertainty_threshold) & (n_domains > 2),
+         log_viral_minus_plasmid_or_chrom > -uncertainty_threshold,
+         log_plasmid_minus_chrom > uncertainty_threshold,
+         (log_chrom - log_plasmid) > uncertainty_threshold],
+        [0, 1, 2, 3, 4],
+        default=5)
+    labels = [Classification.VIRUS,
+              Classification.UNCERTAIN_VIRAL_OR_BACTERIAL,
+              Classification.UNCERTAIN_TOO_SHORT,
+              Classification.PLASMID,
+              Classification.CHROMOSOME,
+              Classification.UNCERTAIN_PLASMID_OR_CHROMOSOMAL]
+    label_array = np.array(labels, dtype=object)
+    return dict(zip(contigs, map(NaiveBayesClassification,
+                                 contigs,
+                                 label_array[classifications].tolist(),
+                                 log_viral.tolist(),
+                                 log_plasmid.tolist(),
+                                 log_chrom.tolist(),
+                                 log_plasmid_or_chrom.tolist(),
+                                 log_viral_minus_plasmid_or_chrom.tolist(),
+                                 log_plasmid_minus_chrom.tolist(),
+                                 itertools.repeat(uncertainty_threshold, n_contigs))))
@@ -0,0 +1,119 @@
+"""Pre-filters skipping gene prediction and hmmsearch for contigs that cannot be classified
+
+Short contigs and contigs mostly made of ambiguous bases (``N``) are skipped before Prodigal gene prediction.
+Contigs with too few predicted genes are skipped before hmmsearch. Skipped contigs are not classified but are
+reported in the results table and unclassified contigs FASTA output with their skip reason.
+"""
+import logging
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Tuple, Union, Mapping, Optional
+
+import attr
+
+from viral_verify.compression import open_text, open_text_output
+from viral_verify.contig import Contig, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class SkipReason:
+    """Reasons for skipping gene prediction and hmmsearch for a contig"""
+    TOO_SHORT = 'too_short'
+    TOO_MANY_N = 'too_many_n'
+    TOO_FEW_GENES = 'too_few_genes'
+
+
+@attr.s(slots=True, frozen=True)
+class ContigFilter:
+    """Which contigs are skipped
+
+    Contigs shorter than `min_length` bases or with a fraction of ``N`` bases greater than `max_n_fraction` are
+    skipped before gene prediction. Contigs with fewer than `min_genes` predicted genes are skipped before hmmsearch.
+    """
+    min_length: int = attr.ib(default=0)
+    min_genes: int = attr.ib(default=0)
+    max_n_fraction: float = attr.ib(default=1.0)
+
+    @property
+    def active(self) -> bool:
+        return self.min_length > 0 or self.min_genes > 0 or self.max_n_fraction < 1.0
+
+    def skip_reason(self, contig: Contig) -> Optional[str]:
+        """Reason for skipping gene prediction for a contig or None if it is not skipped"""
+        if contig.seq_len < self.min_length:
+            return SkipReason.TOO_SHORT
+        if self.max_n_fraction < 1.0 and n_fraction(contig) > self.max_n_fraction:
+            return SkipReason.TOO_MANY_N
+        return None
+
+
+def n_fraction(contig: Contig) -> float:
+    """Fraction of ``N`` (or ``n``) bases in a contig sequence read in chunks"""
+    if contig.seq_len == 0:
+        return 0.0
+    n = 0
+    for i in range(0, contig.seq_len, CHUNK_SIZE):
+        chunk = contig.seq(i, i + CHUNK_SIZE)
+        n += chunk.count('N') + chunk.count('n')
+    return n / contig.seq_len
+
+
+def prefilter_contigs(contigs: Dict[str, Contig],
+                      contig_filter: ContigFilter) -> Tuple[Dict[str, Contig], Dict[str, str]]:
+    """Split contigs into those to run gene prediction on and the skip reasons of the others"""
+    if not contig_filter.active:
+        return contigs, {}
+    kept: Dict[str, Contig] = {}
+    skipped: Dict[str, str] = {}
+    for name, contig in contigs.items():
+        reason = contig_filter.skip_reason(contig)
+        if reason is None:
+            kept[name] = contig
+        else:
+            skipped[name] = reason
+    return kept, skipped
+
+
+def filter_min_genes(proteins_fasta: Union[str, Path],
+                     contigs: Mapping[str, Contig],
+                     min_genes: int) -> Tuple[Dict[str, str], int]:
+    """Remove the proteins of contigs with fewer than `min_genes` predicted genes from a protein FASTA file in place
+
+    Returns
+    -------
+    Tuple[Dict[str, str], int]
+        Skip reason of each contig with too few genes and the number of proteins removed
+    """
+    if min_genes <= 0:
+        return {}, 0
+    proteins_fasta = Path(proteins_fasta)
+    gene_counts: Counter = Counter()
+    with open_text(proteins_fasta) as fh:
+        for line in fh:
+            if line.startswith('>'):
+                gene_counts[re.sub(r'_\d+$', '', line[1:].split(None, 1)[0])] += 1
+    skipped = {name: SkipReason.TOO_FEW_GENES for name in contigs if gene_counts[name] < min_genes}
+    n_removed = sum(gene_counts[name] for name in skipped)
+    if n_removed:
+        tmp_path = proteins_fasta.with_name(f'.{proteins_fasta.name}.{os.getpid()}.tmp{proteins_fasta.suffix}')
+        keep = False
+        with open_text(proteins_fasta) as fh, open_text_output(tmp_path) as fout:
+            for line in fh:
+                if line.startswith('>'):
+                    keep = re.sub(r'_\d+$', '', line[1:].split(None, 1)[0]) not in skipped
+                if keep:
+                    fout.write(line)
+        os.replace(tmp_path, proteins_fasta)
+    return skipped, n_removed
+
+
+def skip_summary(contigs: Mapping[str, Contig], skipped: Mapping[str, str]) -> Dict[str, int]:
+    """Number of skipped contigs and bases in total and per skip reason"""
+    out = dict(skipped_contigs=len(skipped),
+               skipped_bases=sum(contigs[name].seq_len for name in skipped))
+    for reason, count in Counter(skipped.values()).items():
+        out[f'skipped_{reason}'] = count
+    return out
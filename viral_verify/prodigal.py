@@ -1,32 +1,226 @@
 import logging
+import os
+import re
 import subprocess as sp
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Union, IO
+from typing import Union, IO, List, Tuple, Dict, Iterable, Iterator, Optional
+
+from viral_verify.shard import write_fasta_shards, shard_index_map, FastaShard
 
 logger = logging.getLogger(__name__)
 
+REGEX_PRODIGAL_SEQNUM = re.compile(r'(?<=seqnum=)\d+')
+"""Regular expression to match the Prodigal sequence number in gene coordinate output DEFINITION lines"""
+REGEX_PRODIGAL_ID = re.compile(r'(?<=ID=)\d+(?=_\d+)')
+"""Regular expression to match the Prodigal sequence number in a gene ID (e.g. 4 in "ID=4_1")"""
+REGEX_PRODIGAL_VERSION = re.compile(r'Prodigal V\S+')
+"""Regular expression to match the Prodigal version (e.g. "Prodigal V2.6.3") in ``prodigal -v`` output"""
+
+
+@lru_cache()
+def prodigal_version() -> Optional[str]:
+    """Get the version of Prodigal in the PATH (e.g. "Prodigal V2.6.3") or None if it cannot be determined"""
+    try:
+        proc = sp.run(['prodigal', '-v'], stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.STDOUT, timeout=60)
+    except (OSError, sp.SubprocessError):
+        return None
+    m = REGEX_PRODIGAL_VERSION.search(proc.stdout.decode(errors='replace'))
+    return m.group(0) if m else None
+
 
 def prodigal_meta(input_fasta: Union[str, Path, IO],
                   genes_fasta: Union[str, Path, IO],
-                  proteins_fasta: Union[str, Path, IO]) -> None:
+                  proteins_fasta: Union[str, Path, IO],
+                  threads: int = 1) -> None:
     """Run Prodigal gene prediction in metagenomic mode on an input FASTA format file
 
-    Produces files containing nucleotide and protein sequences of Prodigal predicted genes
+    Produces files containing nucleotide and protein sequences of Prodigal predicted genes. If `threads` is greater
+    than 1, the input FASTA is split into size-balanced shards that are processed by concurrent Prodigal processes
+    (see :func:`prodigal_meta_parallel`).
     """
-    cmd_list = ['prodigal', '-p', 'meta', '-c',
+    if threads > 1:
+        prodigal_meta_parallel(input_fasta=input_fasta,
+                               genes_fasta=genes_fasta,
+                               proteins_fasta=proteins_fasta,
+                               threads=threads)
+        return
+    cmd_list = ['prodigal', '-p', 'meta', '-c', '-q',
                 '-i', str(input_fasta),
                 '-a', str(proteins_fasta),
                 '-o', str(genes_fasta)]
     cmd = " ".join(cmd_list)
     logger.info(f'Running Prodigal gene prediction in metagenomic mode with command: {cmd}')
     sp.run(cmd_list,
-           stdout=sp.PIPE,
+           stdout=sp.DEVNULL,
            stderr=sp.PIPE,
            check=True)
     logger.info(f'Ran Prodigal gene prediction outputting protein sequences to '
                 f'"{proteins_fasta}" and nucleotide sequences to  "{genes_fasta}".')
 
 
+def prodigal_meta_stream(fasta_entries: Iterable[str],
+                         genes_output: Optional[Union[str, Path]] = None) -> Iterator[str]:
+    """Run Prodigal gene prediction in metagenomic mode streaming sequences in and protein sequences out
+
+    FASTA entries are written to Prodigal's stdin from a background thread while the predicted protein FASTA lines
+    are read from Prodigal's stdout, so neither the input nor the output FASTA has to be written to disk.
+
+    Parameters
+    ----------
+    fasta_entries : Iterable[str]
+        FASTA format entries (or consecutive chunks of entries) to run gene prediction on
+    genes_output : Optional[Union[str, Path]]
+        Optional path to write Prodigal gene coordinates output to; discarded if not specified
+
+    Yields
+    ------
+    str
+        Lines of Prodigal predicted protein sequence FASTA output
+    """
+    cmd_list = ['prodigal', '-p', 'meta', '-c', '-q',
+                '-a', '/dev/stdout',
+                '-o', str(genes_output) if genes_output else os.devnull]
+    cmd = " ".join(cmd_list)
+    logger.info(f'Running Prodigal gene prediction in metagenomic mode on streamed input with command: {cmd}')
+    with tempfile.TemporaryFile() as stderr:
+        proc = sp.Popen(cmd_list, stdin=sp.PIPE, stdout=sp.PIPE, stderr=stderr, universal_newlines=True)
+        writer_errors: List[Exception] = []
+
+        def write_entries():
+            try:
+                for entry in fasta_entries:
+                    proc.stdin.write(entry)
+            except Exception as ex:
+                writer_errors.append(ex)
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        writer = threading.Thread(target=write_entries, name='prodigal-stdin-writer', daemon=True)
+        writer.start()
+        try:
+            yield from proc.stdout
+        finally:
+            proc.stdout.close()
+            writer.join()
+            returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise sp.CalledProcessError(returncode, cmd_list, stderr=stderr.read())
+        if writer_errors:
+            raise writer_errors[0]
+    logger.info('Ran Prodigal gene prediction on streamed input')
+
+
+def prodigal_meta_parallel(input_fasta: Union[str, Path],
+                           genes_fasta: Union[str, Path],
+                           proteins_fasta: Union[str, Path],
+                           threads: int) -> None:
+    """Run Prodigal in metagenomic mode over size-balanced shards of the input FASTA with a pool of processes
+
+    Contigs are split into `threads` shards balanced by total length with the largest contigs assigned first. The
+    largest shards are started first. Shard outputs are merged back in input order with Prodigal sequence numbers
+    (``ID=<seqnum>_<gene>`` and ``seqnum=<seqnum>``) renumbered so that the output matches that of a single Prodigal
+    process run over the whole input FASTA. If the input FASTA has no sequences, Prodigal is not run and empty outputs
+    are written.
+    """
+    proteins_fasta = Path(proteins_fasta)
+    with tempfile.TemporaryDirectory(prefix='prodigal-shards-', dir=proteins_fasta.parent) as tmpdir:
+        shards: List[FastaShard] = write_fasta_shards(input_fasta, tmpdir, threads, prefix='contigs')
+        if not shards:
+            logger.warning(f'No sequences in "{input_fasta}" for Prodigal gene prediction. Writing empty outputs.')
+            proteins_fasta.write_text('')
+            Path(genes_fasta).write_text('')
+            return
+        logger.info(f'Split "{input_fasta}" into {len(shards)} shards for Prodigal gene prediction '
+                    f'(shard sizes (bp): {", ".join(str(s.total_length) for s in shards)})')
+        shard_outputs: List[Tuple[Path, Path]] = [(s.path.with_suffix('.faa'), s.path.with_suffix('.genes'))
+                                                  for s in shards]
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(prodigal_meta, shard.path, genes, proteins)
+                       for shard, (proteins, genes) in zip(shards, shard_outputs)]
+            for future in futures:
+                future.result()
+        index_map = shard_index_map(shards)
+        _merge_shard_outputs([proteins for proteins, _ in shard_outputs], index_map, proteins_fasta,
+                             _protein_seqnum_spans)
+        _merge_shard_outputs([genes for _, genes in shard_outputs], index_map, genes_fasta,
+                             _gene_coords_seqnum_spans)
+    logger.info(f'Ran Prodigal gene prediction over {len(shards)} shards outputting protein sequences to '
+                f'"{proteins_fasta}" and nucleotide sequences to  "{genes_fasta}".')
+
+
+def _protein_seqnum_spans(path: Path) -> Dict[int, Tuple[int, int]]:
+    """Byte spans of the protein records for each Prodigal sequence number in a Prodigal protein FASTA"""
+    spans: Dict[int, Tuple[int, int]] = {}
+    offset = 0
+    seqnum = None
+    start = 0
+    with open(path, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'>'):
+                m = REGEX_PRODIGAL_ID.search(line.decode())
+                line_seqnum = int(m.group()) if m else None
+                if line_seqnum != seqnum:
+                    if seqnum is not None:
+                        spans[seqnum] = (start, offset)
+                    seqnum = line_seqnum
+                    start = offset
+            offset += len(line)
+    if seqnum is not None:
+        spans[seqnum] = (start, offset)
+    return spans
+
+
+def _gene_coords_seqnum_spans(path: Path) -> Dict[int, Tuple[int, int]]:
+    """Byte spans of the entries for each Prodigal sequence number in Prodigal gene coordinates output"""
+    spans: Dict[int, Tuple[int, int]] = {}
+    offset = 0
+    seqnum = 0
+    start = 0
+    with open(path, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'DEFINITION'):
+                if seqnum:
+                    spans[seqnum] = (start, offset)
+                seqnum += 1
+                start = offset
+            offset += len(line)
+    if seqnum:
+        spans[seqnum] = (start, offset)
+    return spans
+
+
+def _merge_shard_outputs(shard_paths: List[Path],
+                         index_map: List[Tuple[int, int]],
+                         output_path: Union[str, Path],
+                         seqnum_spans) -> None:
+    """Merge per-shard Prodigal output into a single file in the original input order"""
+    shard_spans = [seqnum_spans(p) for p in shard_paths]
+    handles = [open(p, 'rb') for p in shard_paths]
+    try:
+        with open(output_path, 'w') as fout:
+            for idx, (shard_idx, local_idx) in enumerate(index_map):
+                span = shard_spans[shard_idx].get(local_idx + 1)
+                if span is None:
+                    continue
+                fh = handles[shard_idx]
+                fh.seek(span[0])
+                text = fh.read(span[1] - span[0]).decode()
+                seqnum = str(idx + 1)
+                text = REGEX_PRODIGAL_ID.sub(seqnum, text)
+                fout.write(REGEX_PRODIGAL_SEQNUM.sub(seqnum, text))
+    finally:
+        for fh in handles:
+            fh.close()
+
+
 def prodigal_gene_start(rec_description: str) -> int:
     """Get a gene start index from a Prodigal FASTA header
 
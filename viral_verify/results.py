@@ -0,0 +1,181 @@
+"""Incremental writers of the per-contig classification results table
+
+Rows are written one contig at a time so that the whole table is never held in memory. Text formats are CSV, TSV and
+newline-delimited JSON (NDJSON). With the optional `pyarrow <https://arrow.apache.org/docs/python/>`_ dependency
+(``pip install viral_verify[parquet]``), results can be written as a Parquet file with typed float columns and a
+dictionary-encoded classification column, written in row groups of :data:`PARQUET_ROW_GROUP_SIZE` rows.
+"""
+import csv
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Mapping, Union
+
+import attr
+
+from viral_verify.naive_bayes import NaiveBayesClassification
+
+#: Results table output formats and their file extensions
+RESULTS_FORMATS = dict(csv='csv', tsv='tsv', ndjson='ndjson', parquet='parquet')
+#: Float columns of the results table
+FLOAT_COLUMNS = [x.name for x in attr.fields(NaiveBayesClassification) if x.type is float]
+#: Results table columns; ``skip_reason`` is only included if contig pre-filters are active
+RESULT_COLUMNS = [x.name for x in attr.fields(NaiveBayesClassification)] + ['protein_domains']
+#: Number of rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 65536
+
+
+def require_pyarrow():
+    """Import pyarrow and pyarrow.parquet raising an ImportError with install instructions if not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as ex:
+        raise ImportError('Parquet results output requires pyarrow. '
+                          'Install it with "pip install viral_verify[parquet]"') from ex
+    return pyarrow, pyarrow.parquet
+
+
+def results_path(outdir: Path, prefix: str, fmt: str = 'csv') -> Path:
+    """Path of the results table of a given format"""
+    return outdir / f'{prefix}-results.{RESULTS_FORMATS[fmt]}'
+
+
+def result_row(contig_name: str,
+               classification: Optional[NaiveBayesClassification],
+               contig_domains: Mapping[str, List[str]],
+               protein_name_to_desc: Mapping[str, str]) -> Dict[str, Any]:
+    """Results table row of a contig; columns other than ``contig_name`` and ``classification`` are None if the
+    contig is not classified"""
+    if classification is None:
+        row: Dict[str, Any] = dict.fromkeys(RESULT_COLUMNS)
+        row.update(contig_name=contig_name, classification='Unclassified')
+        return row
+    row = attr.asdict(classification)
+    row['protein_domains'] = ';'.join(f'{x} [{protein_name_to_desc[x]}]' for x in contig_domains[contig_name])
+    return row
+
+
+class ResultsWriter(ABC):
+    """Incremental results table writer; use :func:`open_results_writer` to create one for a format"""
+
+    def __init__(self, path: Union[str, Path], columns: List[str]):
+        self.path = Path(path)
+        self.columns = columns
+        self.n_rows = 0
+
+    def write(self, row: Mapping[str, Any]) -> None:
+        self._write(row)
+        self.n_rows += 1
+
+    @abstractmethod
+    def _write(self, row: Mapping[str, Any]) -> None:
+        """Write a row to the output"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Flush any buffered rows and close the output"""
+
+    def __enter__(self) -> 'ResultsWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class DelimitedResultsWriter(ResultsWriter):
+    """CSV or TSV results writer; missing values are written as empty fields"""
+
+    def __init__(self, path: Union[str, Path], columns: List[str], delimiter: str = ','):
+        super().__init__(path, columns)
+        self._fh = open(self.path, 'w', newline='')
+        self._writer = csv.DictWriter(self._fh, fieldnames=columns, delimiter=delimiter, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, row: Mapping[str, Any]) -> None:
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class NdjsonResultsWriter(ResultsWriter):
+    """Newline-delimited JSON results writer with one JSON object per contig; missing values are null"""
+
+    def __init__(self, path: Union[str, Path], columns: List[str]):
+        super().__init__(path, columns)
+        self._fh = open(self.path, 'w')
+
+    def _write(self, row: Mapping[str, Any]) -> None:
+        self._fh.write(json.dumps({k: row.get(k) for k in self.columns}))
+        self._fh.write('\n')
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class ParquetResultsWriter(ResultsWriter):
+    """Parquet results writer buffering :data:`PARQUET_ROW_GROUP_SIZE` rows per row group
+
+    The classification and skip reason columns are dictionary-encoded strings, the probability columns float64 and
+    missing values are nulls.
+    """
+
+    def __init__(self, path: Union[str, Path], columns: List[str], row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        super().__init__(path, columns)
+        pa, pq = require_pyarrow()
+        self._pa = pa
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        self.schema = pa.schema([(x, pa.float64() if x in FLOAT_COLUMNS else
+                                  dictionary if x in ('classification', 'skip_reason') else pa.string())
+                                 for x in columns])
+        self.row_group_size = row_group_size
+        self._buffer: Dict[str, List[Any]] = {x: [] for x in columns}
+        self._writer = pq.ParquetWriter(str(self.path), self.schema)
+
+    def _write(self, row: Mapping[str, Any]) -> None:
+        for column, values in self._buffer.items():
+            values.append(row.get(column))
+        if len(self._buffer['contig_name']) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        pa = self._pa
+        arrays = []
+        for field in self.schema:
+            values = self._buffer[field.name]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+            self._buffer[field.name] = []
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        if self._buffer['contig_name'] or self.n_rows == 0:
+            self._flush()
+        self._writer.close()
+
+
+def open_results_writer(path: Union[str, Path], fmt: str = 'csv', skip_reason: bool = False) -> ResultsWriter:
+    """Open an incremental results table writer
+
+    Parameters
+    ----------
+    path
+        Output path
+    fmt
+        Output format: "csv", "tsv", "ndjson" or "parquet" (requires pyarrow)
+    skip_reason
+        Add a ``skip_reason`` column (see :mod:`viral_verify.prefilter`)
+    """
+    columns = RESULT_COLUMNS + ['skip_reason'] if skip_reason else list(RESULT_COLUMNS)
+    if fmt == 'csv':
+        return DelimitedResultsWriter(path, columns)
+    if fmt == 'tsv':
+        return DelimitedResultsWriter(path, columns, delimiter='\t')
+    if fmt == 'ndjson':
+        return NdjsonResultsWriter(path, columns)
+    if fmt == 'parquet':
+        return ParquetResultsWriter(path, columns)
+    raise ValueError(f'Unknown results format "{fmt}". Expected one of {list(RESULTS_FORMATS)}')
@@ -0,0 +1,491 @@
+"""Long-running classification service with warm state shared across jobs
+
+The Naive Bayes classifier table, HMM names and descriptions and HMM DB metadata (hmmsearch search key for the
+domain hit cache and tool versions) are loaded once when the service starts. Jobs are submitted over HTTP on a TCP
+port or a local Unix socket with a small JSON API:
+
+``POST /jobs``
+    Submit a job. The request body is a JSON object with the path to a contigs ``fasta`` file and optionally an
+    ``outdir`` for the same results CSV and classified contig FASTA output as ``viral_verify``, an output file
+    ``prefix``, ``uncertainty_threshold`` and ``output_plasmids_separately``. Responds with ``202`` and the job or
+    with ``503`` if the job queue is full.
+``GET /jobs/<id>``
+    Job status (``queued``, ``running``, ``done`` or ``failed``), latencies and, once done, the classification and
+    top protein domains of each contig.
+``GET /metrics``
+    Queue depth, number of running, completed and failed jobs and job latency statistics.
+``GET /health``
+    Whether the service is up.
+
+Jobs are run by a bounded pool of worker threads, each running the Prodigal and hmmsearch subprocesses of one job at
+a time. Intermediate files are written to a temporary directory per job.
+"""
+import collections
+import http.client
+import itertools
+import json
+import logging
+import socket
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Any, List, Union, Tuple
+
+import attr
+
+from viral_verify.circularity import CircularityPolicy
+from viral_verify.compression import uncompressed_name
+from viral_verify.hmm_index import load_hmm_names_to_desc
+from viral_verify.hmmsearch import top_hmm_results, hmmsearch_version
+from viral_verify.hmmsearch.dedup import run_hmmsearch_unique
+from viral_verify.hmmsearch.hit_cache import DomainHitCache, search_key
+from viral_verify.io import parse_contigs, write_circular_contigs_fasta, filter_predicted_genes, \
+    output_results_table, output_classified_contigs
+from viral_verify.naive_bayes import load_classifier_table, DEFAULT_UNCERTAINTY_THRESHOLD
+from viral_verify.naive_bayes.compiled import CompiledClassifierTable
+from viral_verify.naive_bayes.vectorized import classify_contig_domains
+from viral_verify.prodigal import prodigal_meta, prodigal_version
+
+logger = logging.getLogger(__name__)
+
+MAX_FINISHED_JOBS = 1000
+"""Number of finished jobs kept for status requests"""
+LATENCY_WINDOW = 1000
+"""Number of most recent finished jobs in job latency statistics"""
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the job queue is full"""
+
+
+@attr.s
+class ServiceState:
+    """State loaded once and shared by all jobs
+
+    Parameters
+    ----------
+    hmm_db
+        Path to HMM DB
+    classifier_table
+        Compiled Naive Bayes classifier table
+    protein_name_to_desc
+        HMM names and descriptions
+    tool_versions
+        Prodigal and hmmsearch versions
+    hit_cache
+        Path to the domain hit cache SQLite database if any
+    hit_cache_key
+        hmmsearch search key of the HMM DB in the domain hit cache
+    """
+    hmm_db: Path = attr.ib(converter=Path)
+    classifier_table: CompiledClassifierTable = attr.ib(repr=False)
+    protein_name_to_desc: Dict[str, Optional[str]] = attr.ib(repr=False)
+    tool_versions: Dict[str, Optional[str]] = attr.ib(factory=dict)
+    hit_cache: Optional[Path] = attr.ib(default=None)
+    hit_cache_key: Optional[str] = attr.ib(default=None)
+
+    @classmethod
+    def load(cls,
+             hmm_db: Union[str, Path],
+             classifier_table_path: Union[str, Path],
+             hit_cache: Optional[Union[str, Path]] = None) -> 'ServiceState':
+        logger.info(f'Loading Naive Bayes classifier table "{classifier_table_path}"')
+        classifier_table = load_classifier_table(classifier_table_path)
+        logger.info(f'Loading HMM names and descriptions from "{hmm_db}"')
+        protein_name_to_desc = load_hmm_names_to_desc(hmm_db)
+        return cls(hmm_db=hmm_db,
+                   classifier_table=classifier_table,
+                   protein_name_to_desc=protein_name_to_desc,
+                   tool_versions=dict(prodigal=prodigal_version(), hmmsearch=hmmsearch_version()),
+                   hit_cache=Path(hit_cache) if hit_cache else None,
+                   hit_cache_key=search_key(hmm_db) if hit_cache else None)
+
+
+@attr.s
+class Job:
+    """Classification job of the contigs in a FASTA file"""
+    id: str = attr.ib()
+    fasta: Path = attr.ib(converter=Path)
+    outdir: Optional[Path] = attr.ib(default=None, converter=attr.converters.optional(Path))
+    prefix: Optional[str] = attr.ib(default=None)
+    uncertainty_threshold: float = attr.ib(default=DEFAULT_UNCERTAINTY_THRESHOLD, converter=float)
+    output_plasmids_separately: bool = attr.ib(default=False, converter=bool)
+    status: str = attr.ib(default='queued')
+    submitted: float = attr.ib(factory=time.time)
+    started: Optional[float] = attr.ib(default=None)
+    finished: Optional[float] = attr.ib(default=None)
+    error: Optional[str] = attr.ib(default=None)
+    result: Optional[Dict[str, Any]] = attr.ib(default=None, repr=False)
+
+    @classmethod
+    def from_request(cls, job_id: str, request: Dict[str, Any]) -> 'Job':
+        """Job from a JSON job submission
+
+        Raises
+        ------
+        ValueError
+            If the request has no FASTA file path, unknown fields or the FASTA file does not exist.
+        """
+        if not isinstance(request, dict) or 'fasta' not in request:
+            raise ValueError('Job request must be a JSON object with a "fasta" path')
+        fields = {'fasta', 'outdir', 'prefix', 'uncertainty_threshold', 'output_plasmids_separately'}
+        unknown = set(request) - fields
+        if unknown:
+            raise ValueError(f'Unknown job request fields: {", ".join(sorted(unknown))}')
+        if not Path(request['fasta']).is_file():
+            raise ValueError(f'FASTA file "{request["fasta"]}" does not exist')
+        return cls(id=job_id, **request)
+
+    @property
+    def queue_seconds(self) -> Optional[float]:
+        return None if self.started is None else self.started - self.submitted
+
+    @property
+    def run_seconds(self) -> Optional[float]:
+        return None if self.finished is None or self.started is None else self.finished - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(id=self.id,
+                    fasta=str(self.fasta),
+                    outdir=str(self.outdir) if self.outdir else None,
+                    status=self.status,
+                    queue_seconds=self.queue_seconds,
+                    run_seconds=self.run_seconds,
+                    error=self.error,
+                    result=self.result)
+
+
+def run_job(state: ServiceState,
+            job: Job,
+            threads: int = 1,
+            circularity: CircularityPolicy = CircularityPolicy()) -> Dict[str, Any]:
+    """Classify the contigs of a job returning the classification and top protein domains of each contig
+
+    The results CSV and classified contig FASTA files are written to the job output directory if it has one.
+    """
+    contigs = parse_contigs(job.fasta,
+                            min_length=circularity.min_length,
+                            kmax=circularity.kmax,
+                            kmin=circularity.kmin,
+                            max_length=circularity.max_length)
+    with tempfile.TemporaryDirectory(prefix=f'viral_verify-job-{job.id}-') as tmpdir:
+        tmp = Path(tmpdir)
+        write_circular_contigs_fasta(contigs, tmp / 'circularized.fasta')
+        prodigal_meta(input_fasta=tmp / 'circularized.fasta',
+                      genes_fasta=tmp / 'genes.fa',
+                      proteins_fasta=tmp / 'proteins.fa',
+                      threads=threads)
+        filter_predicted_genes(tmp / 'proteins.fa', tmp / 'proteins-circularized.fa', contigs)
+        hit_cache = DomainHitCache(state.hit_cache, state.hit_cache_key) if state.hit_cache else None
+        try:
+            summary = run_hmmsearch_unique(hmm_db=state.hmm_db,
+                                           input_fasta=tmp / 'proteins-circularized.fa',
+                                           raw_output=None,
+                                           tblout=tmp / 'hmmsearch.domtblout',
+                                           threads=threads,
+                                           hit_cache=hit_cache)
+        finally:
+            if hit_cache is not None:
+                hit_cache.close()
+        contig_domains, _ = top_hmm_results(tmp / 'hmmsearch.domtblout')
+    classifications = classify_contig_domains(contig_domains=contig_domains,
+                                              classifier_table=state.classifier_table,
+                                              uncertainty_threshold=job.uncertainty_threshold)
+    if job.outdir:
+        prefix = job.prefix or Path(uncompressed_name(job.fasta)).stem
+        job.outdir.mkdir(parents=True, exist_ok=True)
+        output_results_table(results_csv_path=job.outdir / f'{prefix}-results.csv',
+                             contigs=contigs,
+                             contig_domains=contig_domains,
+                             contig_classifications=classifications,
+                             protein_name_to_desc=state.protein_name_to_desc)
+        output_classified_contigs(contig_classifications=classifications,
+                                  contigs=contigs,
+                                  outdir=job.outdir,
+                                  output_plasmids_separately=job.output_plasmids_separately,
+                                  prefix=prefix)
+    return dict(n_contigs=len(contigs),
+                n_proteins=summary.n_proteins,
+                classifications=[attr.asdict(classifications[name]) if name in classifications
+                                 else dict(contig_name=name, classification='Unclassified')
+                                 for name in contigs],
+                contig_domains=contig_domains)
+
+
+def _latency_stats(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return dict(mean=None, p50=None, p95=None, max=None)
+    values = sorted(values)
+    return dict(mean=statistics.mean(values),
+                p50=values[(len(values) - 1) // 2],
+                p95=values[int(0.95 * (len(values) - 1))],
+                max=values[-1])
+
+
+@attr.s
+class JobQueue:
+    """Bounded pool of worker threads running classification jobs
+
+    Parameters
+    ----------
+    state
+        State shared by all jobs
+    workers
+        Number of jobs run at the same time
+    threads
+        Number of threads for Prodigal and hmmsearch per job
+    max_queue
+        Maximum number of queued jobs waiting for a worker
+    circularity
+        Which contigs to check for circularity
+    """
+    state: ServiceState = attr.ib()
+    workers: int = attr.ib(default=1)
+    threads: int = attr.ib(default=1)
+    max_queue: int = attr.ib(default=100)
+    circularity: CircularityPolicy = attr.ib(factory=CircularityPolicy)
+    _executor: ThreadPoolExecutor = attr.ib(init=False, repr=False)
+    _jobs: 'collections.OrderedDict[str, Job]' = attr.ib(init=False, repr=False, factory=collections.OrderedDict)
+    _lock: threading.Lock = attr.ib(init=False, repr=False, factory=threading.Lock)
+    _ids: Any = attr.ib(init=False, repr=False, factory=lambda: itertools.count(1))
+    _counts: Dict[str, int] = attr.ib(init=False, repr=False, factory=lambda: dict(done=0, failed=0))
+    _queue_seconds: 'collections.deque[float]' = attr.ib(
+        init=False, repr=False, factory=lambda: collections.deque(maxlen=LATENCY_WINDOW))
+    _run_seconds: 'collections.deque[float]' = attr.ib(
+        init=False, repr=False, factory=lambda: collections.deque(maxlen=LATENCY_WINDOW))
+
+    def __attrs_post_init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='viral_verify-job')
+
+    def _n_status(self, status: str) -> int:
+        return sum(1 for x in self._jobs.values() if x.status == status)
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """Queue a job from a JSON job submission
+
+        Raises
+        ------
+        ValueError
+            If the job request is invalid
+        JobQueueFull
+            If `max_queue` jobs are already waiting for a worker
+        """
+        with self._lock:
+            if self._n_status('queued') >= self.max_queue:
+                raise JobQueueFull(f'Job queue is full ({self.max_queue} queued jobs)')
+            job = Job.from_request(str(next(self._ids)), request)
+            self._jobs[job.id] = job
+            self._evict_finished()
+        self._executor.submit(self._run, job)
+        logger.info(f'Queued job {job.id} for "{job.fasta}"')
+        return job
+
+    def _evict_finished(self) -> None:
+        finished = [k for k, v in self._jobs.items() if v.status in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            job.status = 'running'
+            job.started = time.time()
+        try:
+            result = run_job(self.state, job, threads=self.threads, circularity=self.circularity)
+        except Exception as ex:
+            logger.exception(f'Job {job.id} failed')
+            with self._lock:
+                job.error = f'{type(ex).__name__}: {ex}'
+                job.status = 'failed'
+                job.finished = time.time()
+                self._counts['failed'] += 1
+        else:
+            with self._lock:
+                job.result = result
+                job.status = 'done'
+                job.finished = time.time()
+                self._counts['done'] += 1
+            logger.info(f'Job {job.id} classified {result["n_contigs"]} contigs in {job.run_seconds:.2f}s '
+                        f'(queued for {job.queue_seconds:.2f}s)')
+        with self._lock:
+            self._queue_seconds.append(job.queue_seconds)
+            self._run_seconds.append(job.run_seconds)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, job counts and latency statistics of recently finished jobs"""
+        with self._lock:
+            return dict(queue_depth=self._n_status('queued'),
+                        running=self._n_status('running'),
+                        completed=self._counts['done'],
+                        failed=self._counts['failed'],
+                        workers=self.workers,
+                        max_queue=self.max_queue,
+                        queue_seconds=_latency_stats(list(self._queue_seconds)),
+                        run_seconds=_latency_stats(list(self._run_seconds)),
+                        tool_versions=self.state.tool_versions)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'viral_verify'
+
+    @property
+    def job_queue(self) -> JobQueue:
+        return self.server.job_queue
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else str(self.client_address)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f'{self.address_string()} {format % args}')
+
+    def _send_json(self, status: int, obj: Any) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, dict(status='ok'))
+        elif self.path == '/metrics':
+            self._send_json(200, self.job_queue.metrics())
+        elif self.path.startswith('/jobs/'):
+            job = self.job_queue.get(self.path[len('/jobs/'):])
+            if job is None:
+                self._send_json(404, dict(error='No such job'))
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, dict(error=f'Unknown path "{self.path}"'))
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._send_json(404, dict(error=f'Unknown path "{self.path}"'))
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+            job = self.job_queue.submit(request)
+        except (ValueError, TypeError) as ex:
+            self._send_json(400, dict(error=str(ex)))
+        except JobQueueFull as ex:
+            self._send_json(503, dict(error=str(ex)))
+        else:
+            self._send_json(202, job.to_dict())
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server listening on a TCP port handling each request in a thread"""
+    daemon_threads = True
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server listening on a Unix socket"""
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def make_server(job_queue: JobQueue,
+                socket_path: Optional[Union[str, Path]] = None,
+                host: str = '127.0.0.1',
+                port: int = 0) -> socketserver.BaseServer:
+    """HTTP server of the JSON API on a Unix socket if `socket_path` is given, otherwise on a TCP `host` and `port`
+
+    An existing Unix socket file is replaced.
+    """
+    if socket_path:
+        socket_path = Path(socket_path)
+        if socket_path.is_socket():
+            socket_path.unlink()
+        server: socketserver.BaseServer = UnixHTTPServer(str(socket_path), _RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.job_queue = job_queue
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+@attr.s
+class ServiceClient:
+    """Client of the classification service JSON API on a Unix socket or TCP host and port"""
+    socket_path: Optional[str] = attr.ib(default=None, converter=attr.converters.optional(str))
+    host: str = attr.ib(default='127.0.0.1')
+    port: int = attr.ib(default=8765)
+    timeout: float = attr.ib(default=60.0)
+
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, Any]:
+        if self.socket_path:
+            conn: http.client.HTTPConnection = _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            data = json.dumps(body).encode() if body is not None else None
+            conn.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
+    def _checked(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Any:
+        status, obj = self._request(method, path, body)
+        if status >= 400:
+            raise RuntimeError(f'{method} {path} failed with status {status}: {obj.get("error")}')
+        return obj
+
+    def health(self) -> Dict[str, Any]:
+        return self._checked('GET', '/health')
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._checked('GET', '/metrics')
+
+    def submit(self, fasta: Union[str, Path], **kwargs) -> Dict[str, Any]:
+        """Submit a job for a contigs FASTA file with optional `outdir`, `prefix` and classification options"""
+        request = dict(fasta=str(fasta), **{k: str(v) if isinstance(v, Path) else v for k, v in kwargs.items()})
+        return self._checked('POST', '/jobs', request)
+
+    def job(self, job_id: str) -> Dict[str, Any]:
+        return self._checked('GET', f'/jobs/{job_id}')
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.1) -> Dict[str, Any]:
+        """Wait for a job to finish returning its status
+
+        Raises
+        ------
+        TimeoutError
+            If the job did not finish within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f'Job {job_id} did not finish within {timeout}s')
+            time.sleep(poll_interval)
@@ -0,0 +1,92 @@
+"""Splitting of FASTA files into size-balanced shards for running external tools in parallel"""
+import heapq
+from pathlib import Path
+from typing import List, Tuple, Union, NamedTuple
+
+from viral_verify.fasta import SEQUENCE_WHITESPACE, FastaBuffer, fasta_buffer, record_offsets
+
+
+class FastaRecordSpan(NamedTuple):
+    """Byte span of a FASTA record (header and sequence lines) within a file"""
+    start: int
+    end: int
+    seq_len: int
+
+
+class FastaShard(NamedTuple):
+    """FASTA shard written to disk
+
+    `indices` are the indices of the records in the original FASTA file in the order they were written to the shard.
+    """
+    path: Path
+    indices: List[int]
+    total_length: int
+
+
+def fasta_record_spans(fasta_path: Union[str, Path]) -> List[FastaRecordSpan]:
+    """Get the byte spans and sequence lengths of all records in a FASTA file"""
+    return _record_spans(fasta_buffer(fasta_path))
+
+
+def _record_spans(buf: FastaBuffer) -> List[FastaRecordSpan]:
+    return [FastaRecordSpan(start, end, len(buf[seq_start:end].translate(None, SEQUENCE_WHITESPACE)))
+            for start, seq_start, end in record_offsets(buf)]
+
+
+def balanced_shards(sizes: List[int], n_shards: int) -> List[List[int]]:
+    """Partition items into `n_shards` groups with similar total size
+
+    Longest-processing-time-first greedy partitioning: items are assigned largest first to the shard with the
+    smallest total size so far. Shards are returned largest total size first with indices sorted within each shard.
+    Empty shards are dropped.
+
+    Examples
+    --------
+    >>> balanced_shards([5, 1, 3, 8, 2], 2)
+    [[3, 4], [0, 1, 2]]
+    """
+    n_shards = max(1, min(n_shards, len(sizes)))
+    heap = [(0, i) for i in range(n_shards)]
+    shards: List[List[int]] = [[] for _ in range(n_shards)]
+    totals = [0] * n_shards
+    for idx in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        total, shard_idx = heapq.heappop(heap)
+        shards[shard_idx].append(idx)
+        totals[shard_idx] = total + sizes[idx]
+        heapq.heappush(heap, (totals[shard_idx], shard_idx))
+    order = sorted(range(n_shards), key=lambda i: totals[i], reverse=True)
+    return [sorted(shards[i]) for i in order if shards[i]]
+
+
+def write_fasta_shards(fasta_path: Union[str, Path],
+                       outdir: Union[str, Path],
+                       n_shards: int,
+                       prefix: str = 'shard') -> List[FastaShard]:
+    """Split a FASTA file into at most `n_shards` FASTA files balanced by total sequence length
+
+    Records keep their relative input order within each shard. Shards are returned largest first so that the biggest
+    jobs can be started first.
+    """
+    buf = fasta_buffer(fasta_path)
+    spans = _record_spans(buf)
+    outdir = Path(outdir)
+    shards: List[FastaShard] = []
+    for i, indices in enumerate(balanced_shards([s.seq_len for s in spans], n_shards)):
+        shard_path = outdir / f'{prefix}-{i}.fasta'
+        with open(shard_path, 'wb') as fout:
+            for idx in indices:
+                span = spans[idx]
+                fout.write(buf[span.start:span.end])
+        shards.append(FastaShard(path=shard_path,
+                                 indices=indices,
+                                 total_length=sum(spans[idx].seq_len for idx in indices)))
+    return shards
+
+
+def shard_index_map(shards: List[FastaShard]) -> List[Tuple[int, int]]:
+    """Map each original record index to its (shard index, index within shard)"""
+    out = [(-1, -1)] * sum(len(s.indices) for s in shards)
+    for shard_idx, shard in enumerate(shards):
+        for local_idx, idx in enumerate(shard.indices):
+            out[idx] = (shard_idx, local_idx)
+    return out